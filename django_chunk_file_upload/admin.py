@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
 
+from .app_settings import app_settings
+from .constants import TypeChoices
 from .forms import ChunkedUploadFileAdminForm
 from .models import FileManager
+from .optimize import ImageOptimizer, thumbnail_cache
 
 
 @admin.register(FileManager)
@@ -11,17 +21,76 @@ class FileManagerModelAdmin(admin.ModelAdmin):
     form = ChunkedUploadFileAdminForm
     list_display = (
         "id",
-        "name",
+        "thumbnail",
+        "display_name",
+        "user",
         "status",
         "created_at",
         "updated_at",
     )
+    list_select_related = ("user",)
+    show_full_result_count = False  # Skip the second COUNT(*) of filtered lists.
+    thumbnail_size = (64, 64)
+    delete_workers = 8
 
     add_form_template = "django_chunk_file_upload/admin/add_form.html"
     change_form_template = "django_chunk_file_upload/admin/change_form.html"
 
+    def render_change_form(self, request, context, *args, **kwargs):
+        context["bundle_max_file_size"] = app_settings.bundle_max_file_size
+        return super().render_change_form(request, context, *args, **kwargs)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match and match.url_name and match.url_name.endswith("_changelist"):
+            # The list reads the name column, not the metadata blob.
+            queryset = queryset.defer("metadata").annotate(
+                stored_checksum=self.model.content_checksum_expression()
+            )
+        return queryset
+
+    @admin.display(description=_("Name"), ordering="filename")
+    def display_name(self, obj) -> str:
+        return obj.name
+
+    @admin.display(description=_("Preview"))
+    def thumbnail(self, obj) -> str:
+        """Thumbnail of an image, nothing is decoded while the list renders.
+
+        A cached thumbnail is linked through ``MEDIA_URL``, otherwise the
+        thumbnail view creates it on the browser request (``thumbnail_size``
+        must be one of the ``thumbnail.sizes``).
+        """
+
+        if obj.type != TypeChoices.IMAGE or not obj.file or not obj.eof:
+            return ""
+
+        cached = thumbnail_cache.get(
+            ImageOptimizer.get_thumbnail_key(obj.content_checksum, *self.thumbnail_size)
+        )
+        if cached and cached["path"]:
+            url = settings.MEDIA_URL + os.path.relpath(
+                cached["path"], settings.MEDIA_ROOT
+            ).replace(os.sep, "/")
+        else:
+            url = "%s?size=%sx%s" % (
+                reverse(
+                    "django_chunk_file_upload:thumbnails",
+                    kwargs={"checksum": obj.checksum},
+                ),
+                *self.thumbnail_size,
+            )
+        return format_html(
+            '<img src="{}" style="max-width: {}px; max-height: {}px" loading="lazy" alt="">',
+            url,
+            *self.thumbnail_size,
+        )
+
     def delete_queryset(self, request, queryset):
-        for obj in queryset:
-            obj.file.delete(save=False)
+        storage = queryset.model._meta.get_field("file").storage
+        names = set(queryset.values_list("file", flat=True)) - {""}
+        with ThreadPoolExecutor(max_workers=self.delete_workers) as executor:
+            list(executor.map(storage.delete, names))
 
         queryset.delete()
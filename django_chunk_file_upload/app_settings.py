@@ -30,6 +30,69 @@ class _ImageSettings(_Settings):
     max_height: int = 720
     to_webp: bool = True
     remove_origin: bool = True
+    skip_max_size: int = 1024 * 256  # Keep optimal images up to this size as is.
+    min_saving: float = 0.05  # Keep the original unless re-encoding saves 5%.
+    quality_mode: str = "fixed"  # fixed (quality), size or similarity search.
+    target_size: int = 1024 * 150  # Byte budget of the size mode.
+    target_similarity: float = 0.95  # Min SSIM of the similarity mode.
+    min_quality: int = 40  # Quality range of the search.
+    max_quality: int = 95
+    proxy_size: int = 512  # Max width/height of the proxy of the trial encodes.
+    png_strategy: str = "adaptive"  # adaptive or palette (always quantize PNGs).
+    png_max_colors: int = 256  # Max colors of a palette.
+    png_sample_size: int = 256  # Max width/height of the sample of the strategy.
+    max_pixels: int = 100_000_000  # Reject larger images from their header.
+    max_memory: int = 1024 * 1024 * 256  # Max raw size of a decoded image.
+
+
+@dataclass(kw_only=True)
+class _ProfilerSettings(_Settings):
+    sample_rate: float = 0  # e.g. 0.001 profiles 1 in 1000 requests.
+    output_dir: str = None  # default: <tempdir>/django_chunk_file_upload/profiles
+    max_files: int = 1000
+
+
+@dataclass(kw_only=True)
+class _LoggingSettings(_Settings):
+    chunks: str = "all"  # all, boundary (first/last chunk), sampled or none.
+    sample_rate: float = 0.01  # Fraction of uploads logged in sampled mode.
+    queue: bool = False  # Hand records to a QueueHandler.
+
+
+@dataclass(kw_only=True)
+class _DownloadSettings(_Settings):
+    x_accel_redirect: str = None  # Nginx internal location prefix, e.g. "/protected/"
+    x_sendfile: bool = False  # Apache/Lighttpd X-Sendfile header.
+    as_attachment: bool = False
+
+
+@dataclass(kw_only=True)
+class _DedupSettings(_Settings):
+    enabled: bool = False
+    min_file_size: int = 1024 * 1024 * 8  # Deduplicate files from 8MB.
+    min_size: int = 1024 * 16  # Content-defined block sizes.
+    avg_size: int = 1024 * 64
+    max_size: int = 1024 * 256
+    blocks_dir: str = "blocks"  # Relative to MEDIA_ROOT.
+
+
+@dataclass(kw_only=True)
+class _CompressionSettings(_Settings):
+    encodings: tuple | list = ("gzip", "deflate", "br")  # br requires brotli.
+    max_ratio: int = 100  # Max decoded/encoded size ratio of a chunk.
+
+
+@dataclass(kw_only=True)
+class _CacheSettings(_Settings):
+    max_size: int = 1024 * 1024 * 1024  # 1GB, 0 disables the cache.
+    cache_dir: str = "cache"  # Relative to MEDIA_ROOT.
+
+
+@dataclass(kw_only=True)
+class _ThumbnailSettings(_Settings):
+    sizes: tuple | list = ("64x64", "160x160", "320x320", "640x640")  # Allowed WxH.
+    quality: int = 80
+    to_webp: bool = True
 
 
 @dataclass(kw_only=True)
@@ -48,6 +111,8 @@ class _LazySettings(_Settings):
     )
     upload_to: str = "%Y/%m/%d"
     chunk_size: int = 1024 * 1024 * 2  # 2MB
+    bundle_max_file_size: int = 1024 * 1024  # 1MB, 0 disables bundled uploads.
+    bundle_max_files: int = 100
     is_metadata_storage: bool = False
     remove_file_on_update: bool = True
     status: StatusChoices = StatusChoices.PENDING
@@ -56,6 +121,16 @@ class _LazySettings(_Settings):
     )
     optimize: bool = True
     image_optimizer: _ImageSettings = field(default_factory=_ImageSettings)
+    profiler: _ProfilerSettings = field(default_factory=_ProfilerSettings)
+    logging: _LoggingSettings = field(default_factory=_LoggingSettings)
+    download: _DownloadSettings = field(default_factory=_DownloadSettings)
+    sniff_content: bool = True  # Check the magic bytes of the first chunk.
+    validate_content: bool = True  # Validate CSV/JSON/XML while chunks stream in.
+    extract_media: bool = True  # Read duration/codec/dimensions of audio and video.
+    dedup: _DedupSettings = field(default_factory=_DedupSettings)
+    compression: _CompressionSettings = field(default_factory=_CompressionSettings)
+    cache: _CacheSettings = field(default_factory=_CacheSettings)
+    thumbnail: _ThumbnailSettings = field(default_factory=_ThumbnailSettings)
 
     @classmethod
     def from_kwargs(cls, **kwargs) -> "_LazySettings":
@@ -68,6 +143,34 @@ class _LazySettings(_Settings):
         if image_optimizer and isinstance(image_optimizer, dict):
             kwargs["image_optimizer"] = _ImageSettings.from_kwargs(**image_optimizer)
 
+        profiler = kwargs.pop("profiler", {}) or {}
+        if profiler and isinstance(profiler, dict):
+            kwargs["profiler"] = _ProfilerSettings.from_kwargs(**profiler)
+
+        logging = kwargs.pop("logging", {}) or {}
+        if logging and isinstance(logging, dict):
+            kwargs["logging"] = _LoggingSettings.from_kwargs(**logging)
+
+        download = kwargs.pop("download", {}) or {}
+        if download and isinstance(download, dict):
+            kwargs["download"] = _DownloadSettings.from_kwargs(**download)
+
+        dedup = kwargs.pop("dedup", {}) or {}
+        if dedup and isinstance(dedup, dict):
+            kwargs["dedup"] = _DedupSettings.from_kwargs(**dedup)
+
+        compression = kwargs.pop("compression", {}) or {}
+        if compression and isinstance(compression, dict):
+            kwargs["compression"] = _CompressionSettings.from_kwargs(**compression)
+
+        cache = kwargs.pop("cache", {}) or {}
+        if cache and isinstance(cache, dict):
+            kwargs["cache"] = _CacheSettings.from_kwargs(**cache)
+
+        thumbnail = kwargs.pop("thumbnail", {}) or {}
+        if thumbnail and isinstance(thumbnail, dict):
+            kwargs["thumbnail"] = _ThumbnailSettings.from_kwargs(**thumbnail)
+
         permission_classes = kwargs.pop("permission_classes", None)
         if permission_classes and isinstance(
             permission_classes, (tuple, list, set, str)
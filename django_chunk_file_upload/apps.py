@@ -6,3 +6,10 @@ class DjangoChunkFileUploadConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "django_chunk_file_upload"
     verbose_name = _("Django Files")
+
+    def ready(self):
+        from .app_settings import app_settings
+        from .utils import setup_queue_logging
+
+        if app_settings.logging.queue:
+            setup_queue_logging()
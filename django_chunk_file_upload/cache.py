@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .utils import create_dir, get_logger, safe_remove_file
+
+
+try:
+    import fcntl
+except ImportError:  # Windows, single flight within the process only.
+    fcntl = None
+
+LOGGER = get_logger(__name__)
+
+
+class FileCache:
+    """Size-bounded LRU cache of derived files on disk
+
+    An entry is a JSON sidecar (``<key>.json``) with the metadata of the
+    output, and the output file itself (``<key><ext>``) when there is one.
+    Entries are stored under ``<MEDIA_ROOT>/<cache_dir>/<namespace>``; hits
+    refresh their mtime and the least recently used entries are evicted
+    once the cache outgrows ``max_size``. Keys hash every input of the
+    output, so a settings change simply misses and the stale entries age
+    out.
+    """
+
+    version = 1  # Bump to invalidate every entry.
+
+    def __init__(self, namespace: str, max_size: int, cache_dir: str = "cache"):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._size = None  # Estimated, rescanned on eviction.
+        self._lock = threading.Lock()
+        self._locks = {}  # Key: [lock, waiters], for single flight.
+
+    @classmethod
+    def from_settings(cls, namespace: str, settings) -> "FileCache":
+        return cls(namespace, max_size=settings.max_size, cache_dir=settings.cache_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @property
+    def root(self) -> str:
+        media_root = str(settings.MEDIA_ROOT) if settings.MEDIA_ROOT else ""
+        return os.path.join(media_root, self.cache_dir, self.namespace)
+
+    def get_key(self, *parts) -> str:
+        data = json.dumps([self.version, *parts], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get_path(self, key: str, extension: str = "") -> str:
+        return os.path.join(self.root, key[:2], key + extension)
+
+    def get(self, key: str) -> None | dict:
+        """Metadata of an entry, with the ``path`` of its output, None on miss."""
+
+        if not self.enabled:
+            return None
+
+        meta_fp = self.get_path(key, ".json")
+        try:
+            with open(meta_fp, "r") as f:
+                meta = json.load(f)
+            path = None
+            if meta.get("extension") is not None:
+                path = self.get_path(key, meta["extension"])
+                os.utime(path)
+            os.utime(meta_fp)
+        except (OSError, ValueError):
+            return None
+
+        meta["path"] = path
+        return meta
+
+    def put(
+        self, key: str, meta: dict, data: bytes = None, extension: str = ""
+    ) -> None:
+        """Store an entry, its output is written only when data is given."""
+
+        if not self.enabled:
+            return
+
+        meta = dict(meta, extension=extension if data is not None else None)
+        meta_fp = self.get_path(key, ".json")
+        create_dir(os.path.dirname(meta_fp))
+        size = 0
+        try:
+            if data is not None:
+                size += self._write(self.get_path(key, extension), data)
+            size += self._write(meta_fp, json.dumps(meta).encode())
+        except OSError as e:
+            LOGGER.warning("Cannot write cache entry: %s, %s", key, e)
+            return
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            if self._size is None or self._size > self.max_size:
+                self.evict()
+
+    @contextmanager
+    def lock(self, key: str):
+        """Hold the lock of a key, between threads and processes."""
+
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+
+                lock_fp = self.get_path(key, ".lock")
+                create_dir(os.path.dirname(lock_fp))
+                with open(lock_fp, "a") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def get_or_create(self, key: str, create) -> None | dict:
+        """Metadata of an entry, created on a miss.
+
+        Concurrent misses of a key are single flight: the first one creates
+        the entry while the others wait for it and read it.
+
+        Args:
+          key: Entry key.
+          create: Callable returning the Tuple: metadata, data, extension, or
+            None when there is nothing to cache.
+
+        Returns:
+          The metadata with the ``path`` of the output, or with its ``data``
+          when the cache is disabled. None if create returned None.
+        """
+
+        entry = self.get(key)
+        if entry:
+            return entry
+
+        if not self.enabled:
+            created = create()
+            return created and dict(created[0], path=None, data=created[1])
+
+        with self.lock(key):
+            entry = self.get(key)
+            if entry:
+                return entry
+
+            created = create()
+            if created is None:
+                return None
+
+            meta, data, extension = created
+            self.put(key, meta, data, extension)
+            return self.get(key) or dict(meta, path=None, data=data)
+
+    def _write(self, fp: str, data: bytes) -> int:
+        tmp = "%s.%s.%s.tmp" % (fp, os.getpid(), threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, fp)
+        return len(data)
+
+    def copy(self, src: str, dst: str) -> None:
+        """Place a cached output at dst, hardlinked when possible.
+
+        Raises:
+          OSError: src was evicted in the meantime.
+        """
+
+        create_dir(os.path.dirname(dst))
+        if os.path.exists(dst):
+            safe_remove_file(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def evict(self) -> int:
+        """Delete the least recently used files down to 90% of max_size.
+
+        Returns:
+          The number of removed files.
+        """
+
+        entries, total = [], 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                fp = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(fp)
+                except OSError:
+                    continue
+                if (
+                    filename.endswith((".tmp", ".lock"))
+                    and stat.st_mtime > time.time() - 3600
+                ):
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, fp))
+                total += stat.st_size
+
+        removed, target = 0, self.max_size * 0.9
+        for _, size, fp in sorted(entries):
+            if total <= target:
+                break
+            safe_remove_file(fp)
+            total -= size
+            removed += 1
+        self._size = total
+        if removed:
+            LOGGER.info("Evicted %s cache files: %s", removed, self.root)
+        return removed
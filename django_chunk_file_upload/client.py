@@ -0,0 +1,328 @@
+"""Python client for the chunk upload protocol.
+
+Upload files from another service with the same ``X-File-*`` headers as
+``upload.chunk.js`` (see ``BaseFile.from_request``). The chunks are sent by
+a bounded thread pool over keep-alive connections, an interrupted upload
+resumes from the offset reported by the register endpoint, and failed
+requests are retried with exponential backoff.
+
+Only the standard library is used, so the client runs without Django::
+
+    python -m django_chunk_file_upload.client https://example.com/file-manager/uploads/ a.csv b.mp4
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin, urlsplit
+
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class UploadError(Exception):
+    """The server rejected the upload."""
+
+    def __init__(self, message: str, status: int = None, data: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.data = data or {}
+
+
+def get_checksum(fp: str, buffer_size: int = 1024 * 1024) -> tuple[str, int]:
+    """Stream the file through MD5.
+
+    Returns:
+      The Tuple: MD5 checksum, size.
+    """
+
+    md5hash, size = hashlib.md5(), 0
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(fp, "rb", buffering=0) as f:
+        while n := f.readinto(buf):
+            md5hash.update(view[:n])
+            size += n
+    return md5hash.hexdigest(), size
+
+
+class ChunkUploadClient:
+    """Chunk upload client
+
+    Args:
+      url: URL of ``ChunkedUploadView``, e.g. ``https://example.com/file-manager/uploads/``.
+      chunk_size: Bytes per chunk request.
+      workers: Chunks uploaded in parallel.
+      retries: Retries per request on connection errors and 429/5xx responses.
+      backoff: First retry delay in seconds, doubled on every retry.
+      timeout: Socket timeout in seconds.
+      headers: Extra request headers, e.g. ``Authorization`` or ``Cookie``.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        chunk_size: int = 1024 * 1024 * 2,
+        workers: int = 4,
+        retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 60,
+        headers: dict = None,
+    ):
+        self.url = url if url.endswith("/") else url + "/"
+        self.register_url = urljoin(self.url, "register/")
+        self.chunk_size = chunk_size
+        self.workers = max(workers, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.cookies = SimpleCookie(self.headers.pop("Cookie", ""))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._csrf_checked = False
+
+    def get_connection(self, url: str) -> HTTPConnection:
+        """Keep-alive connection of the current thread."""
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        if key not in connections:
+            connection_class = (
+                HTTPSConnection if parts.scheme == "https" else HTTPConnection
+            )
+            connections[key] = connection_class(parts.netloc, timeout=self.timeout)
+        return connections[key]
+
+    def close(self):
+        for connection in getattr(self._local, "connections", {}).values():
+            connection.close()
+        self._local.connections = {}
+
+    def get_headers(self, headers: dict = None) -> dict:
+        ret = dict(self.headers)
+        ret.update(headers or {})
+        with self._lock:
+            cookies = "; ".join("%s=%s" % (k, v.value) for k, v in self.cookies.items())
+            if "csrftoken" in self.cookies:
+                ret.setdefault("X-CSRFToken", self.cookies["csrftoken"].value)
+        if cookies:
+            ret["Cookie"] = cookies
+        ret.setdefault("Referer", self.url)
+        return ret
+
+    def request(
+        self, method: str, url: str, body: bytes = None, headers: dict = None
+    ) -> tuple[int, bytes]:
+        """Send a request, retry with backoff on connection errors and 429/5xx.
+
+        Returns:
+          The Tuple: status, body.
+        """
+
+        path = urlsplit(url).path or "/"
+        if urlsplit(url).query:
+            path += "?" + urlsplit(url).query
+
+        attempt = 0
+        while True:
+            connection = self.get_connection(url)
+            try:
+                connection.request(
+                    method, path, body=body, headers=self.get_headers(headers)
+                )
+                response = connection.getresponse()
+                data = response.read()
+                self.set_cookies(response.headers.get_all("Set-Cookie") or [])
+                if response.status not in RETRY_STATUS:
+                    return response.status, data
+                error = UploadError("HTTP %s" % response.status, status=response.status)
+            except (OSError, HTTPException) as e:
+                connection.close()
+                error = e
+
+            if attempt >= self.retries:
+                raise error
+            time.sleep(self.backoff * 2**attempt * (1 + random.random() / 2))
+            attempt += 1
+
+    def set_cookies(self, headers: list):
+        with self._lock:
+            for header in headers:
+                self.cookies.load(header)
+
+    def ensure_csrf(self):
+        """Fetch the CSRF cookie of the upload page once."""
+
+        if self._csrf_checked or "csrftoken" in self.cookies:
+            return
+        self._csrf_checked = True
+        self.request("GET", self.url)
+
+    def get_json(self, status: int, data: bytes) -> dict:
+        try:
+            ret = json.loads(data or b"{}")
+        except ValueError:
+            ret = {}
+        if status >= 400:
+            raise UploadError(
+                ret.get("message") or "HTTP %s" % status, status=status, data=ret
+            )
+        return ret
+
+    def register(self, files: list[dict]) -> list[dict]:
+        """Register files, return their status and resume offset."""
+
+        self.ensure_csrf()
+        status, data = self.request(
+            "POST",
+            self.register_url,
+            body=json.dumps({"files": files}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        return self.get_json(status, data)["files"]
+
+    def upload_chunk(self, fp: str, meta: dict, offset: int, eof: bool) -> dict:
+        """Upload the chunk of ``fp`` starting at ``offset``."""
+
+        with open(fp, "rb") as f:
+            f.seek(offset)
+            chunk = f.read(self.chunk_size)
+
+        boundary = uuid.uuid4().hex
+        body = b"".join(
+            [
+                b"--%s\r\n" % boundary.encode(),
+                b'Content-Disposition: form-data; name="file"; filename="%s"\r\n'
+                % json.dumps(meta["name"])[1:-1].encode(),
+                b"Content-Type: application/octet-stream\r\n\r\n",
+                chunk,
+                b"\r\n--%s--\r\n" % boundary.encode(),
+            ]
+        )
+        status, data = self.request(
+            "POST",
+            self.url,
+            body=body,
+            headers={
+                "Content-Type": "multipart/form-data; boundary=%s" % boundary,
+                "X-File-Name": meta["name"],
+                "X-File-Checksum": meta["checksum"],
+                "X-File-Chunk-From": str(offset),
+                "X-File-Chunk-Size": str(self.chunk_size),
+                "X-File-Chunk-To": str(offset + len(chunk)),
+                "X-File-EOF": "true" if eof else "false",
+                "X-File-Size": str(meta["size"]),
+                "X-File-MimeType": meta["mimetype"],
+            },
+        )
+        return self.get_json(status, data)
+
+    def upload(self, fp: str, name: str = None, mimetype: str = None) -> dict:
+        """Upload a file, resuming a previous upload of the same content.
+
+        The chunks before the last one are sent in parallel, the last chunk
+        (``X-File-EOF``) is sent once they are all stored, so the server
+        verifies the checksum of the complete file.
+
+        Returns:
+          The response of the last chunk, or the register result when the
+          file already exists.
+
+        Raises:
+          UploadError: The server rejected the upload.
+        """
+
+        checksum, size = get_checksum(fp)
+        name = name or os.path.basename(fp)
+        meta = dict(
+            name=name,
+            size=size,
+            checksum=checksum,
+            mimetype=mimetype
+            or mimetypes.guess_type(name)[0]
+            or "application/octet-stream",
+        )
+        result = self.register([meta])[0]
+        if result["status"] == "completed":
+            return result
+        if result["status"] == "invalid":
+            raise UploadError(result.get("message") or "Invalid file.", data=result)
+
+        last = max(size - 1, 0) // self.chunk_size * self.chunk_size
+        offset = min(int(result.get("offset") or 0), last)
+        offset -= offset % self.chunk_size
+        offsets = range(offset, last, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in executor.map(
+                lambda chunk_from: self.upload_chunk(fp, meta, chunk_from, False),
+                offsets,
+            ):
+                pass
+        return self.upload_chunk(fp, meta, last, True)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Upload files to a django-chunk-file-upload server."
+    )
+    parser.add_argument("url", help="Upload URL, e.g. https://example.com/uploads/")
+    parser.add_argument("files", nargs="+", help="Files to upload.")
+    parser.add_argument(
+        "--chunk-size", type=int, default=1024 * 1024 * 2, help="Bytes per chunk."
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Parallel chunks.")
+    parser.add_argument("--retries", type=int, default=5, help="Retries per request.")
+    parser.add_argument("--timeout", type=float, default=60, help="Socket timeout.")
+    parser.add_argument(
+        "-H",
+        "--header",
+        action="append",
+        default=[],
+        help='Extra header, e.g. "Authorization: Bearer <token>".',
+    )
+    args = parser.parse_args(argv)
+
+    headers = {}
+    for header in args.header:
+        k, _, v = header.partition(":")
+        headers[k.strip()] = v.strip()
+
+    client = ChunkUploadClient(
+        args.url,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        retries=args.retries,
+        timeout=args.timeout,
+        headers=headers,
+    )
+    failed = 0
+    for fp in args.files:
+        try:
+            result = client.upload(fp)
+        except (OSError, UploadError) as e:
+            failed += 1
+            result = {"name": fp, "status": "error", "message": str(e)}
+        print(json.dumps(result))
+    client.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
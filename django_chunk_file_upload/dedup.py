@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import time
+from bisect import bisect_right
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+
+from .app_settings import app_settings
+from .utils import create_dir, get_logger, safe_remove_file
+
+
+LOGGER = get_logger(__name__)
+
+_MASK_64 = 0xFFFFFFFFFFFFFFFF
+GEAR = tuple(
+    int.from_bytes(hashlib.md5(i.to_bytes(2, "big")).digest()[:8], "big")
+    for i in range(256)
+)
+
+
+def _mask(bits: int) -> int:
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+class ChunkStore:
+    """Content-defined chunk store
+
+    Split files with FastCDC-style content-defined chunking (gear rolling
+    hash, normalized chunking) into blocks stored once by SHA-256 under
+    ``<MEDIA_ROOT>/<blocks_dir>``. A deduplicated file is replaced by a JSON
+    manifest (``<file>.cdc``) listing its blocks, read back with
+    ``ManifestFile``.
+    """
+
+    extension = ".cdc"
+
+    def __init__(
+        self,
+        min_size: int = 1024 * 16,
+        avg_size: int = 1024 * 64,
+        max_size: int = 1024 * 256,
+        blocks_dir: str = "blocks",
+    ):
+        if not (0 < min_size <= avg_size <= max_size):
+            raise ValueError("Block sizes must satisfy 0 < min <= avg <= max.")
+
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.blocks_dir = blocks_dir
+        bits = max(avg_size.bit_length() - 1, 2)
+        self.mask_s, self.mask_l = _mask(bits + 2), _mask(bits - 2)
+
+    @classmethod
+    def from_settings(cls, settings) -> "ChunkStore":
+        return cls(
+            min_size=settings.min_size,
+            avg_size=settings.avg_size,
+            max_size=settings.max_size,
+            blocks_dir=settings.blocks_dir,
+        )
+
+    @property
+    def root(self) -> str:
+        media_root = str(settings.MEDIA_ROOT) if settings.MEDIA_ROOT else ""
+        return os.path.join(media_root, self.blocks_dir)
+
+    @classmethod
+    def is_manifest(cls, fp: str) -> bool:
+        return bool(fp) and str(fp).endswith(cls.extension)
+
+    def get_block_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def cut(self, buf, start: int, end: int) -> int:
+        """Find the end of the block starting at ``start``."""
+
+        end = min(end, start + self.max_size)
+        if end - start <= self.min_size:
+            return end
+
+        h, i = 0, start + self.min_size
+        normal = min(start + self.avg_size, end)
+        mask_s, mask_l = self.mask_s, self.mask_l
+        while i < normal:
+            h = ((h << 1) + GEAR[buf[i]]) & _MASK_64
+            i += 1
+            if not h & mask_s:
+                return i
+
+        while i < end:
+            h = ((h << 1) + GEAR[buf[i]]) & _MASK_64
+            i += 1
+            if not h & mask_l:
+                return i
+        return end
+
+    def split(self, buf) -> Iterator[tuple[int, int]]:
+        start, size = 0, len(buf)
+        while start < size:
+            end = self.cut(buf, start, size)
+            yield start, end
+            start = end
+
+    def put(self, digest: str, block: bytes) -> bool:
+        """Store a block once, return True when it is new."""
+
+        fp = self.get_block_path(digest)
+        if os.path.exists(fp):
+            # Refresh mtime, so the GC grace period protects reused blocks.
+            os.utime(fp)
+            return False
+
+        create_dir(os.path.dirname(fp))
+        tmp = "%s.%s.tmp" % (fp, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(block)
+        os.replace(tmp, fp)
+        return True
+
+    def ingest(self, fp: str, remove_origin: bool = True) -> str:
+        """Split a file into blocks and write its manifest.
+
+        Args:
+          fp: File path.
+          remove_origin: Delete the original file once the manifest is written.
+
+        Returns:
+          The manifest file path.
+        """
+
+        md5hash, blocks, size, stored = hashlib.md5(), [], 0, 0
+        with open(fp, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    for start, end in self.split(buf):
+                        block = buf[start:end]
+                        digest = hashlib.sha256(block).hexdigest()
+                        if self.put(digest, block):
+                            stored += end - start
+                        md5hash.update(block)
+                        blocks.append([digest, end - start])
+
+        manifest = {
+            "version": 1,
+            "size": size,
+            "checksum": md5hash.hexdigest(),
+            "blocks": blocks,
+        }
+        manifest_fp = fp + self.extension
+        with open(manifest_fp + ".tmp", "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(manifest_fp + ".tmp", manifest_fp)
+        if remove_origin:
+            safe_remove_file(fp)
+
+        LOGGER.info(
+            "Deduplicated file: %s, size: %s, new blocks size: %s.", fp, size, stored
+        )
+        return manifest_fp
+
+    def load(self, manifest_fp: str) -> dict:
+        with open(manifest_fp, "r") as f:
+            return json.load(f)
+
+    def open(self, manifest_fp: str) -> io.BufferedReader:
+        return io.BufferedReader(ManifestFile(self, self.load(manifest_fp)))
+
+    def gc(
+        self, manifests: Iterable[str], grace: int = 3600, dry_run: bool = False
+    ) -> tuple[int, int]:
+        """Delete the blocks not referenced by any manifest.
+
+        Args:
+          manifests: Paths of all live manifests.
+          grace: Keep blocks modified within this many seconds (uploads in progress).
+          dry_run: Only count the blocks.
+
+        Returns:
+          The Tuple: number of removed blocks, freed bytes.
+        """
+
+        live = set()
+        for manifest_fp in manifests:
+            try:
+                live.update(digest for digest, _ in self.load(manifest_fp)["blocks"])
+            except (OSError, ValueError, KeyError) as e:
+                LOGGER.warning("Cannot read manifest: %s, %s", manifest_fp, e)
+
+        removed, freed, deadline = 0, 0, time.time() - grace
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename in live:
+                    continue
+
+                fp = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(fp)
+                except OSError:
+                    continue
+
+                if stat.st_mtime < deadline:
+                    removed, freed = removed + 1, freed + stat.st_size
+                    if not dry_run:
+                        safe_remove_file(fp)
+        return removed, freed
+
+
+class ManifestFile(io.RawIOBase):
+    """Seekable reader reassembling a deduplicated file from its blocks."""
+
+    def __init__(self, store: ChunkStore, manifest: dict):
+        super().__init__()
+        self.store = store
+        self.blocks = manifest["blocks"]
+        self.size = int(manifest["size"])
+        self.offsets, offset = [], 0
+        for _, length in self.blocks:
+            self.offsets.append(offset)
+            offset += length
+        self._pos = 0
+        self._block = None
+        self._fp = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position: %s" % offset)
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, b) -> int:
+        if self._pos >= self.size:
+            return 0
+
+        i = bisect_right(self.offsets, self._pos) - 1
+        if self._block != i:
+            if self._fp:
+                self._fp.close()
+            self._fp = open(self.store.get_block_path(self.blocks[i][0]), "rb")
+            self._block = i
+
+        self._fp.seek(self._pos - self.offsets[i])
+        data = self._fp.read(min(len(b), self.blocks[i][1] - self._fp.tell()))
+        b[: len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+        super().close()
+
+
+chunk_store = ChunkStore.from_settings(app_settings.dedup)
+
+
+def open_file(file: FieldFile, store: ChunkStore = None) -> io.BufferedIOBase:
+    """Open a stored file for reading, deduplicated or not."""
+
+    if ChunkStore.is_manifest(file.name):
+        return (store or chunk_store).open(file.path)
+    return file.open("rb")
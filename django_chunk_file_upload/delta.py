@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import mmap
+import zlib
+from contextlib import contextmanager
+from io import UnsupportedOperation
+from typing import BinaryIO
+
+
+ADLER_MOD = 65521
+MIN_BLOCK_SIZE = 1024 * 4  # 4KB
+MAX_BLOCK_SIZE = 1024 * 1024  # 1MB
+
+COPY = "copy"
+DATA = "data"
+
+
+def get_block_size(size: int) -> int:
+    """Block size close to sqrt(size), rounded to KB, the same trade-off as rsync."""
+
+    block_size = int(math.sqrt(max(size, 0))) // 1024 * 1024
+    return min(max(block_size, MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+def weak_checksum(data: bytes) -> int:
+    """Adler-32, it can be rolled one byte at a time."""
+
+    return zlib.adler32(data)
+
+
+def strong_checksum(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def get_signatures(fp: BinaryIO, block_size: int) -> list[tuple[int, str]]:
+    """Block signatures of a file: a weak rolling hash plus a strong hash per block.
+
+    Args:
+      fp: Binary file object of the existing file.
+      block_size: Block size.
+
+    Returns:
+      List of (weak, strong) tuples, one per block.
+    """
+
+    signatures = []
+    while block := fp.read(block_size):
+        signatures.append((weak_checksum(block), strong_checksum(block)))
+    return signatures
+
+
+def make_delta(
+    fp: BinaryIO, signatures: list, block_size: int
+) -> tuple[list[list], bytes]:
+    """Compute the delta of a new file against the signatures of the old file.
+
+    Instructions::
+        ["copy", index, count]: Copy ``count`` blocks of the old file from block ``index``.
+        ["data", length]: Take the next ``length`` bytes of the data.
+
+    Args:
+      fp: Binary file object of the new file, memory-mapped when possible.
+      signatures: Block signatures of the old file, see ``get_signatures``.
+      block_size: Block size of the signatures.
+
+    Returns:
+      The Tuple: instructions, data. The data holds the changed bytes only.
+    """
+
+    index = {}
+    for i, (weak, strong) in enumerate(signatures):
+        index.setdefault(int(weak), {}).setdefault(strong, i)
+
+    fp.seek(0, 2)
+    size = fp.tell()
+    fp.seek(0)
+    if not size:
+        return [], b""
+
+    instructions, data = [], bytearray()
+    with _open_buffer(fp) as buf:
+
+        def flush(start: int, end: int):
+            if end > start:
+                instructions.append([DATA, end - start])
+                data.extend(buf[start:end])
+
+        def copy(i: int):
+            last = instructions[-1] if instructions else None
+            if last and last[0] == COPY and last[1] + last[2] == i:
+                last[2] += 1
+            else:
+                instructions.append([COPY, i, 1])
+
+        pos, literal, weak = 0, 0, None
+        while pos < size:
+            end = pos + block_size
+            if end > size:
+                # Only the short last block of the old file can match the tail.
+                if signatures and strong_checksum(buf[pos:size]) == signatures[-1][1]:
+                    flush(literal, pos)
+                    copy(len(signatures) - 1)
+                    literal = size
+                break
+
+            if weak is None:
+                weak = weak_checksum(buf[pos:end])
+
+            strongs = index.get(weak)
+            if strongs:
+                i = strongs.get(strong_checksum(buf[pos:end]))
+                if i is not None:
+                    flush(literal, pos)
+                    copy(i)
+                    pos = literal = end
+                    weak = None
+                    continue
+
+            if end >= size:
+                pos += 1
+                weak = None
+                continue
+
+            a, b = weak & 0xFFFF, weak >> 16
+            out, inc = buf[pos], buf[end]
+            a = (a - out + inc) % ADLER_MOD
+            b = (b - block_size * out + a - 1) % ADLER_MOD
+            weak = (b << 16) | a
+            pos += 1
+
+        flush(literal, size)
+    return instructions, bytes(data)
+
+
+@contextmanager
+def _open_buffer(fp: BinaryIO):
+    try:
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, UnsupportedOperation):
+        yield fp.read()
+    else:
+        with buf:
+            yield buf
+
+
+def apply_delta(
+    origin: BinaryIO,
+    instructions: list,
+    data: BinaryIO,
+    out: BinaryIO,
+    block_size: int,
+    buffer_size: int = 1024 * 64,
+    max_size: int = None,
+) -> tuple[str, int]:
+    """Rebuild the new file from the old file and a delta.
+
+    Args:
+      origin: Binary file object of the old file.
+      instructions: Delta instructions, see ``make_delta``.
+      data: Binary file object of the delta data.
+      out: Binary file object of the new file.
+      block_size: Block size of the delta.
+      max_size: Stop as soon as the new file outgrows it, e.g. its declared size.
+
+    Returns:
+      The Tuple: MD5 checksum, size of the new file.
+
+    Raises:
+      ValueError: Invalid instructions or data.
+    """
+
+    if block_size <= 0:
+        raise ValueError("Invalid block size: %s" % block_size)
+
+    md5hash, size = hashlib.md5(), 0
+
+    def write(length: int, fp: BinaryIO) -> int:
+        nonlocal size
+        written = 0
+        while written < length:
+            chunk = fp.read(min(buffer_size, length - written))
+            if not chunk:
+                break
+            if max_size is not None and size + written + len(chunk) > max_size:
+                raise ValueError("The new file exceeds %s bytes." % max_size)
+            out.write(chunk)
+            md5hash.update(chunk)
+            written += len(chunk)
+        size += written
+        return written
+
+    for instruction in instructions:
+        if not isinstance(instruction, (list, tuple)) or not instruction:
+            raise ValueError("Invalid instruction: %s" % instruction)
+
+        if instruction[0] == COPY and len(instruction) == 3:
+            i, count = int(instruction[1]), int(instruction[2])
+            if i < 0 or count <= 0:
+                raise ValueError("Invalid instruction: %s" % instruction)
+            origin.seek(i * block_size)
+            written = write(count * block_size, origin)
+            if written <= (count - 1) * block_size:
+                raise ValueError("Block out of range: %s" % instruction)
+        elif instruction[0] == DATA and len(instruction) == 2:
+            length = int(instruction[1])
+            if length < 0 or write(length, data) != length:
+                raise ValueError("Not enough data: %s" % instruction)
+        else:
+            raise ValueError("Invalid instruction: %s" % instruction)
+
+    if data.read(1):
+        raise ValueError("Unused delta data.")
+
+    return md5hash.hexdigest(), size
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...dedup import ChunkStore, chunk_store
+from ...models import FileManager
+from ...utils import get_logger, safe_remove_file
+
+
+LOGGER = get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deduplicate the files queued by the upload views: split them into "
+        "content-defined blocks and replace them with their manifest."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            default=FileManager._meta.label,
+            help="Model to deduplicate, app_label.ModelName (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=0, help="Max files to deduplicate (0: all)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        queryset = model.objects.filter(eof=True, metadata__dedup__status="pending")
+        if options["limit"] > 0:
+            queryset = queryset[: options["limit"]]
+
+        deduplicated, failed = 0, 0
+        for instance in queryset.iterator():
+            if self.deduplicate(model, instance):
+                deduplicated += 1
+            else:
+                failed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Deduplicated %s files, %s failed." % (deduplicated, failed)
+            )
+        )
+
+    def deduplicate(self, model, instance) -> bool:
+        """Ingest the file, then point the row to its manifest.
+
+        The original is kept until the row is updated, so downloads in the
+        meantime still find it; a row changed in the meantime (updated or
+        deleted file) keeps its file and the manifest is dropped.
+        """
+
+        name = instance.file.name
+        metadata = dict(instance.metadata, dedup={"status": "completed"})
+        try:
+            if ChunkStore.is_manifest(name):
+                manifest_fp = None
+            else:
+                manifest_fp = chunk_store.ingest(
+                    instance.file.path, remove_origin=False
+                )
+        except (OSError, ValueError) as e:
+            LOGGER.warning("Cannot deduplicate file: %s, %s", name, e)
+            metadata["dedup"] = {"status": "error", "reason": str(e)}
+            model.objects.filter(pk=instance.pk, file=name).update(
+                metadata=metadata, updated_at=timezone.now()
+            )
+            return False
+
+        updated = model.objects.filter(pk=instance.pk, file=name).update(
+            file=name + ChunkStore.extension if manifest_fp else name,
+            metadata=metadata,
+            updated_at=timezone.now(),
+        )
+        if manifest_fp:
+            safe_remove_file(instance.file.path if updated else manifest_fp)
+        return bool(updated)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from ...dedup import ChunkStore, chunk_store
+from ...models import FileManagerMixin
+
+
+class Command(BaseCommand):
+    help = "Delete the deduplicated blocks no longer referenced by any file."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=3600,
+            help="Keep blocks modified within this many seconds (default: 3600).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the blocks that would be deleted.",
+        )
+
+    def get_manifests(self):
+        for model in apps.get_models():
+            if not issubclass(model, FileManagerMixin):
+                continue
+
+            queryset = model.objects.filter(
+                file__endswith=ChunkStore.extension
+            ).values_list("file", flat=True)
+            for name in queryset.iterator():
+                yield model._meta.get_field("file").storage.path(name)
+
+    def handle(self, *args, **options):
+        removed, freed = chunk_store.gc(
+            self.get_manifests(), grace=options["grace"], dry_run=options["dry_run"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%s %s blocks, %s bytes."
+                % ("Found" if options["dry_run"] else "Deleted", removed, freed)
+            )
+        )
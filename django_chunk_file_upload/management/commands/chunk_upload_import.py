@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...app_settings import app_settings
+from ...constants import StatusChoices
+from ...models import FileManager
+from ...optimize import MapOptimizer
+from ...typed import File
+from ...utils import get_file_extension, get_logger
+
+
+LOGGER = get_logger(__name__)
+
+
+def scan(root: str):
+    """Walk a directory tree with ``os.scandir``, yield regular file paths."""
+
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path
+        except OSError as e:
+            LOGGER.warning("Cannot scan directory: %s", e)
+
+
+def inspect(fp: str, buffer_size: int = 1024 * 1024) -> None | tuple:
+    """Hash and type-detect a file, runs in the process pool.
+
+    Returns:
+      The Tuple: path, size, MD5 checksum, extension, type. None if unreadable.
+    """
+
+    md5hash, size = hashlib.md5(), 0
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    try:
+        with open(fp, "rb", buffering=0) as f:
+            while n := f.readinto(buf):
+                md5hash.update(view[:n])
+                size += n
+    except OSError:
+        return None
+
+    extension = get_file_extension(fp)
+    return fp, size, md5hash.hexdigest(), extension, File(_extension=extension).type
+
+
+class Command(BaseCommand):
+    help = "Import the files of an existing directory into the file manager."
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory to import.")
+        parser.add_argument(
+            "--model",
+            default=FileManager._meta.label,
+            help="Target model, app_label.ModelName (default: %(default)s).",
+        )
+        parser.add_argument("--user", help="Username of the owner of the files.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Hash processes.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per bulk_create."
+        )
+        parser.add_argument(
+            "--move",
+            action="store_true",
+            help="Move the files into upload_to instead of copying them.",
+        )
+        parser.add_argument(
+            "--optimize",
+            action="store_true",
+            help="Run the optimizers (e.g. images) in a background pool.",
+        )
+
+    def handle(self, *args, **options):
+        directory = os.path.abspath(options["directory"])
+        if not os.path.isdir(directory):
+            raise CommandError("Not a directory: %s" % directory)
+
+        try:
+            self.model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        self.user = None
+        if options["user"]:
+            try:
+                self.user = get_user_model().objects.get_by_natural_key(options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError("User not found: %s" % options["user"])
+
+        self.move = options["move"]
+        self.optimize = options["optimize"]
+        self.optimized = []
+        batch_size = max(options["batch_size"], 1)
+        imported, skipped, failed = 0, 0, 0
+        workers = max(options["workers"], 1)
+        with ProcessPoolExecutor(max_workers=workers) as processes:
+            with ThreadPoolExecutor(max_workers=workers) as threads:
+                self.threads = threads
+                batch, paths = [], scan(directory)
+                # Executor.map submits its whole iterable at once, feed it a
+                # window of paths at a time so memory does not grow with the tree.
+                while window := list(islice(paths, batch_size)):
+                    results = processes.map(
+                        inspect, window, chunksize=max(batch_size // 10, 1)
+                    )
+                    for result in results:
+                        if result is None:
+                            failed += 1
+                            continue
+
+                        batch.append(result)
+                        if len(batch) >= batch_size:
+                            created = self.ingest(batch)
+                            imported, skipped = (
+                                imported + created,
+                                skipped + len(batch) - created,
+                            )
+                            batch = []
+
+                if batch:
+                    created = self.ingest(batch)
+                    imported, skipped = (
+                        imported + created,
+                        skipped + len(batch) - created,
+                    )
+
+                self.save_optimized(wait=True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported %s files, skipped %s existing, %s unreadable."
+                % (imported, skipped, failed)
+            )
+        )
+
+    def get_file_obj(self, fp: str, size: int, checksum: str, extension: str) -> File:
+        return File(
+            _extension=extension,
+            _user=self.user,
+            _upload_to=app_settings.upload_to,
+            checksum=checksum,
+            eof=True,
+            mimetype=mimetypes.guess_type(fp)[0] or "application/octet-stream",
+            name=os.path.basename(fp),
+            size=str(size),
+        )
+
+    def ingest(self, batch: list) -> int:
+        """Copy the new files of a batch and insert their rows, return the count."""
+
+        checksums = {checksum for _, _, checksum, _, _ in batch}
+        existing = set(
+            self.model.objects.filter(
+                checksum__in=checksums, user=self.user
+            ).values_list("checksum", flat=True)
+        )
+
+        file_objs, copies, sources = {}, [], {}
+        for fp, size, checksum, extension, _type in batch:
+            if checksum in existing or checksum in file_objs:
+                continue
+
+            file_obj = self.get_file_obj(fp, size, checksum, extension)
+            file_objs[checksum] = file_obj
+            copies.append((fp, file_obj.save_path))
+            sources[checksum] = fp
+
+        for (fp, save_path), error in zip(
+            copies, self.threads.map(lambda args: self.copy(*args), copies)
+        ):
+            if error:
+                LOGGER.warning("Cannot import file: %s, %s", fp, error)
+                file_objs = {
+                    k: v for k, v in file_objs.items() if v.save_path != save_path
+                }
+
+        objs = []
+        for file_obj in file_objs.values():
+            pending = self.optimize and file_obj.type in MapOptimizer
+            instance = self.model(
+                checksum=file_obj.checksum,
+                eof=True,
+                file=file_obj.path,
+                status=StatusChoices.PENDING if pending else app_settings.status,
+                type=file_obj.type,
+                user=self.user,
+                **file_obj.to_fields(),
+            )
+            if app_settings.is_metadata_storage:
+                instance.metadata = file_obj.to_metadata()
+            objs.append(instance)
+
+        self.model.objects.bulk_create(objs, ignore_conflicts=True)
+        # ignore_conflicts drops rows silently, a row created concurrently
+        # refers to another file: put the files of the dropped rows back.
+        inserted = set(
+            self.model.objects.filter(
+                checksum__in=list(file_objs), user=self.user
+            ).values_list("checksum", "file")
+        )
+        for checksum, file_obj in list(file_objs.items()):
+            if (checksum, file_obj.path) not in inserted:
+                self.restore(sources[checksum], file_obj.save_path)
+                del file_objs[checksum]
+        created = len(file_objs)
+        self.save_optimized()
+        if self.optimize:
+            for instance in self.model.objects.filter(
+                checksum__in=list(file_objs),
+                user=self.user,
+                type__in=list(MapOptimizer),
+            ):
+                file_obj = file_objs[instance.checksum]
+                self.optimized.append(
+                    (
+                        instance,
+                        self.threads.submit(self.run_optimizer, instance, file_obj),
+                    )
+                )
+        return created
+
+    def copy(self, src: str, dst: str) -> None | Exception:
+        try:
+            if self.move:
+                shutil.move(src, dst)
+            else:
+                shutil.copyfile(src, dst)
+        except OSError as e:
+            return e
+
+    def restore(self, src: str, dst: str) -> None:
+        """Undo ``copy`` for a file without a row."""
+
+        try:
+            if self.move:
+                shutil.move(dst, src)
+            else:
+                os.remove(dst)
+        except OSError as e:
+            LOGGER.warning("Cannot restore file: %s, %s", src, e)
+
+    def run_optimizer(self, instance, file_obj: File) -> File:
+        """Optimize a file off the import loop."""
+
+        file_obj.optimize(instance)
+        return file_obj
+
+    def save_optimized(self, wait: bool = False):
+        """Save the rows of the finished optimizations, from the main thread."""
+
+        pending = []
+        for instance, future in self.optimized:
+            if not wait and not future.done():
+                pending.append((instance, future))
+                continue
+
+            try:
+                file_obj = future.result()
+                instance.file = file_obj.path
+                instance.metadata.update(file_obj._extra_metadata)
+                instance.status = app_settings.status
+            except Exception as e:
+                LOGGER.warning("Cannot optimize file: %s, %s", instance.file.name, e)
+                instance.status = StatusChoices.ERROR
+            instance.save(update_fields=["file", "status", "metadata", "updated_at"])
+        self.optimized = pending
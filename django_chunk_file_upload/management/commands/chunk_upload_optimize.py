@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...constants import StatusChoices
+from ...models import FileManager
+from ...optimize import ImageOptimizer, OptimizerError
+from ...utils import get_logger
+
+
+LOGGER = get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Optimize the images deferred by the upload workers, too large to be "
+        "decoded within their max_memory, on a worker with more memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            default=FileManager._meta.label,
+            help="Model to optimize, app_label.ModelName (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--max-memory",
+            type=int,
+            default=4096,
+            help="Max raw size of a decoded image in MB (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=0, help="Max images to optimize (0: all)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        queryset = model.objects.filter(metadata__optimizer__action="deferred")
+        if options["limit"] > 0:
+            queryset = queryset[: options["limit"]]
+
+        optimized, failed = 0, 0
+        for instance in queryset.iterator():
+            report = {}
+            try:
+                image, path = ImageOptimizer.optimize(
+                    instance.file.path,
+                    upload_to=os.path.dirname(instance.file.name),
+                    report=report,
+                    checksum=instance.checksum,
+                    max_memory=options["max_memory"] * 1024 * 1024,
+                )
+                ImageOptimizer.close(image)
+            except (OptimizerError, OSError) as e:
+                LOGGER.warning("Cannot optimize file: %s, %s", instance.file.name, e)
+                instance.status = StatusChoices.ERROR
+                report = {"action": "rejected", "reason": str(e)}
+                failed += 1
+            else:
+                if path:
+                    instance.file = path
+                optimized += report.get("action") != "deferred"
+
+            instance.metadata["optimizer"] = report
+            instance.save(update_fields=["file", "status", "metadata", "updated_at"])
+
+        self.stdout.write(
+            self.style.SUCCESS("Optimized %s images, %s failed." % (optimized, failed))
+        )
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.fields.json import KT
+
+from ...constants import StatusChoices
+from ...dedup import ChunkStore, chunk_store
+from ...models import FileManager
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads, in bytes per second."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.allowance = rate
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size: int):
+        if not self.rate:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(
+                self.rate, self.allowance + (now - self.timestamp) * self.rate
+            )
+            self.timestamp = now
+            self.allowance -= size
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = "Verify that stored files still match their MD5 checksum."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            default=FileManager._meta.label,
+            help="Model to verify, app_label.ModelName (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count() or 1, help="Hash threads."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per keyset page."
+        )
+        parser.add_argument(
+            "--buffer-size",
+            type=int,
+            default=1024 * 1024,
+            help="Read buffer size in bytes (default: 1MB).",
+        )
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            default=0,
+            help="Read at most this many MB per second (default: 0, unlimited).",
+        )
+        parser.add_argument(
+            "--start-after", type=int, default=0, help="Resume after this primary key."
+        )
+        parser.add_argument(
+            "--state-file",
+            help="Store the last verified primary key, and resume from it.",
+        )
+        parser.add_argument(
+            "--mark",
+            action="store_true",
+            help="Set the status of mismatched files to ERROR.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        self.storage = model._meta.get_field("file").storage
+        self.buffer_size = options["buffer_size"]
+        self.limiter = RateLimiter(options["max_rate"] * 1024 * 1024)
+        state_file = options["state_file"]
+        last_pk = options["start_after"]
+        if state_file and os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                last_pk = max(last_pk, int(f.read().strip() or 0))
+
+        verified, mismatched, skipped = 0, 0, 0
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as executor:
+            while True:
+                rows = list(
+                    model.objects.filter(eof=True, pk__gt=last_pk)
+                    .order_by("pk")
+                    .annotate(
+                        stored_checksum=model.content_checksum_expression(),
+                        optimizer_action=KT("metadata__optimizer__action"),
+                        optimizer_checksum=KT("metadata__optimizer__checksum"),
+                    )
+                    .values_list(
+                        "pk",
+                        "file",
+                        "stored_checksum",
+                        "optimizer_action",
+                        "optimizer_checksum",
+                    )[: options["batch_size"]]
+                )
+                if not rows:
+                    break
+
+                last_pk, count = rows[-1][0], len(rows)
+                # Updated files and optimized images no longer match the first
+                # upload, ``content_checksum`` is checked; older optimized rows
+                # without the checksum of their output cannot be verified.
+                rows = [
+                    (pk, name, checksum)
+                    for pk, name, checksum, action, optimized in rows
+                    if action != "optimized" or optimized
+                ]
+                skipped += count - len(rows)
+
+                errors = []
+                for (pk, name, checksum), result in zip(
+                    rows, executor.map(self.verify, rows)
+                ):
+                    verified += 1
+                    if result:
+                        errors.append(pk)
+                        self.stdout.write("%s %s: %s" % (pk, name, result))
+
+                mismatched += len(errors)
+                if errors and options["mark"]:
+                    model.objects.filter(pk__in=errors).update(
+                        status=StatusChoices.ERROR
+                    )
+
+                if state_file:
+                    with open(state_file, "w") as f:
+                        f.write(str(last_pk))
+
+        style = self.style.ERROR if mismatched else self.style.SUCCESS
+        self.stdout.write(
+            style("Verified %s files, %s mismatched." % (verified, mismatched))
+        )
+        if skipped:
+            self.stdout.write(
+                "Skipped %s optimized files without the checksum of their output."
+                % skipped
+            )
+
+    def verify(self, row) -> None | str:
+        """Return None when the file matches its checksum, otherwise the reason."""
+
+        _pk, name, checksum = row
+        if not name:
+            return "missing"
+
+        try:
+            path = self.storage.path(name)
+            if ChunkStore.is_manifest(name):
+                fp = chunk_store.open(path)
+            else:
+                fp = open(path, "rb", buffering=0)
+        except OSError:
+            return "missing"
+
+        md5hash = hashlib.md5()
+        buf = bytearray(self.buffer_size)
+        view = memoryview(buf)
+        try:
+            with fp:
+                while size := fp.readinto(buf):
+                    self.limiter.consume(size)
+                    md5hash.update(view[:size])
+        except OSError as e:
+            return "unreadable (%s)" % e
+
+        if md5hash.hexdigest() != checksum:
+            return "checksum mismatch"
+        return None
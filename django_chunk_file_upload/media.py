@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import struct
+import sys
+from typing import Generator
+
+from .processors import BaseProcessor
+from .utils import get_logger
+
+
+LOGGER = get_logger(__name__)
+
+# Requests yielded by the parsers of the extractors.
+READ, SKIP = 0, 1
+
+
+class BaseExtractor(BaseProcessor):
+    """Base Media Extractor
+
+    Parse the headers of a container from the stream of an upload. ``parse``
+    is a generator yielding ``(READ, n)`` to receive the next n bytes or
+    ``(SKIP, n)`` to drop them, so large payloads (``mdat``, audio frames)
+    are never buffered. Parsing stops at the first malformed header, the
+    metadata found so far is kept.
+    """
+
+    name = "media"
+    max_read_size = 1024 * 1024 * 64  # Larger headers are skipped.
+
+    def __init__(self, file_obj):
+        super().__init__(file_obj)
+        self.info = {}
+        self._buf = bytearray()
+        self._parser = self.parse()
+        self._request = (READ, 0)
+        self._advance(None)
+
+    def parse(self) -> Generator[tuple[int, int], bytes, None]:
+        raise NotImplementedError
+
+    def finish(self) -> None:
+        """Derive the metadata (e.g. duration) once the stream ended."""
+
+    def _advance(self, value) -> None:
+        try:
+            self._request = self._parser.send(value)
+        except StopIteration:
+            self._parser = None
+        except (struct.error, ValueError, IndexError, KeyError) as e:
+            LOGGER.info("Cannot parse media headers: %s", e)
+            self._parser = None
+
+    def feed(self, data: bytes) -> None:
+        pos, size = 0, len(data)
+        while self._parser is not None and pos < size:
+            kind, n = self._request
+            if kind == SKIP:
+                k = min(n, size - pos)
+                pos += k
+                if k < n:
+                    self._request = (SKIP, n - k)
+                    break
+                self._advance(None)
+                continue
+
+            k = min(n - len(self._buf), size - pos)
+            self._buf += data[pos : pos + k]
+            pos += k
+            if len(self._buf) < n:
+                break
+            chunk = bytes(self._buf)
+            self._buf.clear()
+            self._advance(chunk)
+
+    def get_skip_size(self) -> int:
+        if self._parser is None:
+            return sys.maxsize  # Done.
+        kind, n = self._request
+        return n if kind == SKIP else 0
+
+    def skip(self, size: int) -> None:
+        if self._parser is not None:
+            n = self._request[1] - size
+            if n:
+                self._request = (SKIP, n)
+            else:
+                self._advance(None)
+
+    def close(self) -> dict:
+        if self._parser is not None:
+            self._parser.close()
+            self._parser = None
+        self.finish()
+        return {k: v for k, v in self.info.items() if v not in (None, "")}
+
+
+def _fourcc(data: bytes) -> str:
+    return data.decode("latin-1").strip("\x00 ")
+
+
+class MP4Extractor(BaseExtractor):
+    """ISO base media (MP4, MOV, M4A, 3GP) extractor
+
+    Walk the top level boxes, skip ``mdat`` and parse ``moov`` in memory:
+    duration from ``mvhd``, codec from ``stsd``, dimensions from ``tkhd``
+    and sample rate/channels of the audio sample entry.
+    """
+
+    containers = frozenset((b"trak", b"mdia", b"minf", b"stbl"))
+
+    def parse(self):
+        while True:
+            header = yield READ, 8
+            size, kind = struct.unpack(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack(">Q", (yield READ, 8))[0]
+                header_size = 16
+            elif size == 0:
+                return  # The box extends to the end of the file.
+            if size < header_size:
+                raise ValueError("Invalid box size: %s" % size)
+
+            body_size = size - header_size
+            if kind == b"ftyp" and body_size >= 4:
+                body = yield READ, body_size
+                self.info["brand"] = _fourcc(body[:4])
+            elif kind == b"moov" and body_size <= self.max_read_size:
+                self.parse_moov((yield READ, body_size))
+                return
+            elif body_size:
+                yield SKIP, body_size
+
+    def iter_boxes(self, data: bytes, start: int = 0, end: int = None):
+        end = len(data) if end is None else end
+        while start + 8 <= end:
+            size, kind = struct.unpack_from(">I4s", data, start)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", data, start + 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = end - start
+            if size < header_size:
+                return
+            yield kind, start + header_size, min(start + size, end)
+            start += size
+
+    def parse_moov(self, data: bytes) -> None:
+        tracks = []
+        for kind, start, end in self.iter_boxes(data):
+            if kind == b"mvhd":
+                self.info.update(self.parse_header(data, start))
+            elif kind == b"trak":
+                tracks.append(self.parse_track(data, start, end))
+
+        for track in tracks:
+            handler = track.pop("handler", None)
+            if handler == "vide" and "video_codec" not in self.info:
+                self.info["video_codec"] = track.get("codec")
+                self.info["width"] = track.get("width")
+                self.info["height"] = track.get("height")
+            elif handler == "soun" and "audio_codec" not in self.info:
+                self.info["audio_codec"] = track.get("codec")
+                self.info["sample_rate"] = track.get("sample_rate")
+                self.info["channels"] = track.get("channels")
+
+    def parse_header(self, data: bytes, start: int) -> dict:
+        """Duration of a mvhd/mdhd box."""
+
+        if data[start] == 1:
+            timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", data, start + 12)
+        if not timescale:
+            return {}
+        return {"duration": round(duration / timescale, 3)}
+
+    def parse_track(self, data: bytes, start: int, end: int) -> dict:
+        track = {}
+        stack = [(start, end)]
+        while stack:
+            for kind, s, e in self.iter_boxes(data, *stack.pop()):
+                if kind in self.containers:
+                    stack.append((s, e))
+                elif kind == b"tkhd":
+                    offset = s + (88 if data[s] == 1 else 76)
+                    width, height = struct.unpack_from(">II", data, offset)
+                    if width and height:
+                        track["width"], track["height"] = width >> 16, height >> 16
+                elif kind == b"hdlr":
+                    track["handler"] = _fourcc(data[s + 8 : s + 12])
+                elif kind == b"stsd" and e - s >= 16:
+                    # The display size of tkhd wins over the coded size.
+                    for k, v in self.parse_sample_entry(data, s + 8).items():
+                        track.setdefault(k, v)
+        return track
+
+    def parse_sample_entry(self, data: bytes, start: int) -> dict:
+        entry = {"codec": _fourcc(data[start + 4 : start + 8])}
+        # Visual and audio sample entries share the first 16 bytes.
+        if entry["codec"] in ("mp4a", "alac", "ac-3", "ec-3", "Opus", "fLaC"):
+            channels, _, _, rate = struct.unpack_from(">HHII", data, start + 24)
+            entry["channels"], entry["sample_rate"] = channels, rate >> 16
+        else:
+            width, height = struct.unpack_from(">HH", data, start + 32)
+            entry["width"], entry["height"] = width, height
+        return entry
+
+
+class WAVExtractor(BaseExtractor):
+    """RIFF/WAVE extractor: format chunk and data size."""
+
+    formats = {1: "pcm", 3: "float", 6: "alaw", 7: "ulaw", 0xFFFE: "extensible"}
+
+    def parse(self):
+        header = yield READ, 12
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return
+
+        byte_rate = 0
+        while True:
+            kind, size = struct.unpack("<4sI", (yield READ, 8))
+            if kind == b"fmt " and 16 <= size <= 1024:
+                body = yield READ, size + size % 2
+                fmt, channels, rate, byte_rate, _, bits = struct.unpack_from(
+                    "<HHIIHH", body
+                )
+                self.info.update(
+                    audio_codec=self.formats.get(fmt, "0x%04x" % fmt),
+                    channels=channels,
+                    sample_rate=rate,
+                    bits_per_sample=bits,
+                    bitrate=byte_rate * 8,
+                )
+            elif kind == b"data":
+                if byte_rate:
+                    self.info["duration"] = round(size / byte_rate, 3)
+                return
+            else:
+                yield SKIP, size + size % 2
+
+
+class OggExtractor(BaseExtractor):
+    """Ogg (Vorbis, Opus) extractor
+
+    Read the identification header of the first page, then walk the page
+    headers to the last granule position of the stream, skipping the bodies.
+    """
+
+    def __init__(self, file_obj):
+        self.serial = None
+        self.granule = 0
+        self.rate = 0
+        self.pre_skip = 0
+        super().__init__(file_obj)
+
+    def parse(self):
+        first = True
+        while True:
+            header = yield READ, 27
+            if header[:4] != b"OggS":
+                return
+            granule, serial = struct.unpack_from("<qI", header, 6)
+            segments = yield READ, header[26]
+            body_size = sum(segments)
+            if first:
+                first = False
+                self.serial = serial
+                self.parse_identification((yield READ, body_size))
+                continue
+
+            if serial == self.serial and granule > 0:
+                self.granule = granule
+            if body_size:
+                yield SKIP, body_size
+
+    def parse_identification(self, body: bytes) -> None:
+        if body[:7] == b"\x01vorbis":
+            channels, rate = struct.unpack_from("<BI", body, 11)
+            self.info.update(audio_codec="vorbis", channels=channels, sample_rate=rate)
+            self.rate = rate
+        elif body[:8] == b"OpusHead":
+            channels, self.pre_skip, rate = struct.unpack_from("<BHI", body, 9)
+            self.info.update(audio_codec="opus", channels=channels, sample_rate=rate)
+            self.rate = 48000  # Opus granules are always 48 kHz.
+
+    def finish(self) -> None:
+        if self.rate and self.granule:
+            duration = max(self.granule - self.pre_skip, 0) / self.rate
+            self.info["duration"] = round(duration, 3)
+
+
+class MP3Extractor(BaseExtractor):
+    """MPEG audio extractor
+
+    Skip the ID3v2 tag and read the first frame header; the duration comes
+    from the Xing/Info frame count, or by walking the frame headers of VBR
+    and CBR files.
+    """
+
+    bitrates = {
+        (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+        (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+        (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    }
+    sample_rates = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000)}
+
+    def __init__(self, file_obj):
+        self.frames = 0
+        self.samples = 0
+        super().__init__(file_obj)
+
+    def parse_frame_header(self, header: bytes) -> None | tuple[int, int, int, int]:
+        """Return (frame length, samples, sample rate, bitrate), None if invalid."""
+
+        b1, b2 = header[1], header[2]
+        if header[0] != 0xFF or b1 & 0xE0 != 0xE0:
+            return None
+        version_bits, layer_bits = (b1 >> 3) & 3, (b1 >> 1) & 3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if version_bits == 1 or layer_bits == 0 or rate_index == 3:
+            return None
+        if bitrate_index in (0, 15):
+            return None
+
+        version = 1 if version_bits == 3 else 2
+        layer = 4 - layer_bits
+        rate = self.sample_rates[version][rate_index]
+        if version_bits == 0:
+            rate //= 2  # MPEG 2.5
+        bitrate = self.bitrates[(version, layer)][bitrate_index] * 1000
+        padding = (b2 >> 1) & 1
+        if layer == 1:
+            return (12 * bitrate // rate + padding) * 4, 384, rate, bitrate
+
+        samples = 576 if layer == 3 and version == 2 else 1152
+        return samples // 8 * bitrate // rate + padding, samples, rate, bitrate
+
+    def parse(self):
+        header = yield READ, 4
+        if header[:3] == b"ID3":
+            tag = header + (yield READ, 6)
+            size = 0
+            for byte in tag[6:10]:
+                size = (size << 7) | (byte & 0x7F)
+            yield SKIP, size + (10 if tag[5] & 0x10 else 0)
+            header = yield READ, 4
+
+        frame = self.parse_frame_header(header)
+        if frame is None:
+            return
+
+        length, samples, rate, bitrate = frame
+        self.info.update(
+            audio_codec="mp%s" % (4 - ((header[1] >> 1) & 3)),
+            sample_rate=rate,
+            channels=1 if header[3] >> 6 == 3 else 2,
+        )
+        body = yield READ, max(length - 4, 0)
+        xing = self.get_xing_frames(header, body)
+        if xing:
+            self.info["duration"] = round(xing * samples / rate, 3)
+            self.info["bitrate_mode"] = "vbr" if b"Xing" in body[:40] else "cbr"
+            return
+
+        self.frames, self.samples, self.rate = 1, samples, rate
+        bitrates = {bitrate}
+        while True:
+            header = yield READ, 4
+            frame = self.parse_frame_header(header)
+            if frame is None:
+                break  # ID3v1 tag, trailing junk or end of the stream.
+            self.frames += 1
+            bitrates.add(frame[3])
+            yield SKIP, frame[0] - 4
+
+        self.info["bitrate_mode"] = "cbr" if len(bitrates) == 1 else "vbr"
+        if len(bitrates) == 1:
+            self.info["bitrate"] = bitrate
+
+    def get_xing_frames(self, header: bytes, body: bytes) -> int:
+        """Frame count of the Xing/Info header of the first frame."""
+
+        version_bits, mono = (header[1] >> 3) & 3, header[3] >> 6 == 3
+        if version_bits == 3:
+            offset = 17 if mono else 32
+        else:
+            offset = 9 if mono else 17
+        tag = body[offset : offset + 4]
+        if tag not in (b"Xing", b"Info") or len(body) < offset + 12:
+            return 0
+        flags, frames = struct.unpack_from(">II", body, offset + 4)
+        return frames if flags & 1 else 0
+
+    def finish(self) -> None:
+        if self.frames and "duration" not in self.info:
+            self.info["duration"] = round(self.frames * self.samples / self.rate, 3)
+
+
+MapExtractor = {
+    ".3g2": MP4Extractor,
+    ".3gp": MP4Extractor,
+    ".3gpp": MP4Extractor,
+    ".3gpp2": MP4Extractor,
+    ".m4a": MP4Extractor,
+    ".m4v": MP4Extractor,
+    ".mov": MP4Extractor,
+    ".mp3": MP3Extractor,
+    ".mp4": MP4Extractor,
+    ".oga": OggExtractor,
+    ".ogg": OggExtractor,
+    ".opus": OggExtractor,
+    ".wav": WAVExtractor,
+}
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-19 07:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "django_chunk_file_upload",
+            "0003_rename_file_manager_checksum_idx_filemanager_checksum_idx",
+        ),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filemanager",
+            name="filename",
+            field=models.CharField(
+                blank=True, default="", max_length=255, verbose_name="Name"
+            ),
+        ),
+        migrations.AddField(
+            model_name="filemanager",
+            name="mimetype",
+            field=models.CharField(
+                blank=True, default="", max_length=255, verbose_name="MIME type"
+            ),
+        ),
+        migrations.AddField(
+            model_name="filemanager",
+            name="size",
+            field=models.BigIntegerField(blank=True, null=True, verbose_name="Size"),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    """Copy name, size and mimetype out of the metadata, in pk order batches.
+
+    Every batch is committed on its own, the table is never locked for the
+    whole run.
+    """
+
+    FileManager = apps.get_model("django_chunk_file_upload", "FileManager")
+    alias = schema_editor.connection.alias
+    queryset = FileManager.objects.using(alias).order_by("pk")
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=alias):
+            objs = list(
+                queryset.filter(pk__gt=last_pk).only("pk", "metadata")[:BATCH_SIZE]
+            )
+            if not objs:
+                break
+
+            for obj in objs:
+                metadata = obj.metadata if isinstance(obj.metadata, dict) else {}
+                try:
+                    obj.size = int(metadata.get("size"))
+                except (TypeError, ValueError):
+                    obj.size = None
+                obj.filename = str(metadata.get("name") or "")[:255]
+                obj.mimetype = str(metadata.get("mimetype") or "")[:255]
+            queryset.bulk_update(objs, ["filename", "size", "mimetype"])
+        last_pk = objs[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("django_chunk_file_upload", "0004_filemanager_filename_size_mimetype"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+from django_chunk_file_upload.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY on PostgreSQL.
+
+    dependencies = [
+        (
+            "django_chunk_file_upload",
+            "0005_backfill_filemanager_filename_size_mimetype",
+        ),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="filemanager",
+            index=models.Index(fields=["filename"], name="filemanager_filename_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="filemanager",
+            index=models.Index(fields=["size"], name="filemanager_size_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="filemanager",
+            index=models.Index(fields=["mimetype"], name="filemanager_mimetype_idx"),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-19 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+from django_chunk_file_upload.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY on PostgreSQL.
+
+    dependencies = [
+        ("django_chunk_file_upload", "0006_filemanager_filename_size_mimetype_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="filemanager",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="filemanager_user_created_idx",
+            ),
+        ),
+    ]
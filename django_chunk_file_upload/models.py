@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from django.conf import settings
 from django.db import models
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 
 from .constants import StatusChoices, TypeChoices
@@ -34,6 +36,11 @@ class FileManagerMixin(models.Model):
         blank=True,
         related_name="%(class)s_files",
     )
+    # Denormalized from the upload for listing, sorting and filtering;
+    # metadata keeps the extended data.
+    filename = models.CharField(_("Name"), max_length=255, blank=True, default="")
+    size = models.BigIntegerField(_("Size"), null=True, blank=True)
+    mimetype = models.CharField(_("MIME type"), max_length=255, blank=True, default="")
     metadata = models.JSONField(default=dict)
 
     class Meta:
@@ -44,17 +51,60 @@ class FileManagerMixin(models.Model):
 
     @property
     def name(self) -> str:
+        if self.filename:
+            return self.filename
+        if "metadata" not in self.__dict__:
+            # Deferred, don't query it for a name.
+            return self.file.name
         if "name" in self.metadata and self.metadata["name"]:
             return self.metadata["name"]
         return self.file.name
 
+    @property
+    def content_checksum(self) -> str:
+        """MD5 checksum of the stored content.
+
+        ``checksum`` identifies the row, it keeps the checksum of the first
+        upload while an update or the optimizer replace the content.
+        """
+
+        if "metadata" not in self.__dict__:
+            # Deferred, see ``content_checksum_expression``.
+            return getattr(self, "stored_checksum", None) or self.checksum
+        optimizer = self.metadata.get("optimizer") or {}
+        return (
+            optimizer.get("checksum")
+            or self.metadata.get("content_checksum")
+            or self.checksum
+        )
+
+    @classmethod
+    def content_checksum_expression(cls) -> Coalesce:
+        """``content_checksum`` in SQL, e.g. ``annotate(stored_checksum=...)``."""
+
+        return Coalesce(
+            KT("metadata__optimizer__checksum"),
+            KT("metadata__content_checksum"),
+            "checksum",
+            output_field=models.CharField(),
+        )
+
 
 class FileManager(FileManagerMixin):
     """File Manager for Django Models"""
 
     class Meta:
         db_table = "django_chunk_file_upload"
-        indexes = [models.Index(fields=["checksum"], name="%(class)s_checksum_idx")]
+        indexes = [
+            models.Index(fields=["checksum"], name="%(class)s_checksum_idx"),
+            # Keyset pagination of the files of a user, see ChunkedListView.
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="%(class)s_user_created_idx"
+            ),
+            models.Index(fields=["filename"], name="%(class)s_filename_idx"),
+            models.Index(fields=["size"], name="%(class)s_size_idx"),
+            models.Index(fields=["mimetype"], name="%(class)s_mimetype_idx"),
+        ]
         ordering = ("-created_at",)
         unique_together = (
             "user",
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """Add an index without locking out writes on PostgreSQL.
+
+    ``CREATE INDEX CONCURRENTLY`` on PostgreSQL, a plain ``AddIndex``
+    elsewhere. Like ``django.contrib.postgres.operations.AddIndexConcurrently``
+    (which needs a PostgreSQL driver to import), the migration must set
+    ``atomic = False``.
+    """
+
+    def describe(self):
+        return "Concurrently create index %s on field(s) %s of model %s" % (
+            self.index.name,
+            ", ".join(self.index.fields),
+            self.model_name,
+        )
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == "postgresql":
+                schema_editor.add_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            if schema_editor.connection.vendor == "postgresql":
+                schema_editor.remove_index(model, self.index, concurrently=True)
+            else:
+                schema_editor.remove_index(model, self.index)
@@ -1,17 +1,21 @@
 from __future__ import annotations
 
+import os
+from dataclasses import asdict
 from io import BufferedReader, BytesIO
 from typing import TYPE_CHECKING, Union
 from uuid import UUID
 
 from django.db.models.fields.files import FieldFile, ImageFieldFile
 
-from PIL import Image, UnidentifiedImageError
+from PIL import Image, ImageMath, UnidentifiedImageError
+from PIL.GifImagePlugin import GifImageFile
 from PIL.JpegImagePlugin import JpegImageFile
 from PIL.PngImagePlugin import PngImageFile
 from PIL.WebPImagePlugin import WebPImageFile
 
 from .app_settings import app_settings
+from .cache import FileCache
 from .constants import TypeChoices
 from .utils import get_logger, get_md5_checksum, get_paths, safe_remove_file
 
@@ -23,9 +27,60 @@ if TYPE_CHECKING:
 LOGGER = get_logger(__name__)
 
 _File = Union[str | bytes | BytesIO | BufferedReader | FieldFile | ImageFieldFile]
-_Image = Union[JpegImageFile, PngImageFile, WebPImageFile]
+_Image = Union[JpegImageFile, PngImageFile, WebPImageFile, GifImageFile]
 _ImageFile = Union[_File, _Image]
 
+optimizer_cache = FileCache.from_settings("optimizer", app_settings.cache)
+thumbnail_cache = FileCache.from_settings("thumbnails", app_settings.cache)
+
+
+class OptimizerError(Exception):
+    """The file cannot be optimized and should be rejected."""
+
+
+class _FrameSequence:
+    """Frames after the first of an animation, for ``append_images``
+
+    Every seek decodes the next frame of the source and crops/resizes it,
+    the previous one is released. The durations grow with the seeks, the
+    writers read the duration of a frame after seeking to it.
+    """
+
+    def __init__(
+        self, image: _Image, size: tuple[int, int], box: tuple[int, int, int, int]
+    ):
+        self.image = image
+        self.size = size
+        self.box = box
+        self.n_frames = image.n_frames - 1
+        self.durations = [image.info.get("duration", 0)]
+        self._index = -1
+        self._frame = None
+
+    def seek(self, index: int) -> None:
+        if index == self._index:
+            return
+        if index >= self.n_frames:
+            raise EOFError("No more frames.")
+
+        self.image.seek(index + 1)
+        frame = self.image.convert("RGBA")
+        if self.box is not None:
+            frame = frame.crop(self.box)
+        if frame.size != self.size:
+            frame = frame.resize(self.size, Image.LANCZOS)
+        self._index, self._frame = index, frame
+        if len(self.durations) <= index + 1:
+            self.durations.append(self.image.info.get("duration", 0))
+
+    def tell(self) -> int:
+        return self._index
+
+    def __getattr__(self, name: str):
+        if self._frame is None:
+            self.seek(0)
+        return getattr(self._frame, name)
+
 
 class BaseOptimizer:
     """Base Optimizer"""
@@ -84,7 +139,8 @@ class BaseOptimizer:
 class ImageOptimizer(BaseOptimizer):
     """Image Optimizer"""
 
-    _supported_file_types = (".jpg", ".jpeg", ".png", ".webp")
+    _supported_file_types = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+    _lossy_formats = ("JPEG", "WEBP")
 
     def __init__(
         self,
@@ -96,8 +152,17 @@ class ImageOptimizer(BaseOptimizer):
         super().__init__(instance, file, *args, **kwargs)
 
     def run(self):
-        image, path = self.optimize(self.file.save_path, upload_to=self.file._upload_to)
-        self.file.path = path
+        report = {}
+        image, path = self.optimize(
+            self.file.save_path,
+            upload_to=self.file._upload_to,
+            report=report,
+            checksum=self.file.checksum,
+        )
+        if path:
+            self.file.path = path
+        if report:
+            self.file._extra_metadata["optimizer"] = report
         self.close(image)
 
     @classmethod
@@ -118,6 +183,68 @@ class ImageOptimizer(BaseOptimizer):
         else:
             super().close(fp)
 
+    @classmethod
+    def get_format(cls, image: _Image, to_webp: bool) -> tuple[None | str, None | str]:
+        """Output format and extension of an image, (None, None) if not supported."""
+
+        fm, ext = None, None
+        if isinstance(image, PngImageFile):
+            fm, ext = "PNG", ".png"
+        elif isinstance(image, JpegImageFile):
+            fm, ext = "JPEG", ".jpg"
+        elif isinstance(image, WebPImageFile):
+            fm, ext = "WEBP", ".webp"
+        elif isinstance(image, GifImageFile):
+            fm, ext = "GIF", ".gif"
+
+        if to_webp:
+            fm, ext = "WEBP", ".webp"
+        return fm, ext
+
+    @classmethod
+    def get_size(cls, fp: _ImageFile) -> None | int:
+        """Size in bytes of the original file, None if unknown."""
+
+        try:
+            if isinstance(fp, str):
+                return os.path.getsize(fp)
+            if isinstance(fp, bytes):
+                return len(fp)
+            if isinstance(fp, BytesIO):
+                return fp.getbuffer().nbytes
+            if isinstance(fp, BufferedReader):
+                return os.fstat(fp.fileno()).st_size
+            if isinstance(fp, (FieldFile, ImageFieldFile)):
+                return fp.size
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def is_optimal(
+        cls,
+        image: _Image,
+        size: None | int,
+        *,
+        max_width: int = app_settings.image_optimizer.max_width,
+        max_height: int = app_settings.image_optimizer.max_height,
+        to_webp: bool = app_settings.image_optimizer.to_webp,
+        skip_max_size: int = app_settings.image_optimizer.skip_max_size,
+    ) -> bool:
+        """Whether an image is kept as is, from its header only (nothing decoded).
+
+        Small images within the max dimensions, already in the output format
+        (and palette based for PNG), gain little from a re-encode.
+        """
+
+        fm, _ = cls.get_format(image, to_webp)
+        if not fm or image.format != fm or size is None or size > skip_max_size:
+            return False
+
+        w, h = image.size
+        if w > max_width or h > max_height:
+            return False
+        return fm != "PNG" or image.mode in ("1", "L", "P")
+
     @classmethod
     def optimize(
         cls,
@@ -130,6 +257,13 @@ class ImageOptimizer(BaseOptimizer):
         max_height: int = app_settings.image_optimizer.max_height,
         to_webp: bool = app_settings.image_optimizer.to_webp,
         remove_origin: bool = app_settings.image_optimizer.remove_origin,
+        skip_max_size: int = app_settings.image_optimizer.skip_max_size,
+        min_saving: float = app_settings.image_optimizer.min_saving,
+        report: dict = None,
+        checksum: str = None,
+        quality_mode: str = app_settings.image_optimizer.quality_mode,
+        max_pixels: int = app_settings.image_optimizer.max_pixels,
+        max_memory: int = app_settings.image_optimizer.max_memory,
     ) -> tuple[_Image, str]:
         """Optimize the Image File
 
@@ -142,67 +276,534 @@ class ImageOptimizer(BaseOptimizer):
           max_height: Max height of the image to resize.
           to_webp: Force convert image to webp type.
           remove_origin: Force to delete original image after optimization.
+          skip_max_size: Keep optimal images up to this size as is, see ``is_optimal``.
+          min_saving: Keep the original unless the re-encoded image is this fraction smaller.
+          report: Filled with the decision: action (optimized, skipped, kept_original), reason and sizes, and the MD5 checksum of an optimized output.
+          checksum: MD5 checksum of the original, the key of the optimizer cache.
+          quality_mode: fixed (``quality`` setting), size or similarity, see ``search_quality``.
+          max_pixels: Reject larger images from their header, nothing decoded.
+          max_memory: Max raw size of a decoded image (or frame), larger ones are reduced while decoded or deferred.
 
         Returns:
-          The Tuple: PIL Image, Image file path location. If the file is not in the correct format, a tuple with the value (None, None) can be returned.
+          The Tuple: PIL Image, Image file path location. The path is None when the original file is kept or is not in the correct format.
+
+        Raises:
+          OptimizerError: The image has more than max_pixels pixels.
         """
 
-        image, path = cls.open(fp), None
+        report = {} if report is None else report
+        try:
+            image, path = cls.open(fp), None
+        except Image.DecompressionBombError as e:
+            raise OptimizerError(str(e))
         if not image:
             LOGGER.error("Image format not supported.")
             return image, path
 
-        fm, ext = None, None
-        if isinstance(image, PngImageFile):
-            fm, ext = "PNG", ".png"
-            image = image.convert("P", palette=Image.ADAPTIVE)
-        elif isinstance(image, JpegImageFile):
-            fm, ext = "JPEG", ".jpg"
-        elif isinstance(image, WebPImageFile):
-            fm, ext = "WEBP", ".webp"
+        fm, ext = cls.get_format(image, to_webp)
+        if str(ext) not in cls._supported_file_types:
+            LOGGER.error("Image format not supported.")
+            return image, path
 
-        if app_settings.image_optimizer.to_webp:
-            fm, ext = "WEBP", ".webp"
+        if image.width * image.height > max_pixels:
+            cls.close(image)
+            raise OptimizerError(
+                "Image is too large: %sx%s pixels." % (image.width, image.height)
+            )
+
+        size = cls.get_size(fp)
+        report["original_size"] = size
+        if (
+            box is None
+            and not filename
+            and cls.is_optimal(
+                image,
+                size,
+                max_width=max_width,
+                max_height=max_height,
+                to_webp=to_webp,
+                skip_max_size=skip_max_size,
+            )
+        ):
+            LOGGER.info("Image is already optimal, skip optimization.")
+            report.update(action="skipped", reason="optimal")
+            return image, path
 
-        if str(ext) in cls._supported_file_types:
+        if checksum is None and not isinstance(fp, _Image):
+            checksum = cls.checksum(fp)
+        cache_key = None
+        if checksum and optimizer_cache.enabled:
+            cache_key = optimizer_cache.get_key(
+                "image",
+                checksum,
+                asdict(app_settings.image_optimizer),
+                box,
+                max_width,
+                max_height,
+                to_webp,
+                min_saving,
+                quality_mode,
+            )
+            entry = optimizer_cache.get(cache_key)
+            report["cache"] = "miss"
+            if entry and entry["path"] is None:
+                report.update(entry["report"], cache="hit")
+                return image, path
+
+            if entry:
+                LOGGER.info("Reuse the cached optimized image.")
+                try:
+                    save_path, cached_path = cls.store(
+                        fp,
+                        (filename or str(UUID(hex=checksum))) + ext,
+                        upload_to,
+                        remove_origin,
+                        lambda save_path: optimizer_cache.copy(
+                            entry["path"], save_path
+                        ),
+                    )
+                except OSError:
+                    # Evicted by another process since the lookup, a miss.
+                    LOGGER.info("The cached optimized image is gone, encode it.")
+                else:
+                    report.update(entry["report"], cache="hit")
+                    cls.close(image)
+                    return cls.open(save_path), cached_path
+
+        origin_size = image.size
+        reduced = cls.reduce(image, box, max_width, max_height, max_memory)
+        if reduced is None:
+            memory = cls.get_memory(image)
+            LOGGER.info("Image needs %s bytes to decode, defer it.", memory)
+            report.update(action="deferred", reason="memory", memory=memory)
+            return image, path
+        image = reduced
+
+        if cls.is_animated(image):
+            buf, image, report["frames"] = cls.encode_animation(
+                image, fm, box, max_width, max_height
+            )
+            quality, search = app_settings.image_optimizer.quality, {}
+        else:
+            strategy = None
+            if image.format == "PNG":
+                if app_settings.image_optimizer.png_strategy == "adaptive":
+                    strategy = cls.get_png_strategy(image, fm, checksum=checksum)
+                    report["png_strategy"] = strategy
+                elif fm == "PNG":
+                    image = image.convert("P", palette=Image.ADAPTIVE)
             image = cls.crop(image, box=box)
             image = cls.resize(image, max_width, max_height)
             image.info = {}
-            if not filename and not isinstance(filename, str):
-                filename = str(
-                    cls.get_identifier(fp.filename if isinstance(fp, _Image) else fp)
+            if strategy:
+                image = cls.apply_png_strategy(image, strategy)
+
+            buf, quality, search = cls.encode_quality(
+                image,
+                fm,
+                quality_mode,
+                lossless=bool(strategy) and strategy["strategy"] != "lossy",
+            )
+        if search:
+            report["quality_search"] = search
+        report["quality"] = quality
+        report["optimized_size"] = buf.tell()
+        if (
+            box is None
+            and not filename
+            and image.size == origin_size
+            and size
+            and buf.tell() > size * (1 - min_saving)
+        ):
+            LOGGER.info("Optimized image is not smaller, keep the original.")
+            report.update(action="kept_original", reason="not_smaller")
+            if cache_key:
+                optimizer_cache.put(cache_key, {"report": report})
+            return image, path
+
+        if not filename and not isinstance(filename, str):
+            filename = str(
+                UUID(hex=checksum)
+                if checksum
+                else cls.get_identifier(fp.filename if isinstance(fp, _Image) else fp)
+            )
+
+        report["action"] = "optimized"
+        # The stored file no longer matches the upload checksum.
+        report["checksum"] = get_md5_checksum(buf.getvalue())
+        if cache_key:
+            optimizer_cache.put(cache_key, {"report": report}, buf.getvalue(), ext)
+
+        def write(save_path: str):
+            with open(save_path, "wb") as f:
+                f.write(buf.getbuffer())
+
+        _, path = cls.store(fp, filename + ext, upload_to, remove_origin, write)
+        return image, path
+
+    @classmethod
+    def store(
+        cls, fp: _ImageFile, filename: str, upload_to: str, remove_origin: bool, write
+    ) -> tuple[str, str]:
+        """Write the optimized image and delete the original.
+
+        Args:
+          fp: Original file path or file object.
+          filename: File name of the optimized image.
+          upload_to: Upload dir.
+          remove_origin: Delete the original image.
+          write: Callable writing the optimized image to a save path.
+
+        Returns:
+          The Tuple: save path, path.
+        """
+
+        save_path, path = get_paths(filename, upload_to=upload_to)
+        write(save_path)
+        if remove_origin:
+            LOGGER.info("Proceed to delete the original image file.")
+            if isinstance(fp, (FieldFile, ImageFieldFile)):
+                if filename not in fp.name:
+                    fp.delete(save=False)
+            else:
+                origin_fp = (
+                    getattr(fp, "name", None)
+                    if isinstance(fp, (BytesIO, BufferedReader))
+                    else fp
                 )
+                if origin_fp and isinstance(origin_fp, str) and path not in origin_fp:
+                    safe_remove_file(origin_fp)
+        return save_path, path
+
+    @classmethod
+    def encode(
+        cls, image: _Image, fm: str, quality: int, lossless: bool = False
+    ) -> BytesIO:
+        buf = BytesIO()
+        image.save(
+            buf,
+            fm,
+            optimize=True,
+            quality=quality,
+            compress_level=app_settings.image_optimizer.compress_level,
+            lossless=lossless,
+        )
+        return buf
+
+    @classmethod
+    def is_animated(cls, image: _Image) -> bool:
+        return bool(getattr(image, "is_animated", False))
+
+    @classmethod
+    def encode_animation(
+        cls,
+        image: _Image,
+        fm: str,
+        box: tuple[int, int, int, int] = None,
+        max_width: int = app_settings.image_optimizer.max_width,
+        max_height: int = app_settings.image_optimizer.max_height,
+    ) -> tuple[BytesIO, _Image, int]:
+        """Encode an animation frame by frame.
+
+        Frames are decoded, cropped and resized one at a time while the
+        writer consumes them, so an animated WebP output holds a single raw
+        frame in memory whatever the number of frames (the GIF and APNG
+        writers of Pillow keep every frame to compute their deltas).
+
+        Args:
+          image: Animated PIL image.
+          fm: Output format, WEBP, GIF or PNG (APNG).
+          box: The crop rectangle of every frame.
+          max_width: Max width of the frames.
+          max_height: Max height of the frames.
+
+        Returns:
+          The Tuple: encoded animation, first frame, number of frames.
+        """
+
+        LOGGER.info("Proceed to encode %s animation frames.", image.n_frames)
+        image.seek(0)
+        first = cls.resize(cls.crop(image.convert("RGBA"), box), max_width, max_height)
+        frames = _FrameSequence(image, first.size, box)
+        buf = BytesIO()
+        first.save(
+            buf,
+            fm,
+            save_all=True,
+            append_images=[frames],
+            duration=frames.durations,
+            loop=image.info.get("loop", 0),
+            optimize=True,
+            quality=app_settings.image_optimizer.quality,
+        )
+        return buf, first, len(frames.durations)
+
+    @classmethod
+    def get_png_strategy(
+        cls,
+        image: _Image,
+        fm: str,
+        *,
+        checksum: str = None,
+        max_colors: int = app_settings.image_optimizer.png_max_colors,
+        sample_size: int = app_settings.image_optimizer.png_sample_size,
+    ) -> dict:
+        """Choose how a PNG is encoded from a sample of its pixels.
+
+        The colors and the alpha of a nearest neighbour sample (no blended
+        colors) tell the content apart: graphics are candidates for a palette
+        (exact under ``max_colors``, quantized otherwise unless the alpha is
+        a gradient), photos for lossy WebP. Every candidate is encoded on the
+        sample and the smallest, scaled by the pixel ratio, wins. Decisions
+        are cached per checksum.
 
-            filename = filename + ext
-            save_path, path = get_paths(filename, upload_to=upload_to)
-            image.save(
-                save_path,
+        Args:
+          image: PIL image of the PNG source.
+          fm: Output format, PNG or WEBP.
+          checksum: MD5 checksum of the source, the key of the decision.
+          max_colors: Max colors of a palette.
+          sample_size: Max width/height of the sample.
+
+        Returns:
+          The decision: strategy (lossless, palette or lossy), colors of the
+          palette, sampled colors, alpha (none, binary or gradient) and the
+          predicted size.
+        """
+
+        cache_key = None
+        if checksum and optimizer_cache.enabled:
+            cache_key = optimizer_cache.get_key(
+                "png_strategy",
+                checksum,
                 fm,
-                optimize=True,
-                quality=app_settings.image_optimizer.quality,
-                compress_level=app_settings.image_optimizer.compress_level,
+                max_colors,
+                sample_size,
+                app_settings.image_optimizer.quality,
+                app_settings.image_optimizer.compress_level,
             )
+            entry = optimizer_cache.get(cache_key)
+            if entry:
+                return entry["decision"]
 
-            if remove_origin:
-                LOGGER.info("Proceed to delete the original image file.")
-                if isinstance(fp, (FieldFile, ImageFieldFile)):
-                    if filename not in fp.name:
-                        fp.delete(save=False)
-                else:
-                    origin_fp = (
-                        getattr(fp, "name", None)
-                        if isinstance(fp, (BytesIO, BufferedReader))
-                        else fp
-                    )
-                    if (
-                        origin_fp
-                        and isinstance(origin_fp, str)
-                        and path not in origin_fp
-                    ):
-                        safe_remove_file(origin_fp)
+        mode = (
+            "RGBA"
+            if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            else "RGB"
+        )
+        ratio = min(sample_size / max(image.size), 1)
+        sample = image.resize(
+            (max(int(image.width * ratio), 1), max(int(image.height * ratio), 1)),
+            Image.NEAREST,
+        ).convert(mode)
+        scale = (image.width * image.height) / (sample.width * sample.height)
+
+        alpha = "none"
+        if mode == "RGBA":
+            histogram = sample.getchannel("A").histogram()
+            if sum(histogram[1:255]):
+                alpha = "gradient"
+            elif histogram[0]:
+                alpha = "binary"
+        colors = sample.getcolors(maxcolors=max_colors * 16)
+        colors = len(colors) if colors else None  # None: photo like.
+
+        candidates = {"lossless": None}
+        if colors is not None and (colors <= max_colors or alpha != "gradient"):
+            candidates["palette"] = min(colors, max_colors)
+        if colors is None and fm in cls._lossy_formats:
+            candidates["lossy"] = None
+
+        predicted = {}
+        for strategy, palette in candidates.items():
+            decision = {"strategy": strategy, "colors": palette}
+            buf = cls.encode(
+                cls.apply_png_strategy(sample, decision),
+                fm,
+                app_settings.image_optimizer.quality,
+                lossless=strategy != "lossy",
+            )
+            predicted[strategy] = int(buf.tell() * scale)
+
+        strategy = min(predicted, key=predicted.get)
+        decision = {
+            "strategy": strategy,
+            "colors": candidates[strategy],
+            "sampled_colors": colors,
+            "alpha": alpha,
+            "predicted_size": predicted[strategy],
+        }
+        if cache_key:
+            optimizer_cache.put(cache_key, {"decision": decision})
+        return decision
+
+    @classmethod
+    def apply_png_strategy(cls, image: _Image, decision: dict) -> _Image:
+        """Convert an image for the strategy of ``get_png_strategy``."""
+
+        if decision["strategy"] != "palette":
+            return image
+
+        if image.mode == "P" and len(image.getcolors(256) or ()) <= decision["colors"]:
+            return image
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            return image.convert("RGBA").quantize(
+                decision["colors"], method=Image.Quantize.FASTOCTREE
+            )
+        return image.convert("RGB").quantize(decision["colors"])
+
+    @classmethod
+    def encode_quality(
+        cls, image: _Image, fm: str, quality_mode: str, lossless: bool = False
+    ) -> tuple[BytesIO, int, dict]:
+        """Encode an image at the quality of the given mode.
+
+        In ``size`` mode an output over the budget is searched again once,
+        with the budget corrected by the ratio of the actual size to the
+        size predicted from the proxy.
+
+        Returns:
+          The Tuple: encoded image, quality, search parameters (empty in fixed mode).
+        """
+
+        if quality_mode == "fixed" or fm not in cls._lossy_formats or lossless:
+            quality = app_settings.image_optimizer.quality
+            return cls.encode(image, fm, quality, lossless), quality, {}
+
+        search = cls.search_quality(image, fm, mode=quality_mode)
+        buf = cls.encode(image, fm, search["quality"])
+        target_size = search.get("target_size")
+        if (
+            quality_mode == "size"
+            and buf.tell() > target_size
+            and search["quality"] > search["min_quality"]
+        ):
+            ratio = buf.tell() / max(search["predicted_size"], 1)
+            search = cls.search_quality(
+                image, fm, mode=quality_mode, target_size=int(target_size / ratio)
+            )
+            search["target_size"] = target_size
+            buf = cls.encode(image, fm, search["quality"])
+        search.pop("predicted_size")
+        search.pop("min_quality")
+        return buf, search["quality"], search
+
+    @classmethod
+    def get_similarity(cls, a: Image.Image, b: Image.Image, block: int = 8) -> float:
+        """Mean SSIM of the luma of two images of the same size, over blocks.
+
+        The block statistics are computed by Pillow (box downscales of the
+        float images and their products), only the per-block formula runs in
+        Python.
+        """
+
+        a, b = a.convert("L").convert("F"), b.convert("L").convert("F")
+        size = (max(a.width // block, 1), max(a.height // block, 1))
+
+        def mean(image):
+            return list(image.resize(size, Image.BOX).getdata())
+
+        def product(x, y):
+            return ImageMath.lambda_eval(lambda args: args["x"] * args["y"], x=x, y=y)
+
+        c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+        total = 0.0
+        for ma, mb, aa, bb, ab in zip(
+            mean(a),
+            mean(b),
+            mean(product(a, a)),
+            mean(product(b, b)),
+            mean(product(a, b)),
+        ):
+            va, vb, cov = aa - ma * ma, bb - mb * mb, ab - ma * mb
+            total += ((2 * ma * mb + c1) * (2 * cov + c2)) / (
+                (ma * ma + mb * mb + c1) * (va + vb + c2)
+            )
+        return total / (size[0] * size[1])
+
+    @classmethod
+    def search_quality(
+        cls,
+        image: _Image,
+        fm: str,
+        *,
+        mode: str = app_settings.image_optimizer.quality_mode,
+        target_size: int = app_settings.image_optimizer.target_size,
+        target_similarity: float = app_settings.image_optimizer.target_similarity,
+        min_quality: int = app_settings.image_optimizer.min_quality,
+        max_quality: int = app_settings.image_optimizer.max_quality,
+        proxy_size: int = app_settings.image_optimizer.proxy_size,
+    ) -> dict:
+        """Binary search the encoder quality of an image.
+
+        Trial encodes run in memory on a downscaled proxy of the image. In
+        ``size`` mode the highest quality whose size, scaled by the pixel
+        ratio of the proxy, fits ``target_size`` is chosen; in
+        ``similarity`` mode the lowest quality whose decoded proxy has an
+        SSIM of at least ``target_similarity``.
+
+        Args:
+          image: PIL image, resized to its output size.
+          fm: Output format, JPEG or WEBP.
+          mode: size or similarity.
+          target_size: Byte budget of the output.
+          target_similarity: Min SSIM of the output.
+          min_quality: Lower bound of the search.
+          max_quality: Upper bound of the search.
+          proxy_size: Max width/height of the proxy.
+
+        Returns:
+          The search parameters: mode, quality, trials, the target and the
+          predicted size or the similarity of the chosen quality.
+        """
+
+        proxy = image.copy()
+        proxy.thumbnail((proxy_size, proxy_size), Image.BOX)
+        scale = (image.width * image.height) / max(proxy.width * proxy.height, 1)
+        trials = {}
+
+        def trial(quality: int) -> tuple[int, float]:
+            if quality not in trials:
+                buf = cls.encode(proxy, fm, quality)
+                size, similarity = int(buf.tell() * scale), 0.0
+                if mode == "similarity":
+                    buf.seek(0)
+                    with Image.open(buf) as decoded:
+                        similarity = cls.get_similarity(proxy, decoded)
+                trials[quality] = (size, similarity)
+            return trials[quality]
+
+        def is_acceptable(quality: int) -> bool:
+            size, similarity = trial(quality)
+            if mode == "size":
+                return size <= target_size
+            return similarity >= target_similarity
+
+        # size: the highest acceptable quality, similarity: the lowest one.
+        lo, hi = min_quality, max_quality
+        quality = min_quality if mode == "size" else max_quality
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if is_acceptable(mid):
+                quality = mid
+                lo, hi = (mid + 1, hi) if mode == "size" else (lo, mid - 1)
+            else:
+                lo, hi = (lo, mid - 1) if mode == "size" else (mid + 1, hi)
+
+        size, similarity = trial(quality)
+        search = {
+            "mode": mode,
+            "quality": quality,
+            "trials": len(trials),
+            "min_quality": min_quality,
+            "predicted_size": size,
+        }
+        if mode == "size":
+            search["target_size"] = target_size
         else:
-            LOGGER.error("Image format not supported.")
-        return image, path
+            search.update(
+                target_similarity=target_similarity, similarity=round(similarity, 4)
+            )
+        return search
 
     @classmethod
     def crop(cls, image: _Image, box: tuple[int, int, int, int] = None) -> _Image:
@@ -240,19 +841,257 @@ class ImageOptimizer(BaseOptimizer):
         """
         LOGGER.info("Proceed to reduce image size")
 
-        w, h = image.size
+        size = cls.get_fit_size(image.size, width, height)
+        if size != image.size:
+            return image.resize(size, Image.LANCZOS)
+        return image
+
+    @classmethod
+    def get_fit_size(
+        cls, size: tuple[int, int], width: int, height: int
+    ) -> tuple[int, int]:
+        w, h = size
         aspect_ratio = w / h
 
         if w > width or h > height:
             if aspect_ratio > 1:
-                nw = width
-                nh = int(width / aspect_ratio)
-            else:
-                nh = height
-                nw = int(height * aspect_ratio)
+                return width, int(width / aspect_ratio)
+            return int(height * aspect_ratio), height
+        return size
 
-            return image.resize((nw, nh), Image.LANCZOS)
-        return image
+    @classmethod
+    def get_memory(cls, image: _Image) -> int:
+        """Raw size in bytes of a decoded image (or frame), from its header."""
+
+        if image.mode in ("1", "L", "P"):
+            depth = 1
+        elif image.mode.startswith("I;16"):
+            depth = 2
+        else:
+            depth = 4  # Pillow stores multiband pixels in 32 bits.
+        return image.width * image.height * depth
+
+    @classmethod
+    def reduce(
+        cls,
+        image: _Image,
+        box: tuple[int, int, int, int] = None,
+        width: int = app_settings.image_optimizer.max_width,
+        height: int = app_settings.image_optimizer.max_height,
+        max_memory: int = app_settings.image_optimizer.max_memory,
+    ) -> None | _Image:
+        """Prepare the decoding of an image within max_memory.
+
+        JPEGs are drafted to the output size (DCT scaling), images over
+        max_memory are decoded by bands, see ``decode_reduced``.
+
+        Returns:
+          The image, a reduced copy (the original is closed), None if it
+          cannot be decoded within max_memory.
+        """
+
+        if box is None and isinstance(image, JpegImageFile):
+            image.draft(image.mode, cls.get_fit_size(image.size, width, height))
+        if cls.get_memory(image) <= max_memory:
+            return image
+
+        reduced = None
+        if box is None and not cls.is_animated(image):
+            reduced = cls.decode_reduced(image, width, height, max_memory)
+        if reduced is not None:
+            cls.close(image)
+        return reduced
+
+    @classmethod
+    def get_thumbnail_key(
+        cls,
+        checksum: str,
+        width: int,
+        height: int,
+        to_webp: bool = app_settings.thumbnail.to_webp,
+    ) -> str:
+        return thumbnail_cache.get_key(
+            "thumbnail",
+            checksum,
+            width,
+            height,
+            to_webp,
+            app_settings.thumbnail.quality,
+        )
+
+    @classmethod
+    def get_thumbnail(
+        cls,
+        fp: _File,
+        checksum: str,
+        width: int,
+        height: int,
+        to_webp: bool = app_settings.thumbnail.to_webp,
+    ) -> None | dict:
+        """Thumbnail of an image from the thumbnail cache, created on a miss.
+
+        The (first frame of the) image is resized with ``resize``, within
+        the pixel and memory limits of the optimizer. Concurrent misses decode the
+        image once, see ``FileCache.get_or_create``.
+
+        Args:
+          fp: File path or file object of the image.
+          checksum: MD5 checksum of the stored image, ``content_checksum``.
+          width: Max width of the thumbnail.
+          height: Max height of the thumbnail.
+          to_webp: Encode the thumbnail as webp.
+
+        Returns:
+          The metadata: width, height, format, content type and the path (or
+          data) of the thumbnail. None if the image is not supported or too
+          large to be decoded.
+
+        Raises:
+          OptimizerError: The image has more than max_pixels pixels.
+        """
+
+        def create():
+            try:
+                image = cls.open(fp)
+            except Image.DecompressionBombError as e:
+                raise OptimizerError(str(e))
+            fm, ext = cls.get_format(image, to_webp) if image else (None, None)
+            if not fm:
+                return None
+
+            try:
+                if image.width * image.height > app_settings.image_optimizer.max_pixels:
+                    raise OptimizerError(
+                        "Image is too large: %sx%s pixels." % image.size
+                    )
+                reduced = cls.reduce(image, None, width, height)
+                if reduced is None:
+                    return None
+
+                image = reduced
+                thumbnail = image.convert("RGBA") if image.mode == "P" else image
+                thumbnail = cls.resize(thumbnail, width, height)
+                buf = cls.encode(thumbnail, fm, app_settings.thumbnail.quality)
+            finally:
+                cls.close(image)
+            meta = {
+                "width": thumbnail.width,
+                "height": thumbnail.height,
+                "format": fm,
+                "content_type": Image.MIME[fm],
+            }
+            return meta, buf.getvalue(), ext
+
+        key = cls.get_thumbnail_key(checksum, width, height, to_webp)
+        return thumbnail_cache.get_or_create(key, create)
+
+    @classmethod
+    def get_bands(cls, image: _Image, rows: int) -> None | list[list[tuple]]:
+        """Split the tiles of an image into bands of at most ``rows`` rows.
+
+        Images stored as several tiles or strips (e.g. uncompressed TIFF) are
+        grouped by rows, a single uncompressed tile is cut by row offsets.
+
+        Returns:
+          The tiles of each band, relative to the top of the whole image,
+          None if the image cannot be decoded by parts.
+        """
+
+        tiles = image.tile
+        if len(tiles) == 1 and tiles[0][0] == "raw":
+            decoder, (x0, y0, x1, y1), offset, args = tiles[0][:4]
+            rawmode, stride, ystep = (
+                (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            )
+            if ystep != 1:
+                return None
+
+            try:
+                stride = stride or len(
+                    Image.new(image.mode, (x1 - x0, 1)).tobytes("raw", rawmode)
+                )
+            except (ValueError, OSError):
+                return None
+            tiles = [
+                (
+                    decoder,
+                    (x0, top, x1, min(top + rows, y1)),
+                    offset + (top - y0) * stride,
+                    (rawmode, stride, 1),
+                )
+                for top in range(y0, y1, rows)
+            ]
+        if len(tiles) < 2:
+            return None
+
+        rows_tiles = {}
+        for tile in tiles:
+            rows_tiles.setdefault((tile[1][1], tile[1][3]), []).append(tile)
+        bands, band, top = [], [], 0
+        for y0, y1 in sorted(rows_tiles):
+            if band and y1 - top > rows:
+                bands.append(band)
+                band, top = [], y0
+            band.extend(rows_tiles[(y0, y1)])
+        bands.append(band)
+        return bands
+
+    @classmethod
+    def decode_reduced(
+        cls,
+        image: _Image,
+        width: int = app_settings.image_optimizer.max_width,
+        height: int = app_settings.image_optimizer.max_height,
+        max_memory: int = app_settings.image_optimizer.max_memory,
+    ) -> None | _Image:
+        """Decode and downscale an image band by band.
+
+        Every band of ``get_bands``, at most ``max_memory`` decoded, is
+        loaded from a shallow copy of the image file and resized into the output,
+        so the whole raster is never held in memory.
+
+        Args:
+          image: PIL image, not loaded.
+          width: Max width of the output.
+          height: Max height of the output.
+          max_memory: Max raw size of a decoded band.
+
+        Returns:
+          PIL image fitting width and height, None if the image cannot be decoded by parts.
+        """
+
+        w, h = image.size
+        rows = max(max_memory // max(cls.get_memory(image) // h, 1), 1)
+        bands = cls.get_bands(image, rows)
+        if bands is None:
+            return None
+
+        LOGGER.info("Proceed to decode image in %s bands.", len(bands))
+        size = cls.get_fit_size(image.size, width, height)
+        output = None
+        for tiles in bands:
+            top, bottom = tiles[0][1][1], max(tile[1][3] for tile in tiles)
+            # A shallow copy sharing the file, Image.copy would decode it all.
+            band = object.__new__(type(image))
+            band.__dict__.update(image.__dict__, _exclusive_fp=False)
+            band._size = (w, bottom - top)
+            band.tile = [
+                (t[0], (t[1][0], t[1][1] - top, t[1][2], t[1][3] - top)) + tuple(t[2:])
+                for t in tiles
+            ]
+            band.load()
+            if output is None:
+                output = Image.new(band.mode, size)
+            dst_top, dst_bottom = top * size[1] // h, bottom * size[1] // h
+            if dst_bottom > dst_top:
+                output.paste(
+                    band.resize((size[0], dst_bottom - dst_top), Image.LANCZOS),
+                    (0, dst_top),
+                )
+            del band
+
+        output.format = image.format
+        return output
 
 
 MapOptimizer = {TypeChoices.IMAGE: ImageOptimizer}
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import os
+import socket
+import sys
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from .utils import get_contiguous_size, get_logger
+
+
+if TYPE_CHECKING:
+    from .typed import File
+
+LOGGER = get_logger(__name__)
+
+OWNER_KEY = "_processors_owner"  # Metadata key of the worker parsing an upload.
+
+
+class ProcessorError(ValueError):
+    """The content of the upload is rejected by a processor."""
+
+
+class BaseProcessor:
+    """Base Stream Processor
+
+    Receive the bytes of an upload in order, chunk after chunk, and keep the
+    parser state in between. ``feed`` raises ``ProcessorError`` to fail the
+    upload, ``close`` returns the metadata stored in ``FileManager.metadata``.
+    """
+
+    name = None  # Metadata key of the result.
+
+    def __init__(self, file_obj: File):
+        self.extension = str(file_obj.extension or "").lower()
+
+    def feed(self, data: bytes) -> None:
+        pass
+
+    def get_skip_size(self) -> int:
+        """Number of upcoming bytes the processor does not need to see."""
+
+        return 0
+
+    def skip(self, size: int) -> None:
+        """Drop the next bytes instead of feeding them, see ``get_skip_size``."""
+
+    def close(self) -> dict:
+        return {}
+
+
+class ProcessorSession:
+    """Processors of one upload and the number of bytes they consumed."""
+
+    def __init__(self, processors: list[BaseProcessor]):
+        self.processors = processors
+        self.position = 0
+        self.lock = threading.Lock()
+
+
+class SessionRegistry:
+    """In-process LRU of the processor sessions, keyed by file path.
+
+    Sessions are per process: the parser state cannot be shared between the
+    workers of a server, see ``process`` for how the replays are bounded.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._sessions: OrderedDict[str, ProcessorSession] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, factory=None) -> None | ProcessorSession:
+        """The session of a key, created with factory when given."""
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                if factory is None:
+                    return None
+                session = self._sessions[key] = factory()
+                while len(self._sessions) > self.max_size:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(key)
+            return session
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+
+registry = SessionRegistry()
+
+
+def get_owner() -> str:
+    """Identifier of this worker process."""
+
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+def close(processors: list[BaseProcessor]) -> dict:
+    metadata = {}
+    for processor in processors:
+        result = processor.close()
+        if result and processor.name:
+            metadata[processor.name] = result
+    return metadata
+
+
+def process_file(
+    file_obj: File, classes: list, fp, buffer_size: int = 1024 * 1024
+) -> dict:
+    """Run the processors over a complete file object, e.g. a bundled file.
+
+    Returns:
+      The metadata of the processors.
+
+    Raises:
+      ProcessorError: The content is rejected.
+    """
+
+    processors = [c(file_obj) for c in classes]
+    fp.seek(0)
+    while data := fp.read(buffer_size):
+        for processor in processors:
+            processor.feed(data)
+        if all(p.get_skip_size() == sys.maxsize for p in processors):
+            break
+    fp.seek(0)
+    return close(processors)
+
+
+def process(
+    file_obj: File,
+    classes: list,
+    final: bool = False,
+    buffer_size: int = 1024 * 1024,
+    min_skip_size: int = 1024 * 64,
+    max_replay_size: int = 1024 * 1024 * 16,
+) -> dict:
+    """Feed the contiguous bytes written so far to the processors of an upload.
+
+    The chunk just written is read back from the page cache, so the
+    processors see the decoded bytes in order even when chunks arrive out of
+    order or compressed.
+
+    The session lives in the process of the worker that created it, its
+    owner is recorded in the upload metadata (``session_metadata``). Chunks
+    received by another worker, or by the owner once its session was
+    evicted past ``max_replay_size`` bytes, are not parsed: the final chunk
+    resumes the session, or replays the file once. The bytes parsed stay
+    within twice the file size whatever the number of workers, invalid
+    content of such uploads is only found on completion.
+
+    Args:
+      file_obj: File of the upload.
+      classes: Processor classes.
+      final: The upload is complete, close the processors.
+      buffer_size: Read size.
+      min_skip_size: Seek over the bytes no processor needs from this size.
+      max_replay_size: Max bytes replayed to rebuild a session before the final chunk.
+
+    Returns:
+      The metadata of the processors when final, otherwise an empty dict.
+
+    Raises:
+      ProcessorError: The content is rejected.
+    """
+
+    if not classes:
+        return {}
+
+    key, owner = file_obj.save_path, get_owner()
+    session = registry.get(key)
+    if not final:
+        current_owner = file_obj._extra_metadata.get(OWNER_KEY)
+        if current_owner not in (None, owner):
+            registry.pop(key)
+            return {}
+        if session is None:
+            if get_contiguous_size(file_obj.parts_path) > max_replay_size:
+                return {}
+        file_obj._extra_metadata[OWNER_KEY] = owner
+    else:
+        file_obj._extra_metadata.pop(OWNER_KEY, None)
+
+    if session is None:
+        session = registry.get(
+            key, lambda: ProcessorSession([c(file_obj) for c in classes])
+        )
+    with session.lock:
+        try:
+            if final:
+                end = os.path.getsize(key)
+            else:
+                end = get_contiguous_size(file_obj.parts_path)
+
+            if end > session.position:
+                with open(key, "rb") as f:
+                    f.seek(session.position)
+                    while session.position < end:
+                        skip = min(p.get_skip_size() for p in session.processors)
+                        skip = min(skip, end - session.position)
+                        if skip >= min_skip_size:
+                            # e.g. the mdat box of a video, not read back at all.
+                            for processor in session.processors:
+                                processor.skip(skip)
+                            session.position += skip
+                            f.seek(session.position)
+                            continue
+
+                        data = f.read(min(buffer_size, end - session.position))
+                        if not data:
+                            break
+                        for processor in session.processors:
+                            processor.feed(data)
+                        session.position += len(data)
+
+            if not final:
+                return {}
+
+            metadata = close(session.processors)
+            registry.pop(key)
+            return metadata
+        except ProcessorError:
+            registry.pop(key)
+            raise
+        except OSError as e:
+            registry.pop(key)
+            LOGGER.warning("Cannot process file: %s, %s", key, e)
+            return {}
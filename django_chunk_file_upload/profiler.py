@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import cProfile
+import os
+import random
+import re
+import tempfile
+from typing import Any, Callable
+
+from django.utils import timezone
+
+from .utils import create_dir, get_logger, make_md5_hash, safe_remove_file
+
+
+LOGGER = get_logger(__name__)
+
+
+class SamplingProfiler:
+    """Sampling Profiler
+
+    Profile a configurable fraction of requests with cProfile and dump the
+    results as pstats files into a rotating directory.
+    """
+
+    extension = ".pstats"
+
+    def __init__(
+        self,
+        sample_rate: float = 0,
+        output_dir: str = None,
+        max_files: int = 1000,
+    ):
+        self.sample_rate = float(sample_rate or 0)
+        self.max_files = int(max_files or 0)
+        self._output_dir = output_dir
+
+    @classmethod
+    def from_settings(cls, settings) -> "SamplingProfiler":
+        return cls(
+            sample_rate=settings.sample_rate,
+            output_dir=settings.output_dir,
+            max_files=settings.max_files,
+        )
+
+    @property
+    def output_dir(self) -> str:
+        if not self._output_dir:
+            self._output_dir = os.path.join(
+                tempfile.gettempdir(), "django_chunk_file_upload", "profiles"
+            )
+        return self._output_dir
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def profile(
+        self,
+        func: Callable,
+        *args,
+        tags: Callable[[], dict] = None,
+        **kwargs,
+    ) -> Any:
+        """Run the function under cProfile and dump the stats.
+
+        Args:
+          func: Function to profile.
+          tags: Callable returning the tags used to name the pstats file,
+            evaluated after the function returns.
+
+        Returns:
+          The return value of the function.
+        """
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            try:
+                self.dump(profile, **(tags() if tags else {}))
+            except Exception as e:
+                LOGGER.warning("Cannot dump profile: %s", e)
+
+    def dump(self, profile: cProfile.Profile, **tags) -> str:
+        create_dir(self.output_dir)
+        now = timezone.now()
+        parts = [now.strftime("%Y%m%dT%H%M%S")]
+        for k, v in tags.items():
+            if v is not None and v != "":
+                parts.append("%s_%s" % (k, re.sub(r"[^\w.]+", "_", str(v))))
+
+        parts.append(make_md5_hash(now.isoformat(), os.getpid(), random.random())[:8])
+        fp = os.path.join(self.output_dir, "-".join(parts) + self.extension)
+        profile.dump_stats(fp)
+        self.rotate()
+        return fp
+
+    def rotate(self) -> None:
+        if self.max_files <= 0:
+            return
+
+        entries = [
+            entry
+            for entry in os.scandir(self.output_dir)
+            if entry.is_file() and entry.name.endswith(self.extension)
+        ]
+        if len(entries) > self.max_files:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[: len(entries) - self.max_files]:
+                safe_remove_file(entry.path)
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from .constants import TypeChoices
+
+
+HEADER_SIZE = 1024 * 8  # Bytes of the first chunk inspected.
+
+
+@dataclass(frozen=True)
+class Signature:
+    """Magic bytes of a format: (offset, bytes) parts that must all match."""
+
+    type: TypeChoices
+    mimetype: str
+    parts: tuple[tuple[int, bytes], ...]
+    extensions: tuple[str, ...]
+
+    def match(self, data: bytes) -> bool:
+        return all(data[i : i + len(magic)] == magic for i, magic in self.parts)
+
+    @property
+    def length(self) -> int:
+        return sum(len(magic) for _, magic in self.parts)
+
+
+SIGNATURES = (
+    # Images
+    Signature(
+        TypeChoices.IMAGE, "image/png", ((0, b"\x89PNG\r\n\x1a\n"),), (".png", ".apng")
+    ),
+    Signature(
+        TypeChoices.IMAGE, "image/jpeg", ((0, b"\xff\xd8\xff"),), (".jpg", ".jpeg")
+    ),
+    Signature(TypeChoices.IMAGE, "image/gif", ((0, b"GIF87a"),), (".gif",)),
+    Signature(TypeChoices.IMAGE, "image/gif", ((0, b"GIF89a"),), (".gif",)),
+    Signature(
+        TypeChoices.IMAGE, "image/webp", ((0, b"RIFF"), (8, b"WEBP")), (".webp",)
+    ),
+    Signature(TypeChoices.IMAGE, "image/bmp", ((0, b"BM"),), (".bmp",)),
+    Signature(TypeChoices.IMAGE, "image/tiff", ((0, b"II*\x00"),), (".tif", ".tiff")),
+    Signature(TypeChoices.IMAGE, "image/tiff", ((0, b"MM\x00*"),), (".tif", ".tiff")),
+    Signature(
+        TypeChoices.IMAGE,
+        "image/vnd.microsoft.icon",
+        ((0, b"\x00\x00\x01\x00"),),
+        (".ico",),
+    ),
+    Signature(TypeChoices.IMAGE, "image/avif", ((4, b"ftypavif"),), (".avif",)),
+    # Audio
+    Signature(TypeChoices.AUDIO, "audio/wav", ((0, b"RIFF"), (8, b"WAVE")), (".wav",)),
+    Signature(TypeChoices.AUDIO, "audio/mpeg", ((0, b"ID3"),), (".mp3",)),
+    # 11-bit frame sync, MPEG 1/2/2.5 (01 is reserved), layer III, with or
+    # without CRC: the checks of ``media.MP3Extractor.parse_frame_header``.
+    *(
+        Signature(TypeChoices.AUDIO, "audio/mpeg", ((0, bytes((0xFF, b1))),), (".mp3",))
+        for b1 in (0xE2, 0xE3, 0xF2, 0xF3, 0xFA, 0xFB)
+    ),
+    Signature(TypeChoices.AUDIO, "audio/aac", ((0, b"\xff\xf1"),), (".aac",)),
+    Signature(TypeChoices.AUDIO, "audio/aac", ((0, b"\xff\xf9"),), (".aac",)),
+    Signature(TypeChoices.AUDIO, "audio/midi", ((0, b"MThd"),), (".mid", ".midi")),
+    Signature(
+        TypeChoices.AUDIO,
+        "audio/ogg",
+        ((0, b"OggS"),),
+        (".oga", ".ogg", ".opus", ".weba"),
+    ),
+    # Video
+    Signature(
+        TypeChoices.VIDEO, "video/x-msvideo", ((0, b"RIFF"), (8, b"AVI ")), (".avi",)
+    ),
+    Signature(
+        TypeChoices.VIDEO,
+        "video/mp4",
+        ((4, b"ftyp"),),
+        (".mp4", ".m4a", ".m4v", ".mov", ".3gp", ".3g2", ".3gpp", ".3gpp2", ".avif"),
+    ),
+    Signature(
+        TypeChoices.VIDEO,
+        "video/webm",
+        ((0, b"\x1a\x45\xdf\xa3"),),
+        (".webm", ".weba", ".mkv"),
+    ),
+    Signature(
+        TypeChoices.VIDEO, "video/mpeg", ((0, b"\x00\x00\x01\xba"),), (".mpeg", ".mpg")
+    ),
+    # Documents
+    Signature(TypeChoices.DOCUMENT, "application/pdf", ((0, b"%PDF-"),), (".pdf",)),
+    # Fonts
+    Signature(TypeChoices.FONT, "font/woff", ((0, b"wOFF"),), (".woff",)),
+    Signature(TypeChoices.FONT, "font/woff2", ((0, b"wOF2"),), (".woff2",)),
+    Signature(TypeChoices.FONT, "font/otf", ((0, b"OTTO"),), (".otf",)),
+    Signature(TypeChoices.FONT, "font/ttf", ((0, b"\x00\x01\x00\x00"),), (".ttf",)),
+    # Archives and containers
+    Signature(
+        TypeChoices.ARCHIVE,
+        "application/zip",
+        ((0, b"PK\x03\x04"),),
+        (".zip", ".jar", ".docx", ".xlsx", ".pptx", ".odt", ".odp", ".epub"),
+    ),
+    Signature(
+        TypeChoices.ARCHIVE,
+        "application/zip",
+        ((0, b"PK\x05\x06"),),
+        (".zip", ".jar", ".docx", ".xlsx", ".pptx", ".odt", ".odp", ".epub"),
+    ),
+    Signature(TypeChoices.ARCHIVE, "application/gzip", ((0, b"\x1f\x8b"),), (".gz",)),
+    Signature(
+        TypeChoices.ARCHIVE, "application/x-bzip2", ((0, b"BZh"),), (".bz", ".bz2")
+    ),
+    Signature(
+        TypeChoices.ARCHIVE, "application/vnd.rar", ((0, b"Rar!\x1a\x07"),), (".rar",)
+    ),
+    Signature(
+        TypeChoices.ARCHIVE,
+        "application/x-7z-compressed",
+        ((0, b"7z\xbc\xaf\x27\x1c"),),
+        (".7z",),
+    ),
+    Signature(TypeChoices.ARCHIVE, "application/x-tar", ((257, b"ustar"),), (".tar",)),
+    Signature(
+        TypeChoices.BINARY,
+        "application/x-ole-storage",
+        ((0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"),),
+        (".doc", ".xls", ".ppt"),
+    ),
+)
+
+# Index of the signatures by their first 2 bytes at offset 0, the others are
+# checked for every file; the longest match wins.
+_INDEX: dict[bytes, list[Signature]] = {}
+_UNINDEXED: list[Signature] = []
+for _signature in SIGNATURES:
+    _offset, _magic = _signature.parts[0]
+    if _offset == 0 and len(_magic) >= 2:
+        _INDEX.setdefault(_magic[:2], []).append(_signature)
+    else:
+        _UNINDEXED.append(_signature)
+
+# Extensions whose content must match one of their signatures.
+SIGNED_EXTENSIONS = frozenset(
+    extension for signature in SIGNATURES for extension in signature.extensions
+)
+
+TEXT_TYPES = frozenset(
+    (
+        TypeChoices.HYPERTEXT,
+        TypeChoices.JSON,
+        TypeChoices.SEPARATED,
+        TypeChoices.SOURCE_CODE,
+        TypeChoices.TEXT,
+        TypeChoices.XML,
+    )
+)
+
+
+def get_signatures(data: bytes) -> list[Signature]:
+    """Signatures matching the leading bytes of a file, longest first."""
+
+    candidates = _INDEX.get(bytes(data[:2]), [])
+    matched = [s for s in (*candidates, *_UNINDEXED) if s.match(data)]
+    return sorted(matched, key=lambda s: s.length, reverse=True)
+
+
+def sniff(data: bytes) -> None | Signature:
+    """Find the signature of the leading bytes of a file."""
+
+    signatures = get_signatures(data)
+    return signatures[0] if signatures else None
+
+
+_CONTROL_BYTES = bytes(set(range(32)) - {9, 10, 12, 13, 27})
+
+
+def is_text(data: bytes) -> bool:
+    """Text in any ASCII-compatible encoding, or UTF-16 with a BOM."""
+
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return True
+    if b"\x00" in data:
+        return False
+    control = len(data) - len(data.translate(None, _CONTROL_BYTES))
+    return control <= len(data) // 100
+
+
+def check(
+    extension: str, type: TypeChoices, data: bytes
+) -> tuple[bool, None | Signature]:
+    """Whether the leading bytes of a file are consistent with its extension.
+
+    Text types must decode as UTF-8 without NUL bytes, extensions with known
+    magic bytes must match one of their signatures, other files are accepted.
+
+    Args:
+      extension: File extension, e.g. ".jpg".
+      type: File type from the extension.
+      data: Leading bytes of the file, see ``HEADER_SIZE``.
+
+    Returns:
+      The Tuple: consistent, detected signature.
+    """
+
+    extension = str(extension or "").lower()
+    signatures = get_signatures(data)
+    signature = signatures[0] if signatures else None
+    if type in TEXT_TYPES:
+        return is_text(data), signature
+    if extension in SIGNED_EXTENSIONS:
+        for matched in signatures:
+            if extension in matched.extensions:
+                return True, matched
+        return False, signature
+    return True, signature
@@ -2,12 +2,25 @@ let uploadFiles = [];
 let uploadURL = window.location.href;
 let uploadChunkSize = 2097152;  // 2MB
 let placeholderIcon = 'https://placehold.co/60x60';
+let registerURL = null;
+let bundleURL = null;
+let bundleMaxFileSize = 0;  // 0: disabled
+let bundleMaxFiles = 100;
+let contentEncoding = null;  // gzip or deflate, null: disabled
+let compressWorker = null;
+let compressRequests = {};
+const compressedTypes = /^(text\/|application\/(json|ld\+json|xml|xhtml\+xml|csv)|[^\/]+\/[^\/]+\+(json|xml))/;
+const compressedExtensions = /\.(csv|tsv|json|jsonld|xml|html|htm)$/i;
 
 class ChunkUploaded {
-    constructor(URL = null, chunkSize = null, placeholderIcon = null) {
+    constructor(URL = null, chunkSize = null, placeholderIcon = null, registerURL = null, bundleURL = null, bundleMaxFileSize = null, contentEncoding = null) {
         this.URL = URL
         this.chunkSize = chunkSize
         this.placeholderIcon = placeholderIcon
+        this.registerURL = registerURL
+        this.bundleURL = bundleURL
+        this.bundleMaxFileSize = bundleMaxFileSize
+        this.contentEncoding = contentEncoding
     }
 
     init() {
@@ -26,6 +39,16 @@ class ChunkUploaded {
         if (this.placeholderIcon && this.placeholderIcon === 'string') {
             placeholderIcon = this.placeholderIcon;
         }
+        if (this.registerURL && typeof this.registerURL === 'string') {
+            registerURL = this.registerURL;
+        }
+        if (this.bundleURL && typeof this.bundleURL === 'string') {
+            bundleURL = this.bundleURL;
+            bundleMaxFileSize = parseInt(this.bundleMaxFileSize) || 0;
+        }
+        if (['gzip', 'deflate'].includes(this.contentEncoding) && typeof CompressionStream !== 'undefined') {
+            contentEncoding = this.contentEncoding;
+        }
     }
 }
 
@@ -33,29 +56,82 @@ function getFormData(evt) {
     return new FormData($(evt.target)[0]);
 }
 
+function isCompressedFile(file) {
+    return !!contentEncoding && (compressedTypes.test(file.type) || compressedExtensions.test(file.name));
+}
+
+function getCompressWorker() {
+    if (compressWorker === null && typeof Worker !== 'undefined') {
+        const source = `self.onmessage = async (e) => {
+            try {
+                const stream = e.data.blob.stream().pipeThrough(new CompressionStream(e.data.encoding));
+                const buffer = await new Response(stream).arrayBuffer();
+                self.postMessage({id: e.data.id, buffer: buffer}, [buffer]);
+            } catch (error) {
+                self.postMessage({id: e.data.id, buffer: null});
+            }
+        };`;
+        compressWorker = new Worker(URL.createObjectURL(new Blob([source], {type: 'text/javascript'})));
+        compressWorker.onmessage = function (e) {
+            compressRequests[e.data.id](e.data.buffer);
+            delete compressRequests[e.data.id];
+        };
+    }
+    return compressWorker;
+}
+
+function compressChunk(file, blob) {
+    // Compress text chunks off the main thread, resolve null to send the raw chunk.
+    if (!isCompressedFile(file)) {
+        return Promise.resolve(null);
+    }
+
+    const worker = getCompressWorker();
+    const done = (buffer) => (buffer && buffer.byteLength < blob.size) ? new Blob([buffer]) : null;
+    if (!worker) {
+        const stream = blob.stream().pipeThrough(new CompressionStream(contentEncoding));
+        return new Response(stream).arrayBuffer().then(done, () => null);
+    }
+
+    return new Promise((resolve) => {
+        const id = Math.random().toString(36).slice(2);
+        compressRequests[id] = (buffer) => resolve(done(buffer));
+        worker.postMessage({id: id, blob: blob, encoding: contentEncoding});
+    });
+}
+
 function uploadFile(evt, file, chunkFrom = 0, chunkSize = 2097152) {
-    let isEOF = 'false';
     let chunkTo = chunkFrom + chunkSize + 1;
     let blob = file.slice(chunkFrom, chunkTo);
+    compressChunk(file, blob).then(function (compressed) {
+        sendChunk(evt, file, chunkFrom, chunkSize, blob, compressed);
+    });
+}
+
+function sendChunk(evt, file, chunkFrom, chunkSize, blob, compressed) {
+    let isEOF = 'false';
+    let chunkTo = chunkFrom + chunkSize + 1;
     if (chunkTo >= file.size) {
         isEOF = 'true';
     }
     let formData = getFormData(evt);
     formData.append('action', $(evt.originalEvent.submitter).attr('name'));
-    formData.append('file', blob, file.name);
+    formData.append('file', compressed || blob, file.name);
+    let headers = {
+        "X-CSRFToken": getDjangoCookie(),
+        "X-File-ID": getHiddenInputChecksum(),
+        "X-File-Name": file.name,
+        "X-File-Checksum": file.checksum,
+        "X-File-Chunk-From": chunkFrom,
+        "X-File-Chunk-Size": chunkSize,
+        "X-File-Chunk-To": chunkTo,
+        "X-File-EOF": isEOF,
+        "X-File-Size": file.size,
+        "X-File-MimeType": file.type,
+        "X-File-Content-Encoding": compressed ? contentEncoding : "identity",
+    };
     $.ajaxSetup({
-        headers: {
-            "X-CSRFToken": getDjangoCookie(),
-            "X-File-ID": getHiddenInputChecksum(),
-            "X-File-Name": file.name,
-            "X-File-Checksum": file.checksum,
-            "X-File-Chunk-From": chunkFrom,
-            "X-File-Chunk-Size": chunkSize,
-            "X-File-Chunk-To": chunkTo,
-            "X-File-EOF": isEOF,
-            "X-File-Size": file.size,
-            "X-File-MimeType": file.type,
-        }
+        headers: headers
     });
 
     $.ajax({
@@ -99,13 +175,7 @@ function uploadFile(evt, file, chunkFrom = 0, chunkSize = 2097152) {
                 uploadFile(evt, file, chunkTo, chunkSize);
             } else {
                 updateStatus(file.checksum, response.message, 'success');
-                 [...$('.file-item')].forEach((node) => {
-                    if (node.id === file.checksum) {
-                        const viewedObj = $(node).find('.viewed a');
-                        viewedObj.attr('href', response.url);
-                        viewedObj.removeClass('hide');
-                    }
-                });
+                updateViewedURL(file.checksum, response.url);
             }
         }
     });
@@ -179,6 +249,101 @@ function deleteFile() {
     });
 }
 
+function registerFiles(evt, files, callback) {
+    if (!registerURL || files.length === 0 || evt.originalEvent.submitter.name !== '_add') {
+        callback(null);
+        return;
+    }
+    $.ajax({
+        url: registerURL,
+        type: 'POST',
+        dataType: 'json',
+        cache: false,
+        contentType: 'application/json',
+        headers: {"X-CSRFToken": getDjangoCookie()},
+        data: JSON.stringify({
+            files: files.map((file) => ({
+                name: file.name,
+                size: file.size,
+                mimetype: file.type,
+                checksum: file.checksum,
+            }))
+        }),
+        error: function () {
+            callback(null);
+        },
+        success: function (response) {
+            const results = {};
+            (response.files || []).forEach((result) => {
+                results[result.checksum] = result;
+            });
+            callback(results);
+        }
+    });
+}
+
+function isBundledFile(evt, file) {
+    return !!bundleURL && bundleMaxFileSize > 0 && file.size <= bundleMaxFileSize && evt.originalEvent.submitter.name === '_add';
+}
+
+function uploadBundle(files) {
+    let formData = new FormData();
+    formData.append('manifest', JSON.stringify(files.map((file) => ({
+        name: file.name,
+        size: file.size,
+        mimetype: file.type,
+        checksum: file.checksum,
+    }))));
+    files.forEach((file) => {
+        formData.append('file', file, file.name);
+        updateStatus(file.checksum, 'Starting to upload...', 'warning');
+    });
+
+    $.ajax({
+        xhr: function () {
+            const xhr = new XMLHttpRequest();
+            xhr.upload.addEventListener('progress', function (e) {
+                if (e.lengthComputable) {
+                    const percent = Math.round((e.loaded / e.total) * 100);
+                    files.forEach((file) => updateProgressBar(file.checksum, percent));
+                }
+            });
+            return xhr;
+        },
+        url: bundleURL,
+        type: 'POST',
+        dataType: 'json',
+        cache: false,
+        processData: false,
+        contentType: false,
+        headers: {"X-CSRFToken": getDjangoCookie()},
+        data: formData,
+        error: function (response) {
+            let errorMessage = response.statusText;
+            if (response.responseJSON) {
+                errorMessage = response.responseJSON.message;
+            }
+            files.forEach((file) => {
+                updateStatus(file.checksum, errorMessage, 'danger');
+                updateProgressBar(file.checksum, 100, '#dc3545');
+            });
+            toastr.error(`Failed to upload ${files.length} files.`);
+        },
+        success: function (response) {
+            (response.files || []).forEach((result) => {
+                if (result.status === 'created' || result.status === 'completed') {
+                    updateStatus(result.checksum, result.message, 'success');
+                    updateProgressBar(result.checksum, 100);
+                    updateViewedURL(result.checksum, result.url);
+                } else {
+                    updateStatus(result.checksum, result.message, 'danger');
+                    updateProgressBar(result.checksum, 100, '#dc3545');
+                }
+            });
+        }
+    });
+}
+
 function startUpload(evt) {
     preventDefaults(evt);
     if (evt.originalEvent.submitter.name === '_delete') {
@@ -187,12 +352,31 @@ function startUpload(evt) {
         if ($(evt.target).find(getHiddenInput()).length && uploadFiles.length > 0) {
             let submitButton = $('button[type=submit]');
             submitButton.addClass('disabled');
-            uploadFiles.forEach((file, i) => {
-                console.log(`start upload file[${i}].name = ${file.name}`);
-                updateStatus(file.checksum, 'Starting to upload...', 'warning');
-                uploadFile(evt, file);
+            const bundledFiles = uploadFiles.filter((file) => isBundledFile(evt, file));
+            for (let i = 0; i < bundledFiles.length; i += bundleMaxFiles) {
+                uploadBundle(bundledFiles.slice(i, i + bundleMaxFiles));
+            }
+            const files = uploadFiles.filter((file) => !isBundledFile(evt, file));
+            registerFiles(evt, files, function (results) {
+                files.forEach((file, i) => {
+                    const result = results ? results[file.checksum] : null;
+                    if (result && result.status === 'completed') {
+                        updateStatus(file.checksum, result.message, 'success');
+                        updateProgressBar(file.checksum, 100);
+                        updateViewedURL(file.checksum, result.url);
+                        return;
+                    }
+                    if (result && result.status === 'invalid') {
+                        updateStatus(file.checksum, result.message, 'danger');
+                        updateProgressBar(file.checksum, 100, '#dc3545');
+                        return;
+                    }
+                    console.log(`start upload file[${i}].name = ${file.name}`);
+                    updateStatus(file.checksum, 'Starting to upload...', 'warning');
+                    uploadFile(evt, file, result ? result.offset || 0 : 0);
+                });
+                submitButton.removeClass('disabled');
             });
-            submitButton.removeClass('disabled');
         }
     }
 }
@@ -367,6 +551,16 @@ function updateStatus(checksum, msg, mode = 'danger') {
     });
 }
 
+function updateViewedURL(checksum, url) {
+    [...$('.file-item')].forEach((node) => {
+        if (node.id === checksum) {
+            const viewedObj = $(node).find('.viewed a');
+            viewedObj.attr('href', url);
+            viewedObj.removeClass('hide');
+        }
+    });
+}
+
 function updateProgressBar(checksum, percent, backgroundColor = '#0d6efd') {
     let progressBar = $(`#${checksum} .progress-bar`);
     progressBar.attr('style', `width: ${percent}%; background-color: ${backgroundColor} !important;`);
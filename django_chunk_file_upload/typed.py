@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from dataclasses import asdict, dataclass, field, fields
 from re import match
 from typing import Any, Union
@@ -11,13 +12,18 @@ from django.core.files.uploadedfile import (
 )
 from django.utils.translation import gettext_lazy as _
 
+from .app_settings import app_settings
 from .constants import TypeChoices
 from .optimize import MapOptimizer
 from .utils import (
+    ContentDecoder,
+    append_range,
+    copy_file_range,
     get_file_extension,
     get_file_path,
     get_save_file_path,
     make_uuid,
+    safe_remove_file,
 )
 
 
@@ -115,7 +121,10 @@ class BaseFile:
         ),
         TypeChoices.XML: ("xml",),
     }
+    # Metadata keys carried from chunk to chunk of an upload, see ``restore``.
+    session_metadata = ("content_type", "_processors_owner")
     _accepted_mime_types: list = field(default_factory=lambda: [".*/*"])
+    _extra_metadata: dict = field(default_factory=dict)
     _id: UUID = None
     _user: Any = None
     _file: Any = None
@@ -129,6 +138,7 @@ class BaseFile:
     chunk_from: str = None
     chunk_size: str = None
     chunk_to: str = None
+    content_encoding: str = None
     eof: bool = False
     mimetype: str = None
     name: str = None
@@ -173,6 +183,11 @@ class BaseFile:
     def save_path(self) -> str:
         return get_save_file_path(self.path, self._upload_to)
 
+    @property
+    def parts_path(self) -> str:
+        """Written ranges of an incomplete upload, see ``get_contiguous_size``."""
+        return self.save_path + ".parts"
+
     @property
     def extension(self) -> str:
         if self._extension is None and self.filename:
@@ -219,6 +234,7 @@ class BaseFile:
             X-File-EOF: True is upload completed, otherwise.
             X-File-Size: Original file size.
             X-File-MimeType: MINE type of file.
+            X-File-Content-Encoding: gzip, deflate or br when the chunk is compressed.
 
         Reference: django_chunk_file_upload/static/js/upload.chunk.js
 
@@ -265,16 +281,42 @@ class BaseFile:
         ret = cls(**kwargs)
         return ret
 
+    @classmethod
+    def get_extension_types(cls) -> dict:
+        """Extension to type lookup, built once per class from ``common_types``."""
+
+        extension_types = cls.__dict__.get("_extension_types")
+        if extension_types is None:
+            extension_types = {}
+            for common_type, extensions in cls.common_types.items():
+                for extension in extensions:
+                    extension = "." + extension.lower().lstrip(".")
+                    extension_types.setdefault(extension, common_type)
+            cls._extension_types = extension_types
+        return extension_types
+
     def _get_type(self, extension: str) -> TypeChoices:
-        for common_type, extensions in self.common_types.items():
-            if str(extension).lower() in extensions:
-                return common_type
-        return TypeChoices.__empty__
+        return self.get_extension_types().get(
+            str(extension).lower(), TypeChoices.__empty__
+        )
+
+    def restore(self, metadata: dict) -> None:
+        """Restore the session state saved by the previous chunks of the upload."""
+
+        for key in self.session_metadata:
+            if metadata and key in metadata:
+                self._extra_metadata.setdefault(key, metadata[key])
 
     def is_valid(self) -> bool:
         if not (self.checksum and self.mimetype and self.file):
             return False
 
+        return self.is_accepted_mime_type()
+
+    def is_accepted_mime_type(self) -> bool:
+        if not self.mimetype:
+            return False
+
         for pattern in self._accepted_mime_types:
             if match(pattern, self.mimetype):
                 return True
@@ -285,18 +327,152 @@ class BaseFile:
         return asdict(self)
 
     def to_metadata(self) -> dict:
-        return self.to_response().copy()
+        metadata = self.to_response().copy()
+        metadata.update(self._extra_metadata)
+        return metadata
+
+    def to_fields(self) -> dict:
+        """Values of the indexed columns of ``FileManagerMixin``."""
+
+        try:
+            size = int(self.size)
+        except (TypeError, ValueError):
+            size = None
+        return {
+            "filename": (self.filename or self.name or "")[:255],
+            "size": size,
+            "mimetype": (self.mimetype or "")[:255],
+        }
 
     def to_response(self) -> dict:
         metadata = {k: v for k, v in self.to_dict().items() if not k.startswith("_")}
         metadata["message"] = str(self.message)
-        metadata["name"] = self.filename
+        metadata["name"] = self.filename or self.name
         return metadata
 
+    @property
+    def offset(self) -> None | int:
+        try:
+            return int(self.chunk_from)
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def total_size(self) -> None | int:
+        """Declared size of the whole file (``X-File-Size``), None if invalid."""
+
+        try:
+            size = int(self.size)
+        except (TypeError, ValueError):
+            return None
+        return size if size >= 0 else None
+
+    def check_range(self, offset: int, length: int) -> None:
+        """Check that bytes written at offset stay within the declared size.
+
+        Raises:
+          ValueError: The range is outside of the file, or its size is unknown.
+        """
+
+        size = self.total_size
+        if size is None or offset < 0 or offset + length > size:
+            raise ValueError(_("The chunk is outside of the file size."))
+
+    def is_valid_range(self) -> bool:
+        """Whether the uploaded chunk fits in the file, before it is written.
+
+        The decoded length of a compressed chunk is unknown, it is bounded
+        while decoding, see ``get_max_decoded_size``.
+        """
+
+        length = 0 if self.is_encoded or not self.file else self.file.size
+        try:
+            self.check_range(self.offset or 0, length)
+        except ValueError:
+            return False
+        return True
+
+    @property
+    def read_size(self) -> None | int:
+        try:
+            return int(self.chunk_size) or None
+        except (TypeError, ValueError):
+            return None
+
     def write(self, mode: str = "ab+"):
-        with open(self.save_path, mode) as fp:
-            for chunk in self.file.chunks(self.chunk_size):
+        """Write the uploaded chunk at its offset (or truncate the file first).
+
+        The chunk is written at ``chunk_from``, or at the end of the file when
+        the offset is missing, so chunks may arrive in any order. The ranges
+        of an incomplete upload are recorded to resume it after the last
+        contiguous byte.
+
+        When Django spooled the chunk to a ``TemporaryUploadedFile`` the bytes
+        are copied from the temporary file inside the kernel, otherwise (or
+        when the kernel copy is unavailable) they are copied through Python.
+        Compressed chunks (``content_encoding``) are decoded as a stream, the
+        offsets refer to the decoded bytes.
+        """
+
+        flags = os.O_WRONLY | os.O_CREAT
+        if "w" in mode:
+            flags |= os.O_TRUNC
+            safe_remove_file(self.parts_path)
+
+        with open(os.open(self.save_path, flags, 0o666), "wb") as fp:
+            offset = self.offset
+            if offset is None:
+                offset = os.fstat(fp.fileno()).st_size
+            self.check_range(offset, 0 if self.is_encoded else self.file.size)
+            if self.is_encoded:
+                size = self._write_decoded(fp, offset)
+            else:
+                size = self._write_raw(fp, offset)
+
+        if not self.eof:
+            append_range(self.parts_path, offset, offset + size)
+
+    def _write_raw(self, fp, offset: int) -> int:
+        copied = 0
+        if isinstance(self.file, TemporaryUploadedFile):
+            with open(self.file.temporary_file_path(), "rb") as src:
+                copied = copy_file_range(
+                    src.fileno(), fp.fileno(), self.file.size, offset
+                )
+
+        if copied < self.file.size:
+            fp.seek(offset + copied)
+            self.file.seek(copied)
+            while chunk := self.file.read(self.read_size or 65536):
                 fp.write(chunk)
+        return self.file.size
+
+    @property
+    def is_encoded(self) -> bool:
+        return str(self.content_encoding or "identity").lower() != "identity"
+
+    def get_max_decoded_size(self, offset: int) -> int:
+        """Decompression guard: ratio limit, chunk size and remaining file size."""
+
+        max_size = self.file.size * app_settings.compression.max_ratio
+        if self.read_size:
+            max_size = min(max_size, self.read_size + 1)
+        max_size = min(max_size, (self.total_size or 0) - offset)
+        return max(max_size, 0)
+
+    def _write_decoded(self, fp, offset: int) -> int:
+        encoding = str(self.content_encoding).strip().lower()
+        if encoding not in app_settings.compression.encodings:
+            raise ValueError("Unsupported content encoding: %s" % encoding)
+
+        decoder = ContentDecoder(encoding, self.get_max_decoded_size(offset))
+        fp.seek(offset)
+        self.file.seek(0)
+        while chunk := self.file.read(65536):
+            for data in decoder.decode(chunk):
+                fp.write(data)
+        fp.write(decoder.flush())
+        return decoder.size
 
     def optimize(self, instance):
         optimizer_class = MapOptimizer.get(self.type, None)
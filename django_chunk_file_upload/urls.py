@@ -2,10 +2,26 @@ from __future__ import annotations
 
 from django.urls import path
 
-from .views import ChunkedUploadView
+from .views import (
+    ChunkedBundleUploadView,
+    ChunkedDeltaView,
+    ChunkedDownloadView,
+    ChunkedListView,
+    ChunkedRegisterView,
+    ChunkedThumbnailView,
+    ChunkedUploadView,
+)
 
 
 app_name = "django_chunk_file_upload"
 urlpatterns = [
+    path("files/", ChunkedListView.as_view(), name="files"),
     path("uploads/", ChunkedUploadView.as_view(), name="uploads"),
+    path("uploads/register/", ChunkedRegisterView.as_view(), name="uploads-register"),
+    path("uploads/bundle/", ChunkedBundleUploadView.as_view(), name="uploads-bundle"),
+    path("uploads/delta/", ChunkedDeltaView.as_view(), name="uploads-delta"),
+    path("downloads/<str:checksum>/", ChunkedDownloadView.as_view(), name="downloads"),
+    path(
+        "thumbnails/<str:checksum>/", ChunkedThumbnailView.as_view(), name="thumbnails"
+    ),
 ]
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import atexit
 import hashlib
 import json
 import logging
 import os
+import queue
 import shutil
+import zlib
 from io import BufferedReader, BytesIO
-from typing import Union
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterator, Union
 from uuid import UUID
 
 from django.conf import settings
@@ -18,21 +22,71 @@ from django.db.models.fields.files import FieldFile, ImageFieldFile
 from django.utils import timezone
 
 
-FORMAT = "%(levelname)s:%(asctime)s:%(name)s:%(funcName)s:%(lineno)d >>> %(message)s"
-DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PACKAGE_LOGGER = "django_chunk_file_upload"
+
+_QUEUE_LISTENER: QueueListener | None = None
+
+logging.getLogger(PACKAGE_LOGGER).addHandler(logging.NullHandler())
 
 
 def _attr_to_str(*args, **kwargs) -> str:
     return ":".join([str(arg) for arg in args] + [json.dumps(kwargs, default=str)])
 
 
-def get_logger(name: str = __name__, level: int | str = logging.INFO) -> logging.Logger:
-    logging.basicConfig(format=FORMAT, datefmt=DATE_FORMAT, level=level)
+def get_logger(name: str = __name__, level: int | str = None) -> logging.Logger:
+    """Get a package logger.
+
+    Handlers, format and level are left to the host project's ``LOGGING``
+    config; ``level`` is only applied when given explicitly.
+    """
+
     logger = logging.getLogger(name)
-    logger.setLevel(level)
+    if level is not None:
+        logger.setLevel(level)
     return logger
 
 
+def setup_queue_logging(name: str = PACKAGE_LOGGER) -> None | QueueListener:
+    """Hand package log records to a ``QueueHandler``.
+
+    The handlers configured for the package logger (or the root handlers
+    when there are none) are moved to a ``QueueListener`` thread, so
+    formatting and disk/stdout I/O no longer block request threads.
+    Nothing is changed without handlers, the records keep propagating to
+    ``logging.lastResort``.
+
+    Returns:
+      The running QueueListener, None without handlers.
+    """
+
+    global _QUEUE_LISTENER
+    if _QUEUE_LISTENER is not None:
+        return _QUEUE_LISTENER
+
+    logger = logging.getLogger(name)
+    handlers = [h for h in logger.handlers if not isinstance(h, logging.NullHandler)]
+    if not handlers:
+        handlers = list(logging.getLogger().handlers)
+    if not handlers:
+        return None
+
+    log_queue = queue.SimpleQueue()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+    _QUEUE_LISTENER = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _QUEUE_LISTENER.start()
+    atexit.register(_QUEUE_LISTENER.stop)
+    return _QUEUE_LISTENER
+
+
 def make_md5_hash(*args, **kwargs) -> str:
     return hashlib.md5(_attr_to_str(*args, **kwargs).encode("utf-8")).hexdigest()
 
@@ -41,6 +95,16 @@ def make_uuid(*args, **kwargs) -> UUID:
     return UUID(hex=make_md5_hash(*args, **kwargs))
 
 
+def is_sampled(key: str, rate: float) -> bool:
+    """Deterministic sampling: the same key is always sampled or never."""
+
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return int(make_md5_hash(key)[:8], 16) < rate * 0xFFFFFFFF
+
+
 def remove_dir(dir_path: str) -> None:
     try:
         shutil.rmtree(dir_path)
@@ -116,6 +180,187 @@ def join_file_path(*args: str) -> str:
     return os.path.join(*args)
 
 
+def copy_file_range(src_fd: int, dst_fd: int, count: int, offset: int = 0) -> int:
+    """Copy bytes between two file descriptors inside the kernel.
+
+    Use ``os.copy_file_range`` and fall back to ``os.sendfile``, so the data
+    never crosses user space.
+
+    Args:
+      src_fd: Source file descriptor, copied from offset 0.
+      dst_fd: Destination file descriptor.
+      count: Number of bytes to copy.
+      offset: Destination offset.
+
+    Returns:
+      The number of bytes copied, it can be less than count (or 0) when the
+      kernel copy is unavailable; the caller copies the rest.
+    """
+
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < count:
+                size = os.copy_file_range(
+                    src_fd,
+                    dst_fd,
+                    count - copied,
+                    offset_src=copied,
+                    offset_dst=offset + copied,
+                )
+                if not size:
+                    break
+                copied += size
+            return copied
+        except OSError:
+            pass
+
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(dst_fd, offset + copied, os.SEEK_SET)
+            while copied < count:
+                size = os.sendfile(dst_fd, src_fd, copied, count - copied)
+                if not size:
+                    break
+                copied += size
+        except OSError:
+            pass
+    return copied
+
+
+def append_range(fp: str, start: int, end: int) -> None:
+    """Record a written byte range [start, end) of an upload.
+
+    Lines are appended with O_APPEND, so concurrent chunk requests never
+    interleave their records.
+    """
+
+    fd = os.open(fp, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+    try:
+        os.write(fd, b"%d %d\n" % (start, end))
+    finally:
+        os.close(fd)
+
+
+def get_contiguous_size(fp: str, default: int = 0) -> int:
+    """Size of the contiguous prefix from offset 0 of the recorded ranges.
+
+    Chunks uploaded in parallel can complete out of order, a resumed upload
+    must start at the first gap rather than at the end of the file.
+    """
+
+    try:
+        with open(fp, "rb") as f:
+            ranges = sorted(
+                tuple(map(int, line.split()[:2]))
+                for line in f
+                if len(line.split()) >= 2
+            )
+    except (OSError, ValueError):
+        return default
+
+    size = 0
+    for start, end in ranges:
+        if start > size:
+            break
+        size = max(size, end)
+    return size
+
+
+def merge_metadata(current: dict, loaded: dict, metadata: dict) -> dict:
+    """Apply the changes from loaded to metadata over the current metadata.
+
+    The keys set, changed or removed since the metadata was loaded are
+    applied, the other keys keep their current value, e.g. written by a
+    concurrent request in the meantime.
+    """
+
+    merged = dict(current)
+    for key in loaded:
+        if key not in metadata:
+            merged.pop(key, None)
+    for key, value in metadata.items():
+        if key not in loaded or loaded[key] != value:
+            merged[key] = value
+    return merged
+
+
+class ContentDecoder:
+    """Incremental decoder of a compressed chunk body.
+
+    The output is bounded by ``max_size``, the decoder stops as soon as it is
+    exceeded, so a decompression bomb never reaches the disk or the memory.
+    For br the bound needs ``brotli`` >= 1.2 (``output_buffer_limit``), older
+    versions are fed 256 bytes at a time and one piece may decode past
+    ``max_size`` before the check.
+
+    Args:
+      encoding: gzip, deflate (zlib) or br (requires ``brotli``).
+      max_size: Max decoded size in bytes.
+
+    Raises:
+      ValueError: Unsupported encoding, invalid or oversized data.
+    """
+
+    def __init__(self, encoding: str, max_size: int):
+        self.encoding = str(encoding or "").strip().lower()
+        self.max_size = max_size
+        self.size = 0
+        if self.encoding in ("gzip", "x-gzip"):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            self._obj = zlib.decompressobj()
+        elif self.encoding == "br" and brotli is not None:
+            self._obj = brotli.Decompressor()
+        else:
+            raise ValueError("Unsupported content encoding: %s" % encoding)
+
+    def _check(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ValueError("Decoded chunk exceeds %s bytes." % self.max_size)
+        return data
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            if self.encoding == "br" and hasattr(self._obj, "can_accept_more_data"):
+                # The input left over by the output limit is kept by brotli.
+                while True:
+                    yield self._check(
+                        self._obj.process(
+                            data, output_buffer_limit=self.max_size - self.size + 1
+                        )
+                    )
+                    if self._obj.can_accept_more_data() or self._obj.is_finished():
+                        return
+                    data = b""
+
+            if self.encoding == "br":
+                # No output limit before brotli 1.2, feed small pieces instead.
+                for i in range(0, len(data), 256):
+                    yield self._check(self._obj.process(data[i : i + 256]))
+                return
+
+            while data:
+                yield self._check(
+                    self._obj.decompress(data, self.max_size - self.size + 1)
+                )
+                data = self._obj.unconsumed_tail
+        except (zlib.error, getattr(brotli, "error", zlib.error)) as e:
+            raise ValueError("Invalid %s data: %s" % (self.encoding, e))
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            finished = self._obj.is_finished()
+            data = b""
+        else:
+            data = self._check(self._obj.flush())
+            finished = self._obj.eof
+        if not finished:
+            raise ValueError("Truncated %s data." % self.encoding)
+        return data
+
+
 def handle_upload_file(file, upload_dir: str = None):
     save_fp, fp = get_paths(file.name, upload_dir)
     with open(save_fp, "wb+") as f:
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import re
+from xml.parsers import expat
+
+from .constants import TypeChoices
+from .processors import BaseProcessor, ProcessorError
+
+
+class BaseValidator(BaseProcessor):
+    """Base Validator"""
+
+    name = "validation"
+
+    def __init__(self, file_obj):
+        super().__init__(file_obj)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        return self._decoder.decode(data, final)
+
+
+class CSVValidator(BaseValidator):
+    """CSV Validator
+
+    Detect the dialect on the first lines and check that every record has the
+    same number of columns. Every chunk is cut at its last line break outside
+    quotes (by quote parity) and its complete records are parsed at once.
+    """
+
+    delimiters = ",;\t|"
+    sample_size = 1024 * 64
+    sample_lines = 20  # Detect the dialect once the sample has this many lines.
+
+    def __init__(self, file_obj):
+        super().__init__(file_obj)
+        self.dialect = None
+        self.columns = None
+        self.rows = 0
+        self.line = 0
+        self._sample = ""
+        self._tail = ""
+
+    def get_dialect(self, sample: str):
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=self.delimiters)
+        except csv.Error:
+            dialect = csv.excel_tab if self.extension == ".tsv" else csv.excel
+            return dialect
+
+    def feed(self, data: bytes) -> None:
+        text = self.decode(data)
+        if self.dialect is None:
+            self._sample += text
+            if (
+                len(self._sample) < self.sample_size
+                and self._sample.count("\n") < self.sample_lines
+            ):
+                return
+            text, self._sample = self._sample, ""
+            self.dialect = self.get_dialect(text[: self.sample_size])
+        self._feed(text)
+
+    def _feed(self, text: str, final: bool = False) -> None:
+        text = self._tail + text
+        quotechar = self.dialect.quotechar or '"'
+        end = len(text) if final else text.rfind("\n") + 1
+        quotes = text.count(quotechar, 0, end)
+        if final and quotes % 2:
+            raise ProcessorError("Invalid CSV: unterminated quoted field.")
+
+        # Back off to the last line break outside quotes.
+        while end and quotes % 2:
+            start = text.rfind("\n", 0, end - 1) + 1
+            quotes -= text.count(quotechar, start, end)
+            end = start
+
+        block, self._tail = text[:end], text[end:]
+        if block:
+            self.check(block)
+            self.line += block.count("\n")
+
+    def check(self, block: str) -> None:
+        """Check the column count of the complete records of a block."""
+
+        try:
+            lengths = list(map(len, self.reader(block)))
+        except csv.Error as e:
+            raise ProcessorError("Invalid CSV at line %s: %s" % (self.line + 1, e))
+
+        if self.columns is None:
+            self.columns = next((n for n in lengths if n), None)
+        if set(lengths) - {0, self.columns}:
+            reader = self.reader(block)
+            for row in reader:
+                if row and len(row) != self.columns:
+                    raise ProcessorError(
+                        "Invalid CSV at line %s: expected %s columns, got %s."
+                        % (self.line + reader.line_num, self.columns, len(row))
+                    )
+        self.rows += len(lengths) - lengths.count(0)
+
+    def reader(self, block: str):
+        return csv.reader(io.StringIO(block, newline=""), self.dialect)
+
+    def close(self) -> dict:
+        text = self.decode(b"", True)
+        if self.dialect is None:
+            text, self._sample = self._sample + text, ""
+            self.dialect = self.get_dialect(text[: self.sample_size])
+        self._feed(text, final=True)
+        return {
+            "rows": self.rows,
+            "columns": self.columns or 0,
+            "delimiter": self.dialect.delimiter,
+        }
+
+
+class JSONValidator(BaseValidator):
+    """JSON Validator
+
+    Tokenize the top level array and decode its elements one by one, or the
+    top level values of JSON Lines, so a document of any size is validated
+    with the memory of its largest record. Records larger than
+    ``max_record_size`` are tokenized as well.
+    """
+
+    _whitespace = re.compile(r"[ \t\n\r]*")
+    _number_chars = "0123456789.eE+-"
+    max_record_size = 1024 * 1024
+    lookahead = 16  # Errors this close to the end of the buffer may be cut tokens.
+
+    def __init__(self, file_obj):
+        super().__init__(file_obj)
+        self._decoder_json = json.JSONDecoder()
+        self._buf = ""
+        self._offset = 0  # Characters consumed before the buffer, for errors.
+        self._stack = []  # Expected tokens: value, key, colon, separator.
+        self.records = 0
+
+    def feed(self, data: bytes) -> None:
+        self._buf += self.decode(data)
+        self._parse(final=False)
+
+    def close(self) -> dict:
+        self._buf += self.decode(b"", True)
+        self._parse(final=True)
+        if self._stack:
+            raise ProcessorError("Invalid JSON: unexpected end of data.")
+        return {"records": self.records}
+
+    def error(self, pos: int, message: str):
+        raise ProcessorError(
+            "Invalid JSON at character %s: %s" % (self._offset + pos, message)
+        )
+
+    def _decode(self, pos: int, final: bool):
+        """Decode the value at pos, return (value, end) or None if incomplete."""
+
+        try:
+            value, end = self._decoder_json.raw_decode(self._buf, pos)
+        except json.JSONDecodeError as e:
+            if not final and (
+                len(self._buf) - e.pos < self.lookahead
+                or e.msg.startswith("Unterminated")
+            ):
+                # A token may be cut by the end of the chunk, wait for more.
+                return None
+            self.error(e.pos, e.msg)
+        if not final and (
+            end >= len(self._buf)
+            or isinstance(value, (int, float))
+            and self._buf[end] in self._number_chars
+            and len(self._buf) - end < self.lookahead
+        ):
+            # A number or literal may continue in the next chunk.
+            return None
+        return value, end
+
+    def _parse(self, final: bool) -> None:
+        buf, pos = self._buf, 0
+        while True:
+            pos = self._whitespace.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+
+            char = buf[pos]
+            state = self._stack[-1] if self._stack else None
+            if state in (None, "value", "first"):
+                if state == "first" and char in "]}":
+                    self._stack.pop()
+                    self._close_container()
+                    pos += 1
+                    continue
+                if state == "first" and self._stack[-2] == "object":
+                    self._stack[-1] = "key"
+                    continue
+                if char == "[" and state is None:
+                    self._open("array")
+                    pos += 1
+                    continue
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    if char in "[{" and len(buf) - pos > self.max_record_size:
+                        # Stream a record too large to be decoded at once.
+                        self._open("array" if char == "[" else "object")
+                        pos += 1
+                        continue
+                    break
+                pos = decoded[1]
+                self._value_done("array" if isinstance(decoded[0], list) else None)
+            elif state == "key":
+                if char != '"':
+                    self.error(pos, "Expecting property name enclosed in double quotes")
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    break
+                pos = decoded[1]
+                self._stack[-1] = "colon"
+            elif state == "colon":
+                if char != ":":
+                    self.error(pos, "Expecting ':' delimiter")
+                self._stack[-1] = "value"
+                pos += 1
+            elif state == "separator":
+                container = self._stack[-2]
+                if char == ",":
+                    self._stack[-1] = "key" if container == "object" else "value"
+                    pos += 1
+                elif char == ("}" if container == "object" else "]"):
+                    self._stack.pop()
+                    self._close_container()
+                    pos += 1
+                else:
+                    self.error(pos, "Expecting ',' delimiter")
+
+        self._offset += pos
+        self._buf = buf[pos:]
+
+    def _open(self, container: str) -> None:
+        self._stack.extend([container, "first"])
+
+    def _close_container(self) -> None:
+        container = self._stack.pop()
+        self._value_done(container)
+
+    def _value_done(self, container: str = None) -> None:
+        if not self._stack:
+            # A top level value, the elements of a top level array are the
+            # records instead.
+            if container != "array":
+                self.records += 1
+            return
+
+        if len(self._stack) == 2 and self._stack[0] == "array":
+            self.records += 1
+        self._stack[-1] = "separator"
+
+
+class XMLValidator(BaseValidator):
+    """XML Validator
+
+    Feed the bytes to an expat parser and count the elements and the records
+    (children of the root) from its callbacks, no tree is built. Entity
+    declarations are rejected (billion laughs).
+    """
+
+    def __init__(self, file_obj):
+        super().__init__(file_obj)
+        self._parser = expat.ParserCreate()
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.EntityDeclHandler = self._entity_decl
+        self._depth = 0
+        self.elements = 0
+        self.records = 0
+
+    def _start(self, name, attrs) -> None:
+        self._depth += 1
+
+    def _end(self, name) -> None:
+        self._depth -= 1
+        self.elements += 1
+        if self._depth == 1:
+            self.records += 1
+
+    def _entity_decl(self, name, *args) -> None:
+        raise ProcessorError("Invalid XML: entity declarations are not allowed.")
+
+    def parse(self, data: bytes, final: bool = False) -> None:
+        try:
+            self._parser.Parse(data, final)
+        except expat.ExpatError as e:
+            raise ProcessorError("Invalid XML: %s" % e)
+
+    def feed(self, data: bytes) -> None:
+        self.parse(data)
+
+    def close(self) -> dict:
+        self.parse(b"", True)
+        return {"elements": self.elements, "records": self.records}
+
+
+MapValidator = {
+    TypeChoices.SEPARATED: CSVValidator,
+    TypeChoices.JSON: JSONValidator,
+    TypeChoices.XML: XMLValidator,
+}
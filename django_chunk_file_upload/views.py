@@ -1,15 +1,45 @@
 from __future__ import annotations
 
-from django.db import IntegrityError
-from django.db.models import ManyToManyField, QuerySet
-from django.http import Http404, JsonResponse
+import copy
+import json
+import mimetypes
+import os
+import re
+from contextlib import nullcontext
+from datetime import datetime
+from io import BytesIO
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import ManyToManyField, Q, QuerySet
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotModified,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
+from django.utils.http import (
+    content_disposition_header,
+    urlsafe_base64_decode,
+    urlsafe_base64_encode,
+)
 from django.utils.translation import gettext_lazy as _
+from django.views.generic import View
 from django.views.generic.edit import FormView
 
+from . import delta, processors, sniff
 from .app_settings import app_settings
-from .constants import ActionChoices
+from .constants import ActionChoices, StatusChoices, TypeChoices
+from .dedup import ChunkStore, open_file
 from .forms import ChunkedUploadFileForm
+from .media import MapExtractor
 from .models import FileManager
+from .optimize import ImageOptimizer, MapOptimizer, OptimizerError
+from .profiler import SamplingProfiler
 from .typed import (
     ArchiveFile,
     AudioFile,
@@ -26,25 +56,25 @@ from .typed import (
     SeparatedFile,
     XMLFile,
 )
-from .utils import get_logger, get_md5_checksum
+from .utils import (
+    get_contiguous_size,
+    get_file_extension,
+    get_logger,
+    get_md5_checksum,
+    is_sampled,
+    merge_metadata,
+    safe_remove_file,
+)
+from .validators import MapValidator
 
 
 LOGGER = get_logger(__name__)
 
 
-class ChunkedUploadView(FormView):
-    """Chunked upload view."""
+class PermissionMixin:
+    """Permission Mixin for views."""
 
-    http_method_names = ["get", "post", "delete"]
-    chunk_size = app_settings.chunk_size
-    file_class = File
-    file_status = app_settings.status
-    form_class = ChunkedUploadFileForm
-    optimize = app_settings.optimize
     permission_classes = app_settings.permission_classes
-    remove_file_on_update = app_settings.remove_file_on_update
-    template_name = "django_chunk_file_upload/chunked_upload.html"
-    upload_to = app_settings.upload_to
 
     def check_object_permissions(self, request):
         for permission in self.permission_classes:
@@ -65,6 +95,50 @@ class ChunkedUploadView(FormView):
     def has_delete_permission(self, request, obj=None) -> bool:
         return self.check_object_permissions(request)
 
+
+class ChunkedUploadView(PermissionMixin, FormView):
+    """Chunked upload view."""
+
+    http_method_names = ["get", "post", "delete"]
+    chunk_size = app_settings.chunk_size
+    dedup = app_settings.dedup.enabled
+    dedup_min_file_size = app_settings.dedup.min_file_size
+    extract_media = app_settings.extract_media
+    file_class = File
+    file_status = app_settings.status
+    form_class = ChunkedUploadFileForm
+    log_chunks = app_settings.logging.chunks
+    log_sample_rate = app_settings.logging.sample_rate
+    optimize = app_settings.optimize
+    permission_classes = app_settings.permission_classes
+    profiler = SamplingProfiler.from_settings(app_settings.profiler)
+    remove_file_on_update = app_settings.remove_file_on_update
+    sniff_content = app_settings.sniff_content
+    template_name = "django_chunk_file_upload/chunked_upload.html"
+    upload_to = app_settings.upload_to
+    validate_content = app_settings.validate_content
+
+    def is_chunk_logged(self, file_obj) -> bool:
+        """Whether the per-chunk log records of this upload are emitted."""
+
+        if self.log_chunks == "all":
+            return True
+        if self.log_chunks == "boundary":
+            return bool(file_obj.eof or str(file_obj.chunk_from or 0) == "0")
+        if self.log_chunks == "sampled":
+            return is_sampled(str(file_obj.checksum), self.log_sample_rate)
+        return False
+
+    def get_file_url(self, instance) -> str:
+        """Deduplicated files have no storage URL, they are served by the download view."""
+
+        if ChunkStore.is_manifest(instance.file.name):
+            return reverse(
+                "django_chunk_file_upload:downloads",
+                kwargs={"checksum": instance.checksum},
+            )
+        return instance.file.url
+
     def is_valid(self, form, file_obj) -> bool:
         if form.is_valid() and file_obj.is_valid():
             return True
@@ -85,13 +159,54 @@ class ChunkedUploadView(FormView):
             opts["checksum"] = checksum
             if self.request.user.is_superuser:
                 opts.pop("user")
-            return self.get_model().objects.filter(**opts).first()
+            instance = self.get_model().objects.filter(**opts).first()
+            if instance is not None:
+                instance._loaded_metadata = copy.deepcopy(instance.metadata)
+            return instance
 
     def get_context_data(self, **kwargs):
         context = super(ChunkedUploadView, self).get_context_data(**kwargs)
         context["chunk_size"] = self.chunk_size
+        context["bundle_max_file_size"] = app_settings.bundle_max_file_size
+        context["content_encoding"] = next(
+            (
+                encoding
+                for encoding in ("gzip", "deflate")
+                if encoding in app_settings.compression.encodings
+            ),
+            "",
+        )
         return context
 
+    def get_profile_tags(self, request) -> dict:
+        file_obj = self.file_class(
+            _extension=get_file_extension(request.headers.get("x-file-name", ""))
+        )
+        tags = dict(
+            method=request.method.lower(),
+            type=file_obj.type,
+            chunk=None,
+            size=request.headers.get("x-file-size"),
+        )
+        try:
+            tags["chunk"] = int(request.headers["x-file-chunk-from"]) // int(
+                request.headers["x-file-chunk-size"]
+            )
+        except (KeyError, ValueError, ZeroDivisionError):
+            pass
+        return tags
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.profiler.should_sample():
+            return self.profiler.profile(
+                super(ChunkedUploadView, self).dispatch,
+                request,
+                *args,
+                tags=lambda: self.get_profile_tags(request),
+                **kwargs,
+            )
+        return super(ChunkedUploadView, self).dispatch(request, *args, **kwargs)
+
     def get(self, request, *args, **kwargs):
         return self._get(request, *args, **kwargs)
 
@@ -136,6 +251,8 @@ class ChunkedUploadView(FormView):
                     instance.metadata["_remove_file_on_update"] = True
                     instance.file.delete()
 
+                if instance.eof:
+                    instance.metadata.pop("content_type", None)
                 instance.eof = False
                 return self.chunked_upload(instance, form, file_obj)
 
@@ -185,47 +302,96 @@ class ChunkedUploadView(FormView):
             JsonResponse: return file metadata data.
         """
 
+        is_logged = self.is_chunk_logged(file_obj)
         if not instance:
-            LOGGER.info("File update request received. File: %s", file_obj.name)
+            if is_logged:
+                LOGGER.info("File update request received. File: %s", file_obj.name)
             instance = form.instance
 
-        LOGGER.info("Proceed to chunk upload. File: %s", file_obj.name)
+        if is_logged:
+            LOGGER.info("Proceed to chunk upload. File: %s", file_obj.name)
+
         if instance.eof:
             file_obj.message = _("The file already exists.")
             return self.ajax_response(instance, file_obj, 403, save=False)
 
+        file_obj.restore(instance.metadata)
+        content_type = file_obj._extra_metadata.get("content_type")
+        if content_type and content_type.get("type") != file_obj.type:
+            file_obj.message = _("The file type does not match its content.")
+            return self.ajax_response(instance, file_obj, 400, save=False)
+
+        if not file_obj.is_valid_range():
+            file_obj.message = _("The chunk is outside of the file size.")
+            return self.ajax_response(instance, file_obj, 400, save=False)
+
         kwargs, m2m_kwargs = self.get_kwargs(form)
         for k, v in kwargs.items():
             setattr(instance, k, v)
 
+        mode = "ab+" if instance.file else "wb+"
         try:
             self.save(instance, file_obj)
             self.save_m2m(instance, **m2m_kwargs)
-            file_obj.write("ab+" if instance.file else "wb+")
+            file_obj.write(mode)
         except IntegrityError as e:
             return self.raise_exception(e, instance, file_obj)
 
         except Exception as e:
             return self.raise_exception(e, instance, file_obj)
 
+        is_first = file_obj.offset == 0 if file_obj.offset is not None else "w" in mode
+        if is_first and not content_type:
+            with open(file_obj.save_path, "rb") as f:
+                is_sniffed = self.sniff(file_obj, f.read(sniff.HEADER_SIZE))
+
+            if not is_sniffed:
+                return self.reject(
+                    instance, file_obj, _("The file type does not match its content.")
+                )
+
+        if "w" in mode:
+            processors.registry.pop(file_obj.save_path)
+            file_obj._extra_metadata.pop(processors.OWNER_KEY, None)
+        try:
+            file_obj._extra_metadata.update(self.process(file_obj))
+        except processors.ProcessorError as e:
+            return self.reject(instance, file_obj, str(e))
+
         if file_obj.eof is False:
             return self.ajax_response(instance, file_obj)
 
+        safe_remove_file(file_obj.parts_path)
         checksum = get_md5_checksum(file_obj.save_path)
         instance.metadata = {}
         if checksum != file_obj.checksum:
-            instance.file.delete()
-            instance.eof = False
-            instance.file = None
-            instance.save()
-            file_obj.message = _("MD5 checksum does not match, please try again.")
-            return self.ajax_response(instance, file_obj, 400, save=False)
+            return self.reject(
+                instance, file_obj, _("MD5 checksum does not match, please try again.")
+            )
+        file_obj._extra_metadata["content_checksum"] = checksum
 
         self.background_task(instance)
         if self.optimize:
-            file_obj.optimize(instance)
+            try:
+                file_obj.optimize(instance)
+            except OptimizerError as e:
+                return self.reject(instance, file_obj, str(e))
+        self.deduplicate(instance, file_obj)
         return self.ajax_response(instance, file_obj)
 
+    def reject(self, instance: FileManager, file_obj: File, message: str):
+        """Delete the partial file and reset the upload session."""
+
+        safe_remove_file(file_obj.parts_path)
+        processors.registry.pop(file_obj.save_path)
+        instance.file.delete()
+        instance.eof = False
+        instance.file = None
+        instance.metadata = {}
+        instance.save()
+        file_obj.message = message
+        return self.ajax_response(instance, file_obj, 400, save=False)
+
     def raise_exception(
         self, exception: Exception, instance: FileManager, file_obj: File
     ):
@@ -252,9 +418,13 @@ class ChunkedUploadView(FormView):
 
         data = file_obj.to_response()
         if instance and instance.eof:
-            data["url"] = instance.file.url
+            data["url"] = self.get_file_url(instance)
+
+        if status >= 400:
+            LOGGER.warning("%s", file_obj.message)
+        elif self.is_chunk_logged(file_obj):
+            LOGGER.info("%s", file_obj.message)
 
-        LOGGER.info(str(file_obj.message))
         return JsonResponse(
             data=data,
             status=status,
@@ -301,15 +471,954 @@ class ChunkedUploadView(FormView):
         instance.status = self.file_status
         if not instance.checksum:
             instance.checksum = file_obj.checksum
+        for k, v in file_obj.to_fields().items():
+            setattr(instance, k, v)
 
         if app_settings.is_metadata_storage:
             instance.metadata = file_obj.to_metadata()
+        else:
+            instance.metadata.update(file_obj._extra_metadata)
 
-        instance.save()
+        loaded = getattr(instance, "_loaded_metadata", None)
+        if instance.pk is None or loaded is None:
+            instance.save()
+        else:
+            # The chunks of an upload are saved concurrently: only the keys
+            # this request changed are written over the metadata of the row.
+            queryset = self.get_model().objects.filter(pk=instance.pk)
+            lock = nullcontext()
+            if connections[queryset.db].features.has_select_for_update:
+                # Without it (SQLite) the writes are serialized by the database.
+                queryset = queryset.select_for_update()
+                lock = transaction.atomic(using=queryset.db)
+            with lock:
+                current = queryset.values_list("metadata", flat=True).first()
+                instance.metadata = merge_metadata(
+                    current or {}, loaded, instance.metadata
+                )
+                instance.save()
+        instance._loaded_metadata = copy.deepcopy(instance.metadata)
 
     def background_task(self, instance):
         pass
 
+    def sniff(self, file_obj: File, data: bytes) -> bool:
+        """Check the leading bytes of a file against its type.
+
+        The detected type is locked into the upload session, the next chunks
+        are rejected if the file type changes.
+        """
+
+        if not self.sniff_content:
+            return True
+
+        is_valid, signature = sniff.check(file_obj.extension, file_obj.type, data)
+        if is_valid:
+            file_obj._extra_metadata["content_type"] = {
+                "type": file_obj.type,
+                "mimetype": signature.mimetype if signature else file_obj.mimetype,
+            }
+        return is_valid
+
+    def get_processor_classes(self, file_obj: File) -> list:
+        """Stream processors of a file: validator and media extractor."""
+
+        classes = []
+        validator_class = MapValidator.get(file_obj.type)
+        if self.validate_content and validator_class:
+            classes.append(validator_class)
+        extractor_class = MapExtractor.get(str(file_obj.extension or "").lower())
+        if self.extract_media and extractor_class:
+            classes.append(extractor_class)
+        return classes
+
+    def process(self, file_obj: File, fp=None) -> dict:
+        """Feed the bytes received so far to the stream processors of the file.
+
+        Args:
+          file_obj: File of the upload.
+          fp: Complete file object to process at once instead, e.g. a bundled file.
+
+        Returns:
+          The metadata of the processors once the file is complete.
+
+        Raises:
+          ProcessorError: The content is invalid.
+        """
+
+        classes = self.get_processor_classes(file_obj)
+        if fp is not None:
+            return processors.process_file(file_obj, classes, fp)
+        return processors.process(file_obj, classes, final=file_obj.eof)
+
+    def deduplicate(self, instance, file_obj: File):
+        """Queue a completed file to be replaced by a manifest of blocks.
+
+        Chunking hashes every byte in Python, far too slow for a request:
+        the file is only marked and ``chunk_upload_dedup`` ingests it.
+        """
+
+        if (
+            not self.dedup
+            or file_obj.type in MapOptimizer
+            or ChunkStore.is_manifest(file_obj.path)
+        ):
+            return
+
+        try:
+            if os.path.getsize(file_obj.save_path) < self.dedup_min_file_size:
+                return
+        except OSError:
+            return
+        file_obj._extra_metadata["dedup"] = {"status": "pending"}
+
+
+class ChunkedRegisterView(ChunkedUploadView):
+    """Chunked register view.
+
+    Register many files before slicing them into chunks. All checksums are
+    classified with a single query and the new files are created with
+    ``bulk_create``, so the setup cost of a large drop is O(1) queries.
+
+    Request body (JSON)::
+        {"files": [{"name": ..., "size": ..., "mimetype": ..., "checksum": ...}]}
+
+    Each file of the response has a status:
+        completed: The file already exists.
+        resumable: The upload is incomplete, resume at ``offset``.
+        new: The file is registered, upload from ``offset`` 0.
+        invalid: The file is rejected.
+    """
+
+    http_method_names = ["post"]
+    max_files = 1000
+
+    def post(self, request, *args, **kwargs):
+        if not self.has_add_permission(request):
+            return JsonResponse(
+                data={"message": str(_("Permission denied."))}, status=400
+            )
+
+        try:
+            body = json.loads(request.body or b"{}")
+            records = body["files"] if isinstance(body, dict) else body
+            records = [record for record in records if isinstance(record, dict)]
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse(data={"message": str(_("Bad request."))}, status=400)
+
+        if len(records) > self.max_files:
+            return JsonResponse(
+                data={"message": str(_("Too many files: %s.") % len(records))},
+                status=400,
+            )
+
+        return JsonResponse(data={"files": self.register(records)}, status=200)
+
+    def get_file_obj(self, record: dict) -> File:
+        name = str(record.get("name") or "")
+        return self.file_class(
+            _extension=get_file_extension(name),
+            _user=self.request.user if self.request.user.is_authenticated else None,
+            _upload_to=self.upload_to,
+            checksum=record.get("checksum"),
+            mimetype=record.get("mimetype"),
+            name=name,
+            size=record.get("size"),
+        )
+
+    def get_queryset(self, checksums: list):
+        queryset = self.get_model().objects.filter(checksum__in=checksums)
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(
+                user=self.request.user if self.request.user.is_authenticated else None
+            )
+        return queryset
+
+    def get_offset(self, instance) -> int:
+        try:
+            if not instance.file:
+                return 0
+            return get_contiguous_size(
+                instance.file.path + ".parts", default=instance.file.size
+            )
+        except (OSError, ValueError):
+            return 0
+
+    def register(self, records: list) -> list:
+        files, results = {}, []
+        for record in records:
+            file_obj = self.get_file_obj(record)
+            result = {
+                "checksum": file_obj.checksum,
+                "name": file_obj.name,
+                "status": "invalid",
+                "offset": 0,
+            }
+            results.append(result)
+            if not file_obj.checksum or not file_obj.is_accepted_mime_type():
+                result["message"] = str(_("File type is not accepted."))
+            elif file_obj.checksum not in files:
+                files[file_obj.checksum] = file_obj
+
+        existing = {}
+        for instance in self.get_queryset(list(files)):
+            existing.setdefault(instance.checksum, instance)
+
+        objs = []
+        for checksum, file_obj in files.items():
+            if checksum not in existing:
+                objs.append(self.build_instance(file_obj))
+
+        if objs:
+            existing.update(self.create(objs))
+
+        for result in results:
+            file_obj = files.get(result["checksum"])
+            if result.get("message") or not file_obj:
+                continue
+
+            instance = existing.get(file_obj.checksum)
+            if instance is None:
+                result["status"] = "new"
+                result["message"] = str(_("File is registered."))
+            elif instance.eof:
+                result["status"] = "completed"
+                result["message"] = str(_("The file already exists."))
+                result["url"] = self.get_file_url(instance)
+            else:
+                result["status"] = "resumable"
+                result["message"] = str(file_obj.message)
+                result["offset"] = self.get_offset(instance)
+        return results
+
+    def create(self, objs: list) -> dict:
+        """Insert new rows, return the ones a concurrent request got first.
+
+        Conflicting rows are dropped by ``ignore_conflicts`` and the primary
+        keys are not set on every backend (MySQL, ``ignore_conflicts``), so
+        the rows are read back by (user, checksum): a row completed or partly
+        uploaded meanwhile is reported as such. No unique constraint covers
+        anonymous rows (user is NULL), the not started duplicates of the
+        oldest row are deleted instead.
+        """
+
+        model, user = self.get_model(), objs[0].user
+        model.objects.bulk_create(objs, ignore_conflicts=user is not None)
+        rows, duplicates = {}, []
+        for instance in model.objects.filter(
+            checksum__in=[obj.checksum for obj in objs], user=user
+        ).order_by("pk"):
+            if instance.checksum not in rows:
+                rows[instance.checksum] = instance
+            elif not instance.eof and not self.get_offset(instance):
+                duplicates.append(instance.pk)
+        if duplicates:
+            model.objects.filter(pk__in=duplicates).delete()
+
+        return {
+            checksum: instance
+            for checksum, instance in rows.items()
+            if instance.eof or self.get_offset(instance)
+        }
+
+    def build_instance(self, file_obj: File):
+        instance = self.get_model()(
+            checksum=file_obj.checksum,
+            eof=False,
+            file=file_obj.path,
+            status=self.file_status,
+            type=file_obj.type,
+            user=file_obj.user,
+            **file_obj.to_fields(),
+        )
+        if app_settings.is_metadata_storage:
+            instance.metadata = file_obj.to_metadata()
+        return instance
+
+
+class ChunkedBundleUploadView(ChunkedRegisterView):
+    """Chunked bundle upload view.
+
+    Upload many small files in a single request. The files are written,
+    verified and stored as individual rows in one transaction.
+
+    Request body (multipart/form-data)::
+        manifest: JSON list of {"name", "size", "mimetype", "checksum"}.
+        file: The files, in the same order as the manifest.
+
+    Each file of the response has a status: completed, created or invalid.
+    The request size is checked before the body is parsed.
+    """
+
+    max_file_size = app_settings.bundle_max_file_size
+    max_files = app_settings.bundle_max_files
+    max_overhead_size = 1024 * 64  # The manifest and the multipart headers.
+
+    def get_max_request_size(self) -> int:
+        return self.max_files * self.max_file_size + self.max_overhead_size
+
+    def post(self, request, *args, **kwargs):
+        if not self.max_file_size or not self.has_add_permission(request):
+            return JsonResponse(
+                data={"message": str(_("Permission denied."))}, status=400
+            )
+
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > self.get_max_request_size():
+            return JsonResponse(
+                data={"message": str(_("The bundle is too large."))}, status=400
+            )
+
+        files = request.FILES.getlist("file")
+        try:
+            records = json.loads(request.POST.get("manifest") or "[]")
+            records = [record for record in records if isinstance(record, dict)]
+        except (TypeError, ValueError):
+            return JsonResponse(data={"message": str(_("Bad request."))}, status=400)
+
+        if len(records) != len(files) or len(records) > self.max_files:
+            return JsonResponse(
+                data={"message": str(_("The manifest does not match the files."))},
+                status=400,
+            )
+
+        return JsonResponse(data={"files": self.bundle(records, files)}, status=200)
+
+    def bundle(self, records: list, files: list) -> list:
+        file_objs, results = {}, []
+        for record, file in zip(records, files):
+            file_obj = self.get_file_obj(record)
+            file_obj._file = file
+            file_obj.eof = True
+            file_obj.chunk_from, file_obj.chunk_to = 0, file.size
+            result = {
+                "checksum": file_obj.checksum,
+                "name": file_obj.name,
+                "status": "invalid",
+            }
+            results.append(result)
+            if not file_obj.is_valid():
+                result["message"] = str(_("File type is not accepted."))
+            elif file.size > self.max_file_size:
+                result["message"] = str(_("File is too large for a bundle."))
+            elif not self.sniff(file_obj, file.read(sniff.HEADER_SIZE)):
+                result["message"] = str(_("The file type does not match its content."))
+            elif get_md5_checksum(file) != file_obj.checksum:
+                result["message"] = str(
+                    _("MD5 checksum does not match, please try again.")
+                )
+            elif file_obj.checksum not in file_objs:
+                try:
+                    file_obj._extra_metadata.update(self.process(file_obj, file))
+                except processors.ProcessorError as e:
+                    result["message"] = str(e)
+                else:
+                    file_objs[file_obj.checksum] = file_obj
+
+        existing = {}
+        for instance in self.get_queryset(list(file_objs)):
+            existing.setdefault(instance.checksum, instance)
+
+        created, updated, written, rejected = [], [], {}, {}
+        stored = []  # Files on disk: the uploads and their optimized outputs.
+        try:
+            for checksum, file_obj in file_objs.items():
+                instance = existing.get(checksum)
+                if instance is not None and instance.eof:
+                    continue
+
+                stored.append(file_obj.save_path)
+                file_obj.write("wb+")
+                written[checksum] = file_obj
+                if instance is None:
+                    instance = self.build_instance(file_obj)
+                    created.append(instance)
+                else:
+                    updated.append(instance)
+
+                if self.optimize:
+                    try:
+                        file_obj.optimize(instance)
+                    except OptimizerError as e:
+                        safe_remove_file(file_obj.save_path)
+                        del written[checksum]
+                        if instance in created:
+                            created.remove(instance)
+                        else:
+                            updated.remove(instance)
+                        rejected[checksum] = str(e)
+                        continue
+                    stored.append(file_obj.save_path)
+
+                self.save_bundled(instance, file_obj)
+                existing[checksum] = instance
+
+            with transaction.atomic():
+                self.get_model().objects.bulk_create(created)
+                self.get_model().objects.bulk_update(
+                    updated,
+                    fields=[
+                        "eof",
+                        "file",
+                        "type",
+                        "status",
+                        "filename",
+                        "size",
+                        "mimetype",
+                        "metadata",
+                    ],
+                )
+        except Exception as e:
+            LOGGER.warning("Cannot upload bundle: %s", e)
+            for save_path in stored:
+                safe_remove_file(save_path)
+
+            for result in results:
+                if result["checksum"] in file_objs:
+                    result["status"] = "error"
+                    result["message"] = str(e)
+            return results
+
+        for instance in created + updated:
+            self.background_task(instance)
+
+        for result in results:
+            file_obj = file_objs.get(result["checksum"])
+            if result["checksum"] in rejected and not result.get("message"):
+                result["message"] = rejected[result["checksum"]]
+            if result.get("message") or not file_obj:
+                continue
+
+            if file_obj.checksum in written:
+                result["status"] = "created"
+                result["message"] = str(file_obj.message)
+            else:
+                result["status"] = "completed"
+                result["message"] = str(_("The file already exists."))
+            result["url"] = self.get_file_url(existing[file_obj.checksum])
+        return results
+
+    def save_bundled(self, instance, file_obj: File):
+        instance.eof = True
+        instance.file = file_obj.path
+        instance.type = file_obj.type
+        instance.status = self.file_status
+        for k, v in file_obj.to_fields().items():
+            setattr(instance, k, v)
+        if app_settings.is_metadata_storage:
+            instance.metadata = file_obj.to_metadata()
+        else:
+            instance.metadata.update(file_obj._extra_metadata)
+
+
+class ChunkedDeltaView(ChunkedUploadView):
+    """Chunked delta view.
+
+    Update an existing file by sending only the changed blocks, in the
+    spirit of rsync.
+
+    GET: Block signatures of the file identified by ``X-File-ID``::
+        {"block_size": ..., "size": ..., "checksum": ..., "signatures": [[weak, strong], ...]}
+
+    POST: The delta against those signatures, with the ``X-File-*`` headers
+    of the new file (``X-File-ID`` is the old checksum)::
+        block_size: Block size of the signatures.
+        instructions: JSON list, see ``delta.make_delta``.
+        file: Changed bytes.
+
+    The new file is rebuilt next to the old one and its MD5 checksum is
+    verified before it replaces the old file.
+    """
+
+    http_method_names = ["get", "post"]
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_change_permission(request):
+            raise Http404
+
+        instance = self.get_instance()
+        if not instance or not instance.eof or not instance.file:
+            raise Http404
+
+        fp = open_file(instance.file)
+        size = fp.seek(0, os.SEEK_END)
+        fp.seek(0)
+        try:
+            block_size = int(request.GET["block_size"])
+        except (KeyError, ValueError):
+            block_size = delta.get_block_size(size)
+        block_size = min(max(block_size, delta.MIN_BLOCK_SIZE), delta.MAX_BLOCK_SIZE)
+
+        with fp:
+            signatures = delta.get_signatures(fp, block_size)
+
+        return JsonResponse(
+            data={
+                "block_size": block_size,
+                "size": size,
+                "checksum": instance.content_checksum,
+                "signatures": signatures,
+            }
+        )
+
+    def post(self, request, *args, **kwargs):
+        file_obj = self.file_class.from_request(request, self.upload_to)
+        if not file_obj.extension:
+            file_obj.extension = get_file_extension(file_obj.name or "")
+
+        if not (
+            self.has_change_permission(request)
+            and file_obj.checksum
+            and file_obj.is_accepted_mime_type()
+        ):
+            file_obj.message = _("Cannot update file, reason: permission denied.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        instance = self.get_instance()
+        if not instance or not instance.eof or not instance.file:
+            file_obj.message = _("Not found.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        if (
+            self.get_model()
+            .objects.filter(user=file_obj.user, checksum=file_obj.checksum)
+            .exclude(pk=instance.pk)
+            .exists()
+        ):
+            file_obj.message = _("The file was created by another user.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        try:
+            block_size = int(request.POST["block_size"])
+            instructions = json.loads(request.POST["instructions"])
+        except (KeyError, TypeError, ValueError):
+            file_obj.message = _("Bad request.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        if file_obj.total_size is None:
+            file_obj.message = _("The file size is required.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+        block_size = min(max(block_size, delta.MIN_BLOCK_SIZE), delta.MAX_BLOCK_SIZE)
+
+        save_path = file_obj.save_path
+        tmp_path = save_path + ".delta"
+        data = file_obj.file or BytesIO()
+        try:
+            with open_file(instance.file) as origin, open(tmp_path, "wb") as out:
+                checksum, _size = delta.apply_delta(
+                    origin,
+                    instructions,
+                    data,
+                    out,
+                    block_size,
+                    max_size=file_obj.total_size,
+                )
+        except (OSError, ValueError) as e:
+            safe_remove_file(tmp_path)
+            file_obj.message = _("Cannot apply delta: %s.") % e
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        if checksum != file_obj.checksum:
+            safe_remove_file(tmp_path)
+            file_obj.message = _("MD5 checksum does not match, please try again.")
+            return self.ajax_response(None, file_obj, status=400, save=False)
+
+        old_path = instance.file.path
+        os.replace(tmp_path, save_path)
+        # Nothing refers to the old file any more, whatever remove_file_on_update.
+        if old_path != save_path:
+            LOGGER.info("Delete original file: %s", instance.file.name)
+            safe_remove_file(old_path)
+
+        file_obj.eof = True
+        instance.checksum = file_obj.checksum
+        instance.metadata.pop("optimizer", None)
+        file_obj._extra_metadata["content_checksum"] = checksum
+        try:
+            self.save(instance, file_obj)
+        except IntegrityError as e:
+            return self.raise_exception(e, instance, file_obj)
+
+        self.background_task(instance)
+        if self.optimize:
+            try:
+                file_obj.optimize(instance)
+            except OptimizerError as e:
+                return self.reject(instance, file_obj, str(e))
+        self.deduplicate(instance, file_obj)
+        return self.ajax_response(instance, file_obj)
+
+
+class ChunkedDownloadView(PermissionMixin, View):
+    """Chunked download view.
+
+    Serve a completed file by its checksum. The checksum of the stored content
+    (``content_checksum``, it changes with an update) is used as a strong ETag
+    (``If-None-Match`` returns 304) and single byte ranges are supported.
+    The transfer is handed to the front proxy with ``X-Accel-Redirect`` or
+    ``X-Sendfile`` when configured, otherwise ``FileResponse`` is used so the
+    WSGI server can send the file with ``os.sendfile``.
+    """
+
+    http_method_names = ["get"]
+    as_attachment = app_settings.download.as_attachment
+    block_size = 1024 * 64
+    model = FileManager
+    x_accel_redirect = app_settings.download.x_accel_redirect
+    x_sendfile = app_settings.download.x_sendfile
+
+    def get_instance(self, checksum: str):
+        opts = dict(checksum=checksum, eof=True)
+        if not self.request.user.is_superuser:
+            opts["user"] = (
+                self.request.user if self.request.user.is_authenticated else None
+            )
+        return self.model.objects.filter(**opts).first()
+
+    def get_etag(self, instance) -> str:
+        return '"%s"' % instance.content_checksum
+
+    def is_not_modified(self) -> bool:
+        if_none_match = self.request.headers.get("if-none-match", "")
+        return self.etag in [etag.strip() for etag in if_none_match.split(",")] or (
+            if_none_match.strip() == "*"
+        )
+
+    def get_range(self, size: int) -> None | tuple[int, int]:
+        """Parse a single ``bytes=start-end`` range.
+
+        Returns:
+          None for the full content, or the (start, end) inclusive offsets.
+
+        Raises:
+          ValueError: The range is not satisfiable.
+        """
+
+        header = self.request.headers.get("range")
+        if not header:
+            return None
+
+        if_range = self.request.headers.get("if-range")
+        if if_range and if_range != self.etag:
+            return None
+
+        matched = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+        if not matched or not any(matched.groups()):
+            return None
+
+        start, end = matched.groups()
+        if not start:
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end) if end else size - 1, size - 1)
+
+        if start > end or start >= size:
+            raise ValueError(header)
+        return start, end
+
+    def get(self, request, checksum: str, *args, **kwargs):
+        if not self.has_view_permission(request):
+            raise Http404
+
+        instance = self.get_instance(checksum)
+        if not instance or not instance.file:
+            raise Http404
+
+        self.etag = self.get_etag(instance)
+        if self.is_not_modified():
+            response = HttpResponseNotModified()
+            response["ETag"] = self.etag
+            return response
+
+        response = self.get_response(instance)
+        response["ETag"] = self.etag
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    def get_content_type(self, instance) -> str:
+        """Content type of the stored file, a deduplicated one by its original name."""
+
+        name = instance.file.name
+        if ChunkStore.is_manifest(name):
+            name = name[: -len(ChunkStore.extension)]
+        return (
+            mimetypes.guess_type(name)[0]
+            or instance.mimetype
+            or "application/octet-stream"
+        )
+
+    def get_response(self, instance):
+        filename = os.path.basename(instance.name)
+        content_type = self.get_content_type(instance)
+        is_manifest = ChunkStore.is_manifest(instance.file.name)
+        if (self.x_accel_redirect or self.x_sendfile) and not is_manifest:
+            response = HttpResponse(content_type=content_type)
+            if self.x_accel_redirect:
+                response["X-Accel-Redirect"] = (
+                    self.x_accel_redirect.rstrip("/") + "/" + instance.file.name
+                )
+            else:
+                response["X-Sendfile"] = instance.file.path
+            response["Content-Disposition"] = content_disposition_header(
+                self.as_attachment, filename
+            )
+            return response
+
+        fp = open_file(instance.file)
+        size = fp.seek(0, os.SEEK_END)
+        fp.seek(0)
+        try:
+            byte_range = self.get_range(size)
+        except ValueError:
+            fp.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%s" % size
+            return response
+
+        if byte_range is None:
+            return FileResponse(
+                fp,
+                as_attachment=self.as_attachment,
+                filename=filename,
+                content_type=content_type,
+            )
+
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            self.iter_range(fp, start, end),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = "bytes %s-%s/%s" % (start, end, size)
+        response["Content-Disposition"] = content_disposition_header(
+            self.as_attachment, filename
+        )
+        return response
+
+    def iter_range(self, fp, start: int, end: int):
+        try:
+            fp.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = fp.read(min(self.block_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            fp.close()
+
+
+class ChunkedThumbnailView(ChunkedDownloadView):
+    """Thumbnail view.
+
+    Serve an image resized to one of the allowed ``sizes`` (``?size=WxH``).
+    Thumbnails are created on the first request into the thumbnail cache
+    (least recently used evicted, concurrent misses decode the image once)
+    and their strong ETag is the cache key, known without decoding. Users
+    with the view permission of the model, e.g. staff browsing the admin
+    changelist, get the thumbnails of all users.
+    """
+
+    sizes = app_settings.thumbnail.sizes
+    to_webp = app_settings.thumbnail.to_webp
+
+    def get_instance(self, checksum: str):
+        """The file of any user for the users who can view it in the admin."""
+
+        opts = self.model._meta
+        if self.request.user.has_perm("%s.view_%s" % (opts.app_label, opts.model_name)):
+            return self.model.objects.filter(checksum=checksum, eof=True).first()
+        return super().get_instance(checksum)
+
+    def get_size(self) -> None | tuple[int, int]:
+        size = self.request.GET.get("size", "")
+        if size not in self.sizes:
+            return None
+
+        width, height = size.split("x")
+        return int(width), int(height)
+
+    def get(self, request, checksum: str, *args, **kwargs):
+        if not self.has_view_permission(request):
+            raise Http404
+
+        size = self.get_size()
+        if size is None:
+            return HttpResponseBadRequest(
+                _("Thumbnail size must be one of: %s.") % ", ".join(self.sizes)
+            )
+
+        instance = self.get_instance(checksum)
+        if not instance or not instance.file or instance.type != TypeChoices.IMAGE:
+            raise Http404
+
+        self.etag = '"%s"' % ImageOptimizer.get_thumbnail_key(
+            instance.content_checksum, *size, to_webp=self.to_webp
+        )
+        if self.is_not_modified():
+            response = HttpResponseNotModified()
+            response["ETag"] = self.etag
+            return response
+
+        try:
+            thumbnail = ImageOptimizer.get_thumbnail(
+                instance.file, instance.content_checksum, *size, to_webp=self.to_webp
+            )
+        except OptimizerError:
+            thumbnail = None
+        if thumbnail is None:
+            raise Http404
+
+        response = self.get_thumbnail_response(thumbnail)
+        response["ETag"] = self.etag
+        return response
+
+    def get_thumbnail_response(self, thumbnail: dict):
+        content_type = thumbnail["content_type"]
+        if thumbnail["path"] is None:
+            return HttpResponse(thumbnail["data"], content_type=content_type)
+
+        if self.x_accel_redirect:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = (
+                self.x_accel_redirect.rstrip("/")
+                + "/"
+                + os.path.relpath(thumbnail["path"], settings.MEDIA_ROOT)
+            )
+            return response
+        if self.x_sendfile:
+            response = HttpResponse(content_type=content_type)
+            response["X-Sendfile"] = thumbnail["path"]
+            return response
+        return FileResponse(open(thumbnail["path"], "rb"), content_type=content_type)
+
+
+class ChunkedListView(PermissionMixin, View):
+    """Chunked list view.
+
+    List the files of the user, newest first, with keyset pagination: the
+    ``next`` cursor encodes the (created_at, id) of the last row and the
+    following page starts right after it, so every page is an index range
+    scan whatever its depth.
+
+    GET ``?type=IMAGE&status=COMPLETED&eof=true&limit=50&cursor=...``::
+        {"results": [{"id", "checksum", "name", "size", "mimetype", "type",
+                      "status", "eof", "created_at", "url"}, ...],
+         "next": "..." or null}
+    """
+
+    http_method_names = ["get"]
+    fields = (
+        "id",
+        "checksum",
+        "filename",
+        "size",
+        "mimetype",
+        "type",
+        "status",
+        "eof",
+        "created_at",
+        "file",
+    )
+    max_page_size = 200
+    model = FileManager
+    page_size = 50
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_view_permission(request) or not request.user.is_authenticated:
+            raise Http404
+
+        try:
+            queryset = self.get_queryset()
+            limit = self.get_limit()
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        rows = list(queryset.values(*self.fields)[: limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1])
+        return JsonResponse(
+            {"results": [self.to_response(row) for row in rows], "next": next_cursor}
+        )
+
+    def get_queryset(self) -> QuerySet:
+        """Files of the user after the cursor, filtered by the query string.
+
+        Raises:
+          ValueError: A filter or the cursor is invalid.
+        """
+
+        params = self.request.GET
+        queryset = self.model.objects.filter(user=self.request.user)
+        if params.get("type"):
+            if params["type"] not in TypeChoices.values:
+                raise ValueError(_("Invalid type: %s.") % params["type"])
+            queryset = queryset.filter(type=params["type"])
+        if params.get("status"):
+            if params["status"] not in StatusChoices.values:
+                raise ValueError(_("Invalid status: %s.") % params["status"])
+            queryset = queryset.filter(status=params["status"])
+        if params.get("eof"):
+            eof = params["eof"].lower() in ["true", "1", "yes", "on"]
+            queryset = queryset.filter(eof=eof)
+        if params.get("cursor"):
+            created_at, pk = self.decode_cursor(params["cursor"])
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        return queryset.order_by("-created_at", "-id")
+
+    def get_limit(self) -> int:
+        limit = self.request.GET.get("limit")
+        if not limit:
+            return self.page_size
+        if not limit.isdigit() or not 0 < int(limit) <= self.max_page_size:
+            raise ValueError(_("Limit must be between 1 and %s.") % self.max_page_size)
+        return int(limit)
+
+    def encode_cursor(self, row: dict) -> str:
+        data = json.dumps([row["created_at"].isoformat(), row["id"]])
+        return urlsafe_base64_encode(data.encode())
+
+    def decode_cursor(self, cursor: str) -> tuple[datetime, int]:
+        try:
+            created_at, pk = json.loads(urlsafe_base64_decode(cursor))
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise ValueError(_("Invalid cursor."))
+
+    def get_file_url(self, name: str, checksum: str) -> None | str:
+        if not name:
+            return None
+        if ChunkStore.is_manifest(name):
+            return reverse(
+                "django_chunk_file_upload:downloads", kwargs={"checksum": checksum}
+            )
+        return self.model._meta.get_field("file").storage.url(name)
+
+    def to_response(self, row: dict) -> dict:
+        return {
+            "id": row["id"],
+            "checksum": row["checksum"],
+            "name": row["filename"] or os.path.basename(row["file"]),
+            "size": row["size"],
+            "mimetype": row["mimetype"],
+            "type": row["type"],
+            "status": row["status"],
+            "eof": row["eof"],
+            "created_at": row["created_at"].isoformat(),
+            "url": (
+                self.get_file_url(row["file"], row["checksum"]) if row["eof"] else None
+            ),
+        }
+
 
 class ChunkArchiveUploadView(ChunkedUploadView):
     """Chunk Archive Upload View"""
@@ -159,4 +159,8 @@ DJANGO_CHUNK_FILE_UPLOAD = {
         "to_webp": True,  # focus convert image to webp type.
     },
     "permission_classes": ("django_chunk_file_upload.permissions.AllowAny",),
+    "cache": {
+        # Removed with the upload dir after each test.
+        "cache_dir": os.path.join(os.path.basename(UPLOAD_TO_TEMP_DIR), "cache"),
+    },
 }
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` client module.
+"""
+
+import os
+from unittest import mock
+
+from django.test import LiveServerTestCase
+from django.urls import reverse
+
+from django_chunk_file_upload import client, permissions
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    remove_dir,
+)
+from django_chunk_file_upload.views import ChunkedUploadView
+
+
+class TestChunkUploadClient(LiveServerTestCase):
+    chunk_size = 1024 * 64
+
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        self.content = os.urandom(self.chunk_size * 9 + 100)
+        self.fp = os.path.join(app_settings.upload_to, "source.bin")
+        with open(self.fp, "wb") as f:
+            f.write(self.content)
+
+        self.client = client.ChunkUploadClient(
+            self.live_server_url + reverse("django_chunk_file_upload:uploads"),
+            chunk_size=self.chunk_size,
+            workers=4,
+            backoff=0.01,
+        )
+
+    def tearDown(self):
+        self.client.close()
+        remove_dir(app_settings.upload_to)
+
+    def _validate(self, result: dict):
+        self.assertTrue(result["eof"], result)
+        instance = FileManager.objects.get(checksum=get_md5_checksum(self.content))
+        self.assertTrue(instance.eof)
+        with instance.file.open("rb") as f:
+            self.assertEqual(self.content, f.read())
+
+    def test_upload(self):
+        """Test a parallel upload, then uploading the same file again."""
+
+        self._validate(self.client.upload(self.fp))
+        result = self.client.upload(self.fp)
+        self.assertEqual("completed", result["status"])
+
+    def test_resume(self):
+        """Test resuming after chunks were stored out of order."""
+
+        checksum, size = client.get_checksum(self.fp)
+        meta = dict(
+            name="source.bin",
+            size=size,
+            checksum=checksum,
+            mimetype="application/octet-stream",
+        )
+        self.assertEqual("new", self.client.register([meta])[0]["status"])
+        for offset in (0, self.chunk_size * 2):
+            self.client.upload_chunk(self.fp, meta, offset, False)
+
+        result = self.client.register([meta])[0]
+        self.assertEqual(
+            ("resumable", self.chunk_size), (result["status"], result["offset"])
+        )
+
+        with mock.patch.object(
+            self.client, "upload_chunk", wraps=self.client.upload_chunk
+        ) as upload_chunk:
+            self._validate(self.client.upload(self.fp))
+        offsets = sorted(call.args[2] for call in upload_chunk.call_args_list)
+        self.assertEqual(self.chunk_size, offsets[0])
+        self.assertEqual(9, len(offsets))
+
+    def test_retry(self):
+        """Test that connection errors are retried."""
+
+        request = client.HTTPConnection.request
+        failures = iter([True, False, True])
+
+        def flaky(connection, *args, **kwargs):
+            if next(failures, False):
+                raise ConnectionResetError("reset")
+            return request(connection, *args, **kwargs)
+
+        with mock.patch.object(client.HTTPConnection, "request", flaky):
+            self._validate(self.client.upload(self.fp))
+
+        self.client.retries = 0
+        with mock.patch.object(
+            client.HTTPConnection, "request", side_effect=ConnectionResetError
+        ):
+            with self.assertRaises(ConnectionResetError):
+                self.client.upload(self.fp)
+
+    def test_main(self):
+        """Test the command line entry point."""
+
+        with mock.patch("builtins.print") as printed:
+            code = client.main(
+                [
+                    self.client.url,
+                    self.fp,
+                    "--chunk-size=%s" % self.chunk_size,
+                    "--workers=2",
+                ]
+            )
+        self.assertEqual(0, code)
+        self.assertIn('"eof": true', printed.call_args.args[0])
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` management commands.
+"""
+
+import os
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from PIL import Image
+
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.constants import StatusChoices, TypeChoices
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    get_paths,
+    remove_dir,
+)
+
+
+class TestVerifyCommand(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        for i in range(5):
+            content = os.urandom(1024 * (i + 1))
+            save_path, path = get_paths("file-%s.bin" % i, app_settings.upload_to)
+            with open(save_path, "wb") as f:
+                f.write(content)
+            FileManager.objects.create(
+                checksum=get_md5_checksum(content),
+                eof=True,
+                file=path,
+                status=StatusChoices.COMPLETED,
+            )
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_verify(self):
+        """Test that corrupted and missing files are reported and marked."""
+
+        corrupted, missing = FileManager.objects.order_by("pk")[1:3]
+        with open(corrupted.file.path, "r+b") as f:
+            f.write(b"corrupted")
+        os.remove(missing.file.path)
+
+        out = StringIO()
+        state_file = os.path.join(app_settings.upload_to, "verify.state")
+        call_command(
+            "chunk_upload_verify",
+            "--batch-size=2",
+            "--workers=2",
+            "--mark",
+            "--state-file=%s" % state_file,
+            stdout=out,
+        )
+        self.assertIn("Verified 5 files, 2 mismatched.", out.getvalue())
+        self.assertIn("checksum mismatch", out.getvalue())
+        self.assertIn("missing", out.getvalue())
+        self.assertEqual(
+            {corrupted.pk, missing.pk},
+            set(
+                FileManager.objects.filter(status=StatusChoices.ERROR).values_list(
+                    "pk", flat=True
+                )
+            ),
+        )
+
+        out = StringIO()
+        call_command("chunk_upload_verify", "--state-file=%s" % state_file, stdout=out)
+        self.assertIn("Verified 0 files", out.getvalue())
+
+        out = StringIO()
+        call_command(
+            "chunk_upload_verify",
+            "--start-after=%s" % missing.pk,
+            "--max-rate=100",
+            stdout=out,
+        )
+        self.assertIn("Verified 2 files, 0 mismatched.", out.getvalue())
+
+    def test_verify_optimized(self):
+        """Test updated and optimized files are checked against their content."""
+
+        instance = FileManager.objects.order_by("pk").first()
+        instance.checksum = "original"
+        instance.metadata = {
+            "optimizer": {
+                "action": "optimized",
+                "checksum": get_md5_checksum(instance.file.path),
+            }
+        }
+        instance.save()
+        FileManager.objects.filter(pk=instance.pk + 1).update(
+            checksum="original", metadata={"optimizer": {"action": "optimized"}}
+        )
+        updated = FileManager.objects.get(pk=instance.pk + 2)
+        FileManager.objects.filter(pk=updated.pk).update(
+            checksum="original",
+            metadata={"content_checksum": get_md5_checksum(updated.file.path)},
+        )
+
+        out = StringIO()
+        call_command("chunk_upload_verify", "--mark", stdout=out)
+        self.assertIn("Verified 4 files, 0 mismatched.", out.getvalue())
+        self.assertIn("Skipped 1 optimized files", out.getvalue())
+        self.assertFalse(
+            FileManager.objects.filter(status=StatusChoices.ERROR).exists()
+        )
+
+
+class TestImportCommand(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        self.source = os.path.join(app_settings.upload_to, "legacy")
+        self.contents = {}
+        for i in range(6):
+            fp = os.path.join(self.source, "dir-%s" % (i % 3), "file-%s.csv" % i)
+            create_dir(os.path.dirname(fp))
+            content = b"a,b\n%d,%d\n" % (i % 5, i % 5)
+            with open(fp, "wb") as f:
+                f.write(content)
+            self.contents[get_md5_checksum(content)] = content
+
+        image = Image.new("RGB", (64, 64), (255, 0, 0))
+        image.save(os.path.join(self.source, "image.png"))
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_import(self):
+        """Test importing a tree, duplicates and existing checksums are skipped."""
+
+        out = StringIO()
+        call_command(
+            "chunk_upload_import",
+            self.source,
+            "--workers=2",
+            "--batch-size=3",
+            "--optimize",
+            stdout=out,
+        )
+        self.assertIn("Imported 6 files, skipped 1 existing", out.getvalue())
+        for checksum, content in self.contents.items():
+            instance = FileManager.objects.get(checksum=checksum)
+            self.assertEqual(TypeChoices.SEPARATED, instance.type)
+            self.assertEqual(app_settings.status, instance.status)
+            self.assertTrue(instance.eof)
+            with instance.file.open("rb") as f:
+                self.assertEqual(content, f.read())
+
+        image = FileManager.objects.get(type=TypeChoices.IMAGE)
+        self.assertEqual(app_settings.status, image.status)
+        self.assertTrue(os.path.exists(image.file.path))
+        self.assertTrue(os.path.exists(os.path.join(self.source, "image.png")))
+
+        out = StringIO()
+        call_command("chunk_upload_import", self.source, "--workers=1", stdout=out)
+        self.assertIn("Imported 0 files, skipped 7 existing", out.getvalue())
+
+    def test_import_move_conflict(self):
+        """Test a file moved for a row created concurrently is moved back."""
+
+        checksum = next(iter(self.contents))
+        user = get_user_model().objects.create_user(username="importer")
+        bulk_create = FileManager.objects.bulk_create
+
+        def race(objs, **kwargs):
+            if not FileManager.objects.filter(checksum=checksum).exists():
+                FileManager.objects.create(
+                    checksum=checksum, eof=True, file="a.csv", user=user
+                )
+            return bulk_create(objs, **kwargs)
+
+        out = StringIO()
+        with mock.patch.object(FileManager.objects, "bulk_create", side_effect=race):
+            call_command(
+                "chunk_upload_import",
+                self.source,
+                "--workers=1",
+                "--move",
+                "--user=importer",
+                stdout=out,
+            )
+        self.assertIn("Imported 5 files, skipped 2 existing", out.getvalue())
+        self.assertEqual("a.csv", FileManager.objects.get(checksum=checksum).file.name)
+        remaining = [
+            os.path.join(dirpath, filename)
+            for dirpath, _, filenames in os.walk(self.source)
+            for filename in filenames
+        ]
+        self.assertEqual(2, len(remaining))
+        self.assertEqual({checksum}, {get_md5_checksum(fp) for fp in remaining})
+
+
+class TestOptimizeCommand(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_optimize_deferred(self):
+        """Test deferred images are optimized with a larger memory limit."""
+
+        save_path, path = get_paths("deferred.png", app_settings.upload_to)
+        Image.linear_gradient("L").resize((1600, 1200)).save(save_path)
+        instance = FileManager.objects.create(
+            checksum=get_md5_checksum(save_path),
+            eof=True,
+            file=path,
+            type=TypeChoices.IMAGE,
+            metadata={"optimizer": {"action": "deferred", "reason": "memory"}},
+        )
+        FileManager.objects.create(checksum="other", eof=True, file="other.png")
+
+        out = StringIO()
+        call_command("chunk_upload_optimize", "--max-memory=64", stdout=out)
+        self.assertIn("Optimized 1 images, 0 failed.", out.getvalue())
+        instance.refresh_from_db()
+        self.assertEqual("optimized", instance.metadata["optimizer"]["action"])
+        self.assertTrue(instance.file.name.endswith(".webp"))
+        self.assertTrue(os.path.exists(instance.file.path))
+        self.assertFalse(os.path.exists(save_path))
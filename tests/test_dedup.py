@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` dedup module.
+"""
+
+import os
+import random
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse_lazy
+
+from django_chunk_file_upload import dedup, permissions
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    get_paths,
+    remove_dir,
+)
+from django_chunk_file_upload.views import (
+    ChunkedDownloadView,
+    ChunkedUploadView,
+)
+
+
+class TestChunkStore(TestCase):
+    content = random.Random(0).randbytes(1024 * 256)
+
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        self.store = dedup.ChunkStore(
+            min_size=1024,
+            avg_size=1024 * 4,
+            max_size=1024 * 16,
+            blocks_dir=os.path.join(os.path.basename(app_settings.upload_to), "blocks"),
+        )
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def _ingest(self, name: str, content: bytes) -> str:
+        fp = os.path.join(app_settings.upload_to, name)
+        with open(fp, "wb") as f:
+            f.write(content)
+        return self.store.ingest(fp)
+
+    def test_ingest(self):
+        """Test that near-identical files share most of their blocks."""
+
+        origin = self.store.load(self._ingest("origin.bin", self.content))
+        content = self.content[:50000] + b"inserted" + self.content[50000:]
+        changed = self.store.load(self._ingest("changed.bin", content))
+        shared = {digest for digest, _ in origin["blocks"]} & {
+            digest for digest, _ in changed["blocks"]
+        }
+        self.assertEqual(get_md5_checksum(content), changed["checksum"])
+        self.assertGreaterEqual(len(shared), len(changed["blocks"]) - 3)
+        for _, length in changed["blocks"][:-1]:
+            self.assertLessEqual(self.store.min_size, length)
+            self.assertLessEqual(length, self.store.max_size)
+
+    def test_manifest_file(self):
+        """Test reading a deduplicated file back, with seeks across blocks."""
+
+        manifest_fp = self._ingest("origin.bin", self.content)
+        with self.store.open(manifest_fp) as fp:
+            self.assertEqual(self.content, fp.read())
+            fp.seek(100000)
+            self.assertEqual(self.content[100000:130000], fp.read(30000))
+            self.assertEqual(len(self.content), fp.seek(0, os.SEEK_END))
+            self.assertEqual(b"", fp.read())
+
+    def test_gc(self):
+        """Test that only unreferenced blocks are deleted."""
+
+        origin_fp = self._ingest("origin.bin", self.content)
+        changed_fp = self._ingest("changed.bin", self.content[::-1])
+        self.assertEqual((0, 0), self.store.gc([origin_fp], grace=3600))
+
+        removed, freed = self.store.gc([origin_fp], grace=-1, dry_run=True)
+        self.assertGreater(removed, 0)
+        self.assertEqual(len(self.content), freed)
+        self.assertEqual((removed, freed), self.store.gc([origin_fp], grace=-1))
+        self.assertEqual((0, 0), self.store.gc([origin_fp], grace=-1))
+        with self.store.open(origin_fp) as fp:
+            self.assertEqual(self.content, fp.read())
+        with self.assertRaises(OSError), self.store.open(changed_fp) as fp:
+            fp.read()
+
+
+class TestDedupViews(TestCase):
+    content = random.Random(1).randbytes(1024 * 256)
+
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedDownloadView.permission_classes = (permissions.AllowAny,)
+        self.checksum = get_md5_checksum(self.content)
+        save_path, path = get_paths("origin.pdf", app_settings.upload_to)
+        with open(save_path, "wb") as f:
+            f.write(self.content)
+        self.instance = FileManager.objects.create(
+            checksum=self.checksum, eof=True, file=path
+        )
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_download_deduplicated(self):
+        """Test serving a deduplicated file through the download view."""
+
+        view = ChunkedUploadView()
+        view.dedup, view.dedup_min_file_size = True, 0
+        file_obj = view.file_class(
+            checksum=self.checksum, _upload_to=app_settings.upload_to
+        )
+        file_obj.path = self.instance.file.name
+        blocks_dir = os.path.join(os.path.basename(app_settings.upload_to), "blocks")
+        with mock.patch.object(dedup.chunk_store, "blocks_dir", blocks_dir):
+            # Only queued by the view, ingested by the command.
+            view.deduplicate(self.instance, file_obj)
+            self.assertEqual({"status": "pending"}, file_obj._extra_metadata["dedup"])
+            self.instance.metadata.update(file_obj._extra_metadata)
+            self.instance.save()
+            self.assertTrue(os.path.exists(self.instance.file.path))
+
+            out = StringIO()
+            call_command("chunk_upload_dedup", stdout=out)
+            self.assertIn("Deduplicated 1 files, 0 failed.", out.getvalue())
+            origin_path = self.instance.file.path
+            self.instance.refresh_from_db()
+            self.assertTrue(self.instance.file.name.endswith(".cdc"))
+            self.assertEqual("completed", self.instance.metadata["dedup"]["status"])
+            self.assertFalse(os.path.exists(origin_path))
+            path = reverse_lazy(
+                "django_chunk_file_upload:downloads", args=[self.checksum]
+            )
+            self.assertEqual(path, view.get_file_url(self.instance))
+            response = self.client.get(path)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual("application/pdf", response["Content-Type"])
+            self.assertEqual(self.content, b"".join(response.streaming_content))
+
+            response = self.client.get(path, headers={"Range": "bytes=5000-9999"})
+            self.assertEqual(206, response.status_code)
+            self.assertEqual(
+                self.content[5000:10000], b"".join(response.streaming_content)
+            )
+
+            out = StringIO()
+            call_command("chunk_upload_gc", "--grace=-1", stdout=out)
+            self.assertIn("Deleted 0 blocks", out.getvalue())
+
+            self.instance.delete()
+            call_command("chunk_upload_gc", "--grace=-1", "--dry-run", stdout=out)
+            self.assertIn("Found", out.getvalue())
+            self.assertNotIn("Found 0 blocks", out.getvalue())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` delta module.
+"""
+
+import json
+import os
+import tempfile
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse_lazy
+
+from django_chunk_file_upload import delta, permissions
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    get_paths,
+    remove_dir,
+)
+from django_chunk_file_upload.views import ChunkedDeltaView
+
+
+class TestDelta(TestCase):
+    origin = os.urandom(1024 * 100)
+    block_size = 4096
+
+    def _roundtrip(self, content: bytes) -> tuple[list, bytes]:
+        signatures = delta.get_signatures(BytesIO(self.origin), self.block_size)
+        with tempfile.TemporaryFile() as fp:
+            fp.write(content)
+            instructions, data = delta.make_delta(fp, signatures, self.block_size)
+
+        out = BytesIO()
+        checksum, size = delta.apply_delta(
+            BytesIO(self.origin), instructions, BytesIO(data), out, self.block_size
+        )
+        self.assertEqual(content, out.getvalue())
+        self.assertEqual(get_md5_checksum(content), checksum)
+        self.assertEqual(len(content), size)
+        return instructions, data
+
+    def test_delta(self):
+        origin = self.origin
+        self.assertEqual(b"", self._roundtrip(origin)[1])
+        self.assertEqual(b"", self._roundtrip(origin[:8192] + origin[12288:])[1])
+        self.assertEqual(b"tail", self._roundtrip(origin + b"tail")[1])
+        _, data = self._roundtrip(origin[:5000] + b"changed" + origin[5000:])
+        self.assertLessEqual(len(data), self.block_size + len(b"changed"))
+        self._roundtrip(b"")
+        self._roundtrip(os.urandom(100))
+
+    def test_apply_invalid_delta(self):
+        for instructions, data in (
+            ([["copy", 100, 1]], b""),
+            ([["data", 10]], b"short"),
+            ([["data", 2]], b"unused"),
+            ([["move", 0]], b""),
+            ([["copy", 0, 1]] * 1000, b""),
+        ):
+            with self.assertRaises(ValueError):
+                delta.apply_delta(
+                    BytesIO(self.origin),
+                    instructions,
+                    BytesIO(data),
+                    BytesIO(),
+                    self.block_size,
+                    max_size=len(self.origin),
+                )
+
+
+class TestChunkedDeltaView(TestCase):
+    origin = os.urandom(1024 * 64)
+
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedDeltaView.permission_classes = (permissions.AllowAny,)
+        self.checksum = get_md5_checksum(self.origin)
+        save_path, path = get_paths("origin.bin", app_settings.upload_to)
+        self.origin_path = save_path
+        with open(save_path, "wb") as f:
+            f.write(self.origin)
+        FileManager.objects.create(checksum=self.checksum, eof=True, file=path)
+        self.path = reverse_lazy("django_chunk_file_upload:uploads-delta")
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_delta_view(self):
+        """Test updating a file by sending only the changed blocks."""
+
+        self.addCleanup(
+            setattr,
+            ChunkedDeltaView,
+            "remove_file_on_update",
+            ChunkedDeltaView.remove_file_on_update,
+        )
+        ChunkedDeltaView.remove_file_on_update = (
+            False  # The old file is removed anyway.
+        )
+        content = self.origin[:1000] + b"changed" + self.origin[1000:]
+        response = self.client.get(self.path, headers={"X-File-ID": self.checksum})
+        self.assertEqual(200, response.status_code)
+        signatures = response.json()
+        with tempfile.TemporaryFile() as fp:
+            fp.write(content)
+            instructions, data = delta.make_delta(
+                fp, signatures["signatures"], signatures["block_size"]
+            )
+
+        self.assertLess(len(data), len(content) // 4)
+        checksum = get_md5_checksum(content)
+        response = self.client.post(
+            self.path,
+            data={
+                "block_size": signatures["block_size"],
+                "instructions": json.dumps(instructions),
+                "file": SimpleUploadedFile("origin.bin", data),
+            },
+            headers={
+                "X-File-ID": self.checksum,
+                "X-File-Name": "origin.bin",
+                "X-File-Checksum": checksum,
+                "X-File-Size": len(content),
+                "X-File-MimeType": "application/octet-stream",
+            },
+        )
+        self.assertEqual(201, response.status_code, response.content)
+        instance = FileManager.objects.get(checksum=checksum)
+        with instance.file.open("rb") as f:
+            self.assertEqual(content, f.read())
+
+        response = self.client.get(self.path, headers={"X-File-ID": self.checksum})
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(os.path.exists(self.origin_path))
+
+    def test_delta_view_max_size(self):
+        """Test a delta growing past the declared size is aborted."""
+
+        response = self.client.post(
+            self.path,
+            data={
+                "block_size": 1,
+                "instructions": json.dumps([["copy", 0, 16]] * 1000),
+            },
+            headers={
+                "X-File-ID": self.checksum,
+                "X-File-Name": "origin.bin",
+                "X-File-Checksum": "checksum",
+                "X-File-Size": len(self.origin),
+                "X-File-MimeType": "application/octet-stream",
+            },
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertIn("exceeds", response.json()["message"])
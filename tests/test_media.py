@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` media module.
+"""
+
+import io
+import struct
+import wave
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse_lazy
+
+from django_chunk_file_upload import permissions
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.media import (
+    MP3Extractor,
+    MP4Extractor,
+    OggExtractor,
+    WAVExtractor,
+)
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.typed import File
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    remove_dir,
+)
+from django_chunk_file_upload.views import ChunkedUploadView
+
+
+def box(kind: bytes, *children: bytes) -> bytes:
+    body = b"".join(children)
+    return struct.pack(">I4s", len(body) + 8, kind) + body
+
+
+def make_mp4(mdat_size: int = 1024) -> bytes:
+    mvhd = box(b"mvhd", struct.pack(">B3xIIII", 0, 0, 0, 1000, 12500), bytes(80))
+    tkhd = box(
+        b"tkhd",
+        struct.pack(">B3x", 0),
+        bytes(72),
+        struct.pack(">II", 640 << 16, 360 << 16),
+    )
+    hdlr = box(b"hdlr", bytes(8), b"vide", bytes(12))
+    avc1 = box(b"avc1", bytes(24), struct.pack(">HH", 1280, 720), bytes(50))
+    stsd = box(b"stsd", struct.pack(">II", 0, 1), avc1)
+    mp4a = box(b"mp4a", bytes(16), struct.pack(">HHII", 2, 16, 0, 48000 << 16))
+    trak = box(b"trak", tkhd, box(b"mdia", hdlr, box(b"minf", box(b"stbl", stsd))))
+    sound = box(
+        b"trak",
+        box(
+            b"mdia",
+            box(b"hdlr", bytes(8), b"soun", bytes(12)),
+            box(b"minf", box(b"stbl", box(b"stsd", struct.pack(">II", 0, 1), mp4a))),
+        ),
+    )
+    return b"".join(
+        [
+            box(b"ftyp", b"isom", bytes(4), b"isomavc1"),
+            box(b"mdat", bytes(mdat_size)),
+            box(b"moov", mvhd, trak, sound),
+        ]
+    )
+
+
+def make_ogg_page(granule: int, body: bytes, serial: int = 1) -> bytes:
+    segments = [255] * (len(body) // 255) + [len(body) % 255]
+    return (
+        b"OggS\x00\x00"
+        + struct.pack("<qIII", granule, serial, 0, 0)
+        + bytes([len(segments)])
+        + bytes(segments)
+        + body
+    )
+
+
+def extract(extractor_class, extension: str, content: bytes, size: int = 5) -> dict:
+    extractor = extractor_class(File(_extension=extension))
+    for i in range(0, len(content), size):
+        extractor.feed(content[i : i + size])
+    return extractor.close()
+
+
+class TestExtractors(TestCase):
+    def test_mp4(self):
+        """Test moov parsed after a skipped mdat."""
+
+        info = extract(MP4Extractor, ".mp4", make_mp4(), 7)
+        self.assertEqual(
+            {
+                "brand": "isom",
+                "duration": 12.5,
+                "video_codec": "avc1",
+                "width": 640,
+                "height": 360,
+                "audio_codec": "mp4a",
+                "sample_rate": 48000,
+                "channels": 2,
+            },
+            info,
+        )
+        # Truncated files keep what was found.
+        self.assertEqual(
+            {"brand": "isom"}, extract(MP4Extractor, ".mp4", make_mp4()[:200])
+        )
+
+    def test_wav(self):
+        """Test the format chunk of a WAV file."""
+
+        fp = io.BytesIO()
+        with wave.open(fp, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(8000)
+            f.writeframes(bytes(16000))
+        self.assertEqual(
+            {
+                "audio_codec": "pcm",
+                "channels": 1,
+                "sample_rate": 8000,
+                "bits_per_sample": 16,
+                "bitrate": 128000,
+                "duration": 1.0,
+            },
+            extract(WAVExtractor, ".wav", fp.getvalue()),
+        )
+
+    def test_ogg(self):
+        """Test the duration from the last granule position."""
+
+        head = b"OpusHead\x01\x02" + struct.pack("<HI", 312, 44100) + bytes(3)
+        content = make_ogg_page(0, head) + b"".join(
+            make_ogg_page(granule, bytes(300)) for granule in (-1, 48000, 96000 + 312)
+        )
+        self.assertEqual(
+            {
+                "audio_codec": "opus",
+                "channels": 2,
+                "sample_rate": 44100,
+                "duration": 2.0,
+            },
+            extract(OggExtractor, ".opus", content),
+        )
+
+    def test_mp3(self):
+        """Test frame walking and the Xing frame count."""
+
+        frame = b"\xff\xfb\x90\x00" + bytes(413)  # MPEG1 Layer III 128 kbps 44.1 kHz
+        id3 = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + bytes(10)
+        info = extract(
+            MP3Extractor, ".mp3", id3 + frame * 100 + b"TAG" + bytes(125), 64
+        )
+        self.assertEqual(
+            {
+                "audio_codec": "mp3",
+                "sample_rate": 44100,
+                "channels": 2,
+                "duration": 2.612,
+                "bitrate_mode": "cbr",
+                "bitrate": 128000,
+            },
+            info,
+        )
+
+        xing = b"\xff\xfb\x90\x00" + bytes(32) + b"Xing" + struct.pack(">II", 1, 1000)
+        xing += bytes(417 - len(xing))
+        info = extract(MP3Extractor, ".mp3", xing + frame * 3)
+        self.assertEqual(26.122, info["duration"])
+        self.assertEqual("vbr", info["bitrate_mode"])
+
+
+class TestExtractUploadView(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        self.path = reverse_lazy("django_chunk_file_upload:uploads")
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_media_metadata(self):
+        """Test the metadata of a chunked video upload."""
+
+        content = make_mp4(1024 * 256)
+        chunk_size = 1024 * 64
+        for chunk_from in range(0, len(content), chunk_size):
+            chunk = content[chunk_from : chunk_from + chunk_size]
+            response = self.client.post(
+                self.path,
+                data={"file": SimpleUploadedFile("video.mp4", chunk)},
+                headers={
+                    "X-File-Name": "video.mp4",
+                    "X-File-Checksum": get_md5_checksum(content),
+                    "X-File-Chunk-From": chunk_from,
+                    "X-File-Chunk-Size": chunk_size,
+                    "X-File-Chunk-To": chunk_from + len(chunk),
+                    "X-File-EOF": chunk_from + chunk_size >= len(content),
+                    "X-File-Size": len(content),
+                    "X-File-MimeType": "video/mp4",
+                },
+            )
+            self.assertEqual(201, response.status_code, response.content)
+
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertTrue(instance.eof)
+        self.assertEqual(12.5, instance.metadata["media"]["duration"])
+        self.assertEqual(640, instance.metadata["media"]["width"])
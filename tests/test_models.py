@@ -8,21 +8,65 @@ django-chunk-file-upload
 Tests for `django-chunk-file-upload` models module.
 """
 
+import gzip
+import json
+import logging
 import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO
+from unittest import mock, skipIf
+from uuid import UUID
 
+from django.apps import apps
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser, Permission
+from django.core.files.uploadedfile import (
+    SimpleUploadedFile,
+    TemporaryUploadedFile,
+)
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase
 from django.test.client import MULTIPART_CONTENT
 from django.urls import reverse_lazy
+from django.utils import timezone
 
-from django_chunk_file_upload import permissions
+from PIL import Image
+
+from django_chunk_file_upload import permissions, utils
+from django_chunk_file_upload.admin import FileManagerModelAdmin
 from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.cache import FileCache
+from django_chunk_file_upload.constants import ActionChoices, TypeChoices
 from django_chunk_file_upload.models import FileManager
-from django_chunk_file_upload.optimize import ImageOptimizer
-from django_chunk_file_upload.utils import create_dir, remove_dir
-from django_chunk_file_upload.views import ChunkedUploadView
+from django_chunk_file_upload.optimize import (
+    ImageOptimizer,
+    OptimizerError,
+    optimizer_cache,
+    thumbnail_cache,
+)
+from django_chunk_file_upload.profiler import SamplingProfiler
+from django_chunk_file_upload.typed import File
+from django_chunk_file_upload.utils import (
+    ContentDecoder,
+    create_dir,
+    get_contiguous_size,
+    get_md5_checksum,
+    get_paths,
+    remove_dir,
+)
+from django_chunk_file_upload.views import (
+    ChunkedBundleUploadView,
+    ChunkedDownloadView,
+    ChunkedRegisterView,
+    ChunkedThumbnailView,
+    ChunkedUploadView,
+)
 
 
 class BaseTestCase(TestCase):
@@ -87,26 +131,26 @@ class TestDjangoChunkUploadView(BaseTestCase):
             "X-File-Name": "test.jpg",
             "X-File-Checksum": self.origin_image_checksum,
             "X-File-Chunk-From": self.chunk_from,
-            "X-File-Chunk-Size": self.chunk_to,
+            "X-File-Chunk-Size": self.CHUNK_SIZE,
             "X-File-Chunk-To": self.chunk_to,
-            "X-File-EOF": bool(self.chunk_to > self.file_stat.st_size),
+            "X-File-EOF": bool(self.chunk_to >= self.file_stat.st_size),
             "X-File-Size": self.file_stat.st_size,
             "X-File-MimeType": "image/jpeg",
         }
 
     def _get_response(self):
         with open(self.IMAGE_FILE, "rb") as f:
-            chunk_from, chunk_to = 0, self.CHUNK_SIZE
+            self.chunk_from = 0
             response = None
             while chunk := f.read(self.CHUNK_SIZE):
+                self.chunk_to = self.chunk_from + len(chunk)
                 response = self.client.post(
                     path=reverse_lazy("django_chunk_file_upload:uploads"),
                     data={"file": SimpleUploadedFile("test.jpg", chunk)},
                     content_type=MULTIPART_CONTENT,
                     headers=self._get_headers(),
                 )
-                chunk_from += self.CHUNK_SIZE
-                chunk_to += self.CHUNK_SIZE
+                self.chunk_from = self.chunk_to
 
             return response
 
@@ -131,6 +175,15 @@ class TestDjangoChunkUploadView(BaseTestCase):
         self.assertEqual(
             instance.checksum, self.origin_image_checksum, "Invalid MD5 checksum."
         )
+        self.assertEqual(
+            ("test.jpg", self.file_stat.st_size, "image/jpeg"),
+            (instance.filename, instance.size, instance.mimetype),
+        )
+        self.assertEqual("optimized", instance.metadata["optimizer"]["action"])
+        self.assertEqual(
+            get_md5_checksum(instance.file.path),
+            instance.metadata["optimizer"]["checksum"],
+        )
         instance.delete()
 
     def test_upload_view_with_allow_any_permission(self):
@@ -141,6 +194,20 @@ class TestDjangoChunkUploadView(BaseTestCase):
         self.assertEqual(201, response.status_code, "Failed to upload files.")
         self._instance_validate()
 
+    def test_upload_view_chunk_out_of_range(self):
+        """Test a chunk past the declared file size is rejected unwritten."""
+
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        headers = self._get_headers()
+        headers.update({"X-File-Chunk-From": 2**40, "X-File-EOF": False})
+        response = self.client.post(
+            path=reverse_lazy("django_chunk_file_upload:uploads"),
+            data={"file": SimpleUploadedFile("test.jpg", b"0" * 16)},
+            headers=headers,
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(FileManager.objects.exists())
+
     def test_upload_view_with_is_authenticated_permission(self):
         """Test ChunkedUploadView with IsAuthenticated permission."""
 
@@ -205,6 +272,765 @@ class TestDjangoChunkUploadView(BaseTestCase):
         )
         self._instance_validate()
 
+    def test_upload_view_with_sampling_profiler(self):
+        """Test ChunkedUploadView dumps tagged pstats files."""
+
+        output_dir = os.path.join(app_settings.upload_to, "profiles")
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        ChunkedUploadView.profiler = SamplingProfiler(
+            sample_rate=1, output_dir=output_dir, max_files=2
+        )
+        try:
+            response = self._get_response()
+        finally:
+            ChunkedUploadView.profiler = SamplingProfiler()
+
+        self.assertEqual(201, response.status_code, "Failed to upload files.")
+        profiles = os.listdir(output_dir)
+        self.assertEqual(2, len(profiles), "Profile directory is not rotated.")
+        for filename in profiles:
+            self.assertIn("type_IMAGE", filename)
+            self.assertIn("chunk_", filename)
+            self.assertTrue(filename.endswith(".pstats"))
+        self._instance_validate()
+
+    def test_upload_view_chunk_logging_modes(self):
+        """Test per-chunk logging modes of ChunkedUploadView."""
+
+        view = ChunkedUploadView()
+        first = File(checksum="checksum", chunk_from="0")
+        middle = File(checksum="checksum", chunk_from="65536")
+        last = File(checksum="checksum", chunk_from="131072", eof=True)
+
+        view.log_chunks = "boundary"
+        self.assertTrue(view.is_chunk_logged(first))
+        self.assertFalse(view.is_chunk_logged(middle))
+        self.assertTrue(view.is_chunk_logged(last))
+
+        view.log_chunks, view.log_sample_rate = "sampled", 0.5
+        self.assertEqual(
+            {view.is_chunk_logged(first)},
+            {view.is_chunk_logged(obj) for obj in (middle, last)},
+            "Sampling must be decided per upload.",
+        )
+
+        view.log_chunks = "none"
+        self.assertFalse(view.is_chunk_logged(last))
+
+
+class TestChunkedRegisterView(TestCase):
+    def _post(self, files):
+        return self.client.post(
+            path=reverse_lazy("django_chunk_file_upload:uploads-register"),
+            data=json.dumps({"files": files}),
+            content_type="application/json",
+        )
+
+    def test_register_view(self):
+        """Test classifying and registering many files at once."""
+
+        ChunkedRegisterView.permission_classes = (permissions.AllowAny,)
+        FileManager.objects.create(checksum="completed", eof=True, file="a.jpg")
+        FileManager.objects.create(checksum="resumable", eof=False)
+        files = [
+            {
+                "name": "%s.jpg" % checksum,
+                "size": 10,
+                "mimetype": "image/jpeg",
+                "checksum": checksum,
+            }
+            for checksum in ("completed", "resumable", "new-1", "new-2")
+        ]
+        files.append({"name": "a.jpg", "mimetype": "image/jpeg", "checksum": ""})
+        with self.assertNumQueries(3):
+            response = self._post(files)
+
+        self.assertEqual(200, response.status_code)
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["completed", "resumable", "new", "new", "invalid"], statuses)
+        self.assertEqual(
+            2, FileManager.objects.filter(checksum__startswith="new-").count()
+        )
+
+        statuses = [result["status"] for result in self._post(files).json()["files"]]
+        self.assertEqual(
+            ["completed", "resumable", "resumable", "resumable", "invalid"], statuses
+        )
+
+    def test_register_view_race(self):
+        """Test rows created by a concurrent request are not reported as new."""
+
+        ChunkedRegisterView.permission_classes = (permissions.AllowAny,)
+        FileManager.objects.create(checksum="completed", eof=True, file="a.jpg")
+        files = [
+            {
+                "name": "%s.jpg" % checksum,
+                "mimetype": "image/jpeg",
+                "checksum": checksum,
+            }
+            for checksum in ("completed", "new")
+        ]
+        # The classification query misses the row, as if it was just created.
+        with mock.patch.object(
+            ChunkedRegisterView,
+            "get_queryset",
+            lambda view, checksums: FileManager.objects.none(),
+        ):
+            response = self._post(files)
+
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["completed", "new"], statuses)
+        self.assertEqual(1, FileManager.objects.filter(checksum="completed").count())
+
+        # Again, on a backend that does not set the primary keys.
+        bulk_create = FileManager.objects.bulk_create
+
+        def bulk_create_without_pk(objs, **kwargs):
+            bulk_create(objs, **kwargs)
+            for obj in objs:
+                obj.pk = None
+            return objs
+
+        with mock.patch.object(
+            ChunkedRegisterView,
+            "get_queryset",
+            lambda view, checksums: FileManager.objects.none(),
+        ):
+            with mock.patch.object(
+                FileManager.objects, "bulk_create", side_effect=bulk_create_without_pk
+            ):
+                response = self._post(files)
+
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["completed", "new"], statuses)
+        self.assertEqual(1, FileManager.objects.filter(checksum="completed").count())
+        self.assertEqual(1, FileManager.objects.filter(checksum="new").count())
+
+
+class TestChunkedBundleUploadView(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def _post(self, contents: dict, checksums: dict = None):
+        checksums = checksums or {}
+        manifest = [
+            {
+                "name": name,
+                "size": len(content),
+                "mimetype": "application/json",
+                "checksum": checksums.get(name, get_md5_checksum(content)),
+            }
+            for name, content in contents.items()
+        ]
+        return self.client.post(
+            path=reverse_lazy("django_chunk_file_upload:uploads-bundle"),
+            data={
+                "manifest": json.dumps(manifest),
+                "file": [
+                    SimpleUploadedFile(name, content)
+                    for name, content in contents.items()
+                ],
+            },
+        )
+
+    def test_bundle_upload_view(self):
+        """Test uploading many small files in a single request."""
+
+        ChunkedBundleUploadView.permission_classes = (permissions.AllowAny,)
+        contents = {"%s.json" % i: b'{"id": %d}' % i for i in range(3)}
+        response = self._post(contents, checksums={"2.json": "invalid"})
+        self.assertEqual(200, response.status_code)
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["created", "created", "invalid"], statuses)
+
+        instance = FileManager.objects.get(checksum=get_md5_checksum(b'{"id": 0}'))
+        self.assertTrue(instance.eof)
+        self.assertEqual(b'{"id": 0}', instance.file.read())
+        instance.file.close()
+
+        response = self._post(contents)
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["completed", "completed", "created"], statuses)
+        self.assertEqual(3, FileManager.objects.filter(eof=True).count())
+
+    def test_bundle_upload_view_cleanup(self):
+        """Test the files and optimized images are removed when the insert fails."""
+
+        ChunkedBundleUploadView.permission_classes = (permissions.AllowAny,)
+        content = BytesIO()
+        Image.effect_noise((400, 300), 64).convert("RGB").save(content, "PNG")
+        contents = {"image.png": content.getvalue(), "data.json": b'{"id": 1}'}
+        manifest = [
+            {
+                "name": name,
+                "size": len(data),
+                "mimetype": (
+                    "image/png" if name.endswith(".png") else "application/json"
+                ),
+                "checksum": get_md5_checksum(data),
+            }
+            for name, data in contents.items()
+        ]
+        body = {
+            "manifest": json.dumps(manifest),
+            "file": [SimpleUploadedFile(name, data) for name, data in contents.items()],
+        }
+        store = ImageOptimizer.store
+
+        def store_keep_origin(fp, filename, upload_to, remove_origin, write):
+            # remove_origin=False: the upload and its optimized output remain.
+            return store(fp, filename, upload_to, False, write)
+
+        with mock.patch.object(ChunkedBundleUploadView, "optimize", True):
+            with mock.patch.object(
+                ImageOptimizer, "store", side_effect=store_keep_origin
+            ) as store_mock:
+                with mock.patch.object(
+                    FileManager.objects,
+                    "bulk_create",
+                    side_effect=DatabaseError("boom"),
+                ):
+                    response = self.client.post(
+                        path=reverse_lazy("django_chunk_file_upload:uploads-bundle"),
+                        data=body,
+                    )
+        self.assertTrue(store_mock.called)
+
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["error", "error"], statuses)
+        stored = [
+            filename
+            for dirpath, _, filenames in os.walk(app_settings.upload_to)
+            if not dirpath.startswith(optimizer_cache.root)
+            and not dirpath.startswith(thumbnail_cache.root)
+            for filename in filenames
+        ]
+        self.assertEqual([], stored)
+
+    def test_bundle_upload_view_too_large(self):
+        """Test a bundle larger than the request limit is refused unparsed."""
+
+        ChunkedBundleUploadView.permission_classes = (permissions.AllowAny,)
+        contents = {"0.json": b'{"id": "%s"}' % (b"0" * 1024 * 128)}
+        with mock.patch.multiple(
+            ChunkedBundleUploadView, max_files=1, max_file_size=1024
+        ):
+            with mock.patch.object(ChunkedBundleUploadView, "bundle") as bundle:
+                response = self._post(contents)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual("The bundle is too large.", response.json()["message"])
+        bundle.assert_not_called()
+
+
+class TestChunkedDownloadView(TestCase):
+    content = b"0123456789"
+
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedDownloadView.permission_classes = (permissions.AllowAny,)
+        self.checksum = get_md5_checksum(self.content)
+        save_path, path = get_paths("download.txt", app_settings.upload_to)
+        with open(save_path, "wb") as f:
+            f.write(self.content)
+        FileManager.objects.create(checksum=self.checksum, eof=True, file=path)
+        self.path = reverse_lazy(
+            "django_chunk_file_upload:downloads", kwargs={"checksum": self.checksum}
+        )
+
+    def tearDown(self):
+        ChunkedDownloadView.x_accel_redirect = None
+        remove_dir(app_settings.upload_to)
+
+    def test_download_view(self):
+        """Test serving a file with ETag and Range support."""
+
+        etag = '"%s"' % self.checksum
+        response = self.client.get(self.path)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(etag, response["ETag"])
+        self.assertEqual(self.content, b"".join(response.streaming_content))
+
+        response = self.client.get(self.path, headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+
+        response = self.client.get(self.path, headers={"Range": "bytes=2-5"})
+        self.assertEqual(206, response.status_code)
+        self.assertEqual("bytes 2-5/10", response["Content-Range"])
+        self.assertEqual(b"2345", b"".join(response.streaming_content))
+
+        response = self.client.get(self.path, headers={"Range": "bytes=-3"})
+        self.assertEqual(b"789", b"".join(response.streaming_content))
+
+        response = self.client.get(self.path, headers={"Range": "bytes=20-"})
+        self.assertEqual(416, response.status_code)
+
+        ChunkedDownloadView.x_accel_redirect = "/protected/"
+        response = self.client.get(self.path)
+        self.assertTrue(response["X-Accel-Redirect"].startswith("/protected/"))
+        self.assertEqual(b"", response.content)
+
+        response = self.client.get(
+            reverse_lazy(
+                "django_chunk_file_upload:downloads", kwargs={"checksum": "unknown"}
+            )
+        )
+        self.assertEqual(404, response.status_code)
+
+    def test_download_view_after_update(self):
+        """Test the ETag follows the content replaced by an update."""
+
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        etag = '"%s"' % self.checksum
+        content = b"9876543210"
+        response = self.client.post(
+            path=reverse_lazy("django_chunk_file_upload:uploads"),
+            data={
+                "action": ActionChoices.UPDATE,
+                "file": SimpleUploadedFile("download.txt", content),
+            },
+            headers={
+                "X-File-ID": self.checksum,
+                "X-File-Name": "download.txt",
+                "X-File-Checksum": get_md5_checksum(content),
+                "X-File-Chunk-From": 0,
+                "X-File-Chunk-Size": len(content),
+                "X-File-Chunk-To": len(content),
+                "X-File-EOF": True,
+                "X-File-Size": len(content),
+                "X-File-MimeType": "text/plain",
+            },
+        )
+        self.assertEqual(201, response.status_code, response.content)
+
+        response = self.client.get(self.path, headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('"%s"' % get_md5_checksum(content), response["ETag"])
+        self.assertEqual(content, b"".join(response.streaming_content))
+
+        response = self.client.get(
+            self.path, headers={"Range": "bytes=2-5", "If-Range": etag}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(content, b"".join(response.streaming_content))
+
+
+class TestChunkedThumbnailView(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedThumbnailView.permission_classes = (permissions.AllowAny,)
+        save_path, path = get_paths("photo.png", app_settings.upload_to)
+        Image.linear_gradient("L").resize((800, 400)).save(save_path)
+        self.checksum = get_md5_checksum(save_path)
+        FileManager.objects.create(
+            checksum=self.checksum, eof=True, file=path, type=TypeChoices.IMAGE
+        )
+        self.path = reverse_lazy(
+            "django_chunk_file_upload:thumbnails", kwargs={"checksum": self.checksum}
+        )
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_thumbnail_view(self):
+        """Test thumbnails of allowed sizes, cached with a strong ETag."""
+
+        response = self.client.get(self.path, {"size": "100x100"})
+        self.assertEqual(400, response.status_code)
+
+        response = self.client.get(self.path, {"size": "160x160"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("image/webp", response["Content-Type"])
+        etag = response["ETag"]
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual((160, 80), image.size)
+
+        key = ImageOptimizer.get_thumbnail_key(self.checksum, 160, 160)
+        self.assertEqual('"%s"' % key, etag)
+        self.assertEqual(160, thumbnail_cache.get(key)["width"])
+        response = self.client.get(
+            self.path, {"size": "160x160"}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(304, response.status_code)
+
+        instance = FileManager.objects.get(checksum=self.checksum)
+        Image.new("L", (400, 400)).save(instance.file.path)
+        instance.metadata = {"content_checksum": get_md5_checksum(instance.file.path)}
+        instance.save()
+        response = self.client.get(
+            self.path, {"size": "160x160"}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual((160, 160), image.size)
+
+    def test_single_flight(self):
+        """Test concurrent misses of a key create the entry once."""
+
+        cache = FileCache(
+            "test", max_size=1024 * 1024, cache_dir=app_settings.upload_to
+        )
+        calls = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"n": len(calls)}, b"data", ".bin"
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            entries = list(
+                executor.map(lambda _: cache.get_or_create("k" * 64, create), range(8))
+            )
+        self.assertEqual(1, len(calls))
+        self.assertEqual({1}, {entry["n"] for entry in entries})
+
+
+class TestChunkedListView(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username="owner", password="owner"
+        )
+        created_at = timezone.now()
+        objs = FileManager.objects.bulk_create(
+            [
+                FileManager(
+                    checksum=str(i),
+                    eof=i != 4,
+                    file="file-%s.txt" % i,
+                    filename="%s.txt" % i,
+                    size=i,
+                    type=TypeChoices.IMAGE if i % 2 else TypeChoices.TEXT,
+                    user=self.user,
+                )
+                for i in range(5)
+            ]
+            + [FileManager(checksum="other", eof=True)]
+        )
+        for i, obj in enumerate(objs[:5]):
+            # Two files share a timestamp, the id breaks the tie.
+            obj.created_at = created_at - timedelta(seconds=min(i, 3))
+        FileManager.objects.bulk_update(objs[:5], ["created_at"])
+        self.path = reverse_lazy("django_chunk_file_upload:files")
+
+    def test_list_view(self):
+        """Test walking the pages of the user files with the cursor."""
+
+        self.assertEqual(404, self.client.get(self.path).status_code)
+        self.client.force_login(self.user)
+        checksums, cursor = [], None
+        while True:
+            data = {"limit": 2, "cursor": cursor} if cursor else {"limit": 2}
+            with self.assertNumQueries(3):  # Session, user, page.
+                response = self.client.get(self.path, data)
+            self.assertEqual(200, response.status_code)
+            checksums += [result["checksum"] for result in response.json()["results"]]
+            cursor = response.json()["next"]
+            if not cursor:
+                break
+        self.assertEqual(["0", "1", "2", "4", "3"], checksums)
+
+        results = self.client.get(self.path, {"type": "IMAGE"}).json()["results"]
+        self.assertEqual(["1", "3"], [result["checksum"] for result in results])
+        self.assertEqual(
+            {"name": "1.txt", "size": 1, "url": "/media/file-1.txt"},
+            {k: results[0][k] for k in ("name", "size", "url")},
+        )
+        results = self.client.get(self.path, {"eof": "false"}).json()["results"]
+        self.assertEqual(["4"], [result["checksum"] for result in results])
+        self.assertIsNone(results[0]["url"])
+
+        for data in ({"cursor": "invalid"}, {"type": "invalid"}, {"limit": 0}):
+            self.assertEqual(400, self.client.get(self.path, data).status_code)
+
+
+class TestFileManagerModelAdmin(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        self.user = get_user_model().objects.create_superuser(
+            username="admin", password="admin"
+        )
+        for i in range(3):
+            save_path, path = get_paths("image-%s.png" % i, app_settings.upload_to)
+            Image.new("RGB", (320, 160), (i * 80, 0, 0)).save(save_path)
+            FileManager.objects.create(
+                checksum=get_md5_checksum(save_path),
+                eof=True,
+                file=path,
+                type=TypeChoices.IMAGE,
+                user=self.user,
+                filename="image-%s.png" % i,
+                metadata={"name": "image-%s.png" % i, "size": 1},
+            )
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def test_changelist(self):
+        """Test the list shows names and cached thumbnails in constant queries."""
+
+        self.client.force_login(self.user)
+        path = reverse_lazy("admin:django_chunk_file_upload_filemanager_changelist")
+        with mock.patch.object(ImageOptimizer, "get_thumbnail") as get_thumbnail:
+            response = self.client.get(path)
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(get_thumbnail.called)
+        self.assertContains(response, "image-2.png")
+        self.assertContains(response, 'loading="lazy"', count=3)
+        self.assertContains(response, "?size=64x64", count=3)
+
+        # Created by the thumbnail view, then linked from the cache.
+        instance = FileManager.objects.filter(type=TypeChoices.IMAGE).first()
+        thumbnail_path = reverse_lazy(
+            "django_chunk_file_upload:thumbnails", args=[instance.checksum]
+        )
+        response = self.client.get(thumbnail_path, {"size": "64x64"})
+        self.assertEqual(200, response.status_code)
+        response = self.client.get(path)
+        self.assertContains(response, settings.MEDIA_URL)
+        self.assertContains(response, "?size=64x64", count=2)
+
+        FileManager.objects.create(checksum="other", eof=True, user=self.user)
+        with self.assertNumQueries(4):
+            self.client.get(path)
+
+    def test_thumbnail_staff(self):
+        """Test staff with the view permission get the previews of all users."""
+
+        ChunkedThumbnailView.permission_classes = (permissions.AllowAny,)
+        staff = get_user_model().objects.create_user(username="staff", is_staff=True)
+        instance = FileManager.objects.filter(type=TypeChoices.IMAGE).first()
+        path = reverse_lazy(
+            "django_chunk_file_upload:thumbnails", args=[instance.checksum]
+        )
+        self.client.force_login(staff)
+        self.assertEqual(404, self.client.get(path, {"size": "64x64"}).status_code)
+
+        staff.user_permissions.add(Permission.objects.get(codename="view_filemanager"))
+        staff = get_user_model().objects.get(pk=staff.pk)
+        self.client.force_login(staff)
+        self.assertEqual(200, self.client.get(path, {"size": "64x64"}).status_code)
+
+    def test_add_view_bundle(self):
+        """Test the add form passes the bundle endpoint to the uploader."""
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse_lazy("admin:django_chunk_file_upload_filemanager_add")
+        )
+        self.assertContains(
+            response, reverse_lazy("django_chunk_file_upload:uploads-bundle")
+        )
+        self.assertContains(response, '"%s"' % app_settings.bundle_max_file_size)
+
+    def test_delete_queryset(self):
+        """Test the files of the deleted rows are removed."""
+
+        paths = [instance.file.path for instance in FileManager.objects.all()]
+        model_admin = FileManagerModelAdmin(FileManager, admin.site)
+        model_admin.delete_queryset(None, FileManager.objects.all())
+        self.assertFalse(FileManager.objects.exists())
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+
+class TestFileManagerColumns(TestCase):
+    def test_backfill(self):
+        """Test the migration copies the columns out of the metadata."""
+
+        backfill = import_module(
+            "django_chunk_file_upload.migrations.0005_backfill_filemanager_filename_size_mimetype"
+        )
+        FileManager.objects.bulk_create(
+            [
+                FileManager(
+                    checksum=str(i),
+                    metadata={"name": "%s.txt" % i, "size": str(i), "mimetype": "a/b"},
+                )
+                for i in range(5)
+            ]
+            + [FileManager(checksum="empty")]
+        )
+        self.addCleanup(setattr, backfill, "BATCH_SIZE", backfill.BATCH_SIZE)
+        backfill.BATCH_SIZE = 2
+        backfill.backfill(apps, connection.schema_editor())
+
+        self.assertEqual(
+            ("3.txt", 3, "a/b"),
+            FileManager.objects.values_list("filename", "size", "mimetype").get(
+                checksum="3"
+            ),
+        )
+        self.assertEqual(
+            5, FileManager.objects.filter(size__isnull=False, mimetype="a/b").count()
+        )
+        instance = FileManager.objects.get(checksum="empty")
+        self.assertEqual(("", None), (instance.filename, instance.size))
+
+
+class TestQueueLogging(TestCase):
+    def test_without_handlers(self):
+        """Test the records still propagate when there is no handler to queue."""
+
+        logger = logging.getLogger("django_chunk_file_upload.tests")
+        with mock.patch.object(logging.root, "handlers", []):
+            self.assertIsNone(utils.setup_queue_logging(logger.name))
+        self.assertTrue(logger.propagate)
+        self.assertEqual([], logger.handlers)
+
+
+class TestChunkMetadata(TestCase):
+    def test_concurrent_chunks(self):
+        """Test concurrent chunks keep the metadata saved by each other."""
+
+        FileManager.objects.create(checksum="checksum", metadata={"rows": 1})
+        view = ChunkedUploadView()
+        view.request = RequestFactory().post("/", headers={"X-File-ID": "checksum"})
+        view.request.user = AnonymousUser()
+        first, second = view.get_instance(), view.get_instance()
+
+        file_obj = File(checksum="checksum", _extension=".jpg")
+        file_obj._extra_metadata["content_type"] = {"type": "IMAGE"}
+        view.save(first, file_obj)
+        file_obj = File(checksum="checksum", _extension=".jpg")
+        file_obj._extra_metadata["_processors_owner"] = "worker:1"
+        second.metadata.pop("rows")
+        view.save(second, file_obj)
+
+        metadata = FileManager.objects.get(checksum="checksum").metadata
+        self.assertEqual({"type": "IMAGE"}, metadata["content_type"])
+        self.assertEqual("worker:1", metadata["_processors_owner"])
+        self.assertNotIn("rows", metadata)
+
+
+class TestFileWrite(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def _get_file(self, temporary: bool, content: bytes):
+        if temporary:
+            file = TemporaryUploadedFile(
+                "test.bin", "application/octet-stream", len(content), None
+            )
+            file.write(content)
+            file.seek(0)
+        else:
+            file = SimpleUploadedFile("test.bin", content)
+        return File(
+            _file=file,
+            _extension=".bin",
+            _upload_to=app_settings.upload_to,
+            checksum="checksum",
+            chunk_size="4",
+            size=str(len(content) * 2),
+        )
+
+    def test_write_temporary_uploaded_file(self):
+        """Test chunks spooled to disk are appended with a kernel copy."""
+
+        for temporary in (True, False):
+            file_obj = self._get_file(temporary, b"0123456789")
+            file_obj.write("wb+")
+            file_obj.write("ab+")
+            with open(file_obj.save_path, "rb") as f:
+                self.assertEqual(b"0123456789" * 2, f.read())
+            file_obj.file.close()
+
+    def test_write_encoded_chunks(self):
+        """Test compressed chunks are decoded at their decoded offsets."""
+
+        content = b"id,name\n" + b"".join(b"%d,name-%d\n" % (i, i) for i in range(5000))
+        chunk_size = 1024 * 16
+        for encoding, compress in (
+            ("gzip", gzip.compress),
+            ("deflate", zlib.compress),
+            ("identity", bytes),
+        ):
+            save_path = None
+            for offset in reversed(range(0, len(content), chunk_size)):
+                chunk = content[offset : offset + chunk_size]
+                file_obj = File(
+                    _file=SimpleUploadedFile("test.csv", compress(chunk)),
+                    _extension=".csv",
+                    _upload_to=app_settings.upload_to,
+                    checksum=encoding,
+                    chunk_from=str(offset),
+                    chunk_size=str(chunk_size),
+                    content_encoding=encoding,
+                    size=str(len(content)),
+                )
+                file_obj.write("ab+")
+                save_path = file_obj.save_path
+
+            with open(save_path, "rb") as f:
+                self.assertEqual(content, f.read())
+            self.assertEqual(len(content), get_contiguous_size(save_path + ".parts"))
+
+    def test_write_encoded_chunk_guard(self):
+        """Test decompression bombs, truncated and unsupported bodies are rejected."""
+
+        for encoding, body in (
+            ("gzip", gzip.compress(b"\0" * 1024 * 1024)),
+            ("gzip", gzip.compress(b"0123456789")[:-4]),
+            ("deflate", b"not deflate"),
+            ("compress", b"0123456789"),
+        ):
+            file_obj = File(
+                _file=SimpleUploadedFile("test.csv", body),
+                _extension=".csv",
+                _upload_to=app_settings.upload_to,
+                checksum="checksum",
+                chunk_from="0",
+                chunk_size="65536",
+                content_encoding=encoding,
+                size="65536",
+            )
+            with self.assertRaises(ValueError):
+                file_obj.write("wb+")
+
+    @skipIf(
+        not hasattr(
+            getattr(utils.brotli, "Decompressor", None), "can_accept_more_data"
+        ),
+        "brotli >= 1.2 is not installed",
+    )
+    def test_decode_brotli_bound(self):
+        """Test a brotli bomb is stopped at the decoded size limit."""
+
+        body = utils.brotli.compress(b"\0" * 1024 * 1024 * 64)
+        decoder = ContentDecoder("br", 65536)
+        with self.assertRaises(ValueError):
+            for data in decoder.decode(body):
+                self.assertLessEqual(len(data), 65537)
+
+        decoder = ContentDecoder("br", 65536)
+        body = utils.brotli.compress(b"0123456789" * 100)
+        self.assertEqual(b"0123456789" * 100, b"".join(decoder.decode(body)))
+        self.assertEqual(b"", decoder.flush())
+
+    def test_write_out_of_range(self):
+        """Test chunks outside of the declared file size are rejected."""
+
+        for chunk_from, size in (("-1", "10"), (str(2**40), "10"), ("6", "10")):
+            file_obj = self._get_file(False, b"01234")
+            file_obj.chunk_from, file_obj.size = chunk_from, size
+            self.assertFalse(file_obj.is_valid_range())
+            with self.assertRaises(ValueError):
+                file_obj.write("ab+")
+        file_obj = self._get_file(False, b"01234")
+        file_obj.size = None
+        self.assertFalse(file_obj.is_valid_range())
+
+        file_obj = self._get_file(False, b"01234")
+        file_obj.chunk_from, file_obj.size = "5", "10"
+        self.assertTrue(file_obj.is_valid_range())
+        file_obj.write("ab+")
+        self.assertEqual(10, os.path.getsize(file_obj.save_path))
+
 
 class TestImageOptimizer(BaseTestCase):
     def test_image_optimize(self):
@@ -212,3 +1038,298 @@ class TestImageOptimizer(BaseTestCase):
         assert ImageOptimizer.checksum(self.IMAGE_FILE) != ImageOptimizer.checksum(
             os.path.join(settings.MEDIA_ROOT, self.image_path)
         )
+
+    def _save_image(self, name: str, fm: str, mode: str = "RGB") -> str:
+        save_path, _ = get_paths(name, upload_to=app_settings.upload_to)
+        Image.new(mode, (64, 48), color=1).save(save_path, fm)
+        return save_path
+
+    def test_skip_optimal_image(self):
+        """Test a small in-bounds WebP is not re-encoded."""
+
+        save_path = self._save_image("small.webp", "WEBP")
+        checksum = get_md5_checksum(save_path)
+        report = {}
+        image, path = ImageOptimizer.optimize(save_path, to_webp=True, report=report)
+        ImageOptimizer.close(image)
+        self.assertIsNone(path)
+        self.assertEqual("skipped", report["action"])
+        self.assertEqual(checksum, get_md5_checksum(save_path))
+
+        # Not in the output format or not palette based.
+        for name, fm, mode in (("a.jpg", "JPEG", "RGB"), ("b.png", "PNG", "RGB")):
+            with Image.open(self._save_image(name, fm, mode)) as image:
+                self.assertFalse(ImageOptimizer.is_optimal(image, 100, to_webp=True))
+                self.assertEqual(
+                    fm == "JPEG",
+                    ImageOptimizer.is_optimal(image, 100, to_webp=False),
+                )
+
+    def test_optimizer_cache(self):
+        """Test the same source is encoded once per optimizer settings."""
+
+        content = BytesIO()
+        Image.effect_noise((1600, 900), 64).convert("RGB").save(content, "JPEG")
+        checksum = get_md5_checksum(content.getvalue())
+        paths = []
+        for max_width, cache in ((800, "miss"), (800, "hit"), (400, "miss")):
+            save_path, _ = get_paths("source.jpg", upload_to=app_settings.upload_to)
+            with open(save_path, "wb") as f:
+                f.write(content.getvalue())
+
+            report = {}
+            image, path = ImageOptimizer.optimize(
+                save_path,
+                max_width=max_width,
+                report=report,
+                upload_to=app_settings.upload_to,
+            )
+            self.assertEqual(cache, report["cache"])
+            self.assertEqual("optimized", report["action"])
+            self.assertEqual(max_width, image.size[0])
+            self.assertFalse(os.path.exists(save_path))
+            ImageOptimizer.close(image)
+            paths.append(path)
+        self.assertEqual(paths[0], paths[1])
+        self.assertTrue(os.path.basename(paths[0]).startswith(str(UUID(hex=checksum))))
+
+        # The entry is evicted between the lookup and the copy: encode it again.
+        save_path, _ = get_paths("source.jpg", upload_to=app_settings.upload_to)
+        with open(save_path, "wb") as f:
+            f.write(content.getvalue())
+        report = {}
+        with mock.patch.object(
+            optimizer_cache, "copy", side_effect=FileNotFoundError("evicted")
+        ):
+            image, path = ImageOptimizer.optimize(
+                save_path,
+                max_width=800,
+                report=report,
+                upload_to=app_settings.upload_to,
+            )
+        ImageOptimizer.close(image)
+        self.assertEqual("miss", report["cache"])
+        self.assertEqual("optimized", report["action"])
+        self.assertEqual(paths[0], path)
+        self.assertFalse(os.path.exists(save_path))
+
+    def test_file_cache_eviction(self):
+        """Test the least recently used entries are evicted first."""
+
+        cache = FileCache("test", max_size=2500, cache_dir=app_settings.upload_to)
+        for i in range(3):
+            cache.put(str(i) * 64, {"i": i}, bytes(1000), ".bin")
+            os.utime(cache.get_path(str(i) * 64, ".bin"), (i, i))
+            os.utime(cache.get_path(str(i) * 64, ".json"), (i, i))
+        cache.evict()
+        self.assertIsNone(cache.get("0" * 64))
+        self.assertEqual(2, cache.get("2" * 64)["i"])
+
+    def test_keep_original_image(self):
+        """Test the original is kept when the re-encoded image is not smaller."""
+
+        save_path = self._save_image("keep.png", "PNG", "P")
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            save_path,
+            to_webp=False,
+            skip_max_size=0,
+            min_saving=1,
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertIsNone(path)
+        self.assertEqual("kept_original", report["action"])
+        self.assertTrue(os.path.exists(save_path))
+
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            save_path,
+            to_webp=True,
+            skip_max_size=0,
+            min_saving=-1,
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertTrue(path.endswith(".webp"))
+        self.assertEqual("optimized", report["action"])
+        self.assertFalse(os.path.exists(save_path))
+
+    def test_quality_search(self):
+        """Test the quality search against a byte budget and a similarity."""
+
+        image = Image.blend(
+            Image.effect_mandelbrot((1200, 900), (-2, -1.2, 1, 1.2), 100).convert(
+                "RGB"
+            ),
+            Image.effect_noise((1200, 900), 32).convert("RGB"),
+            0.2,
+        )
+        fixed = ImageOptimizer.encode(image, "JPEG", 95).tell()
+        search = ImageOptimizer.search_quality(
+            image, "JPEG", mode="size", target_size=fixed // 2
+        )
+        self.assertLess(search["quality"], 95)
+        self.assertLessEqual(search["predicted_size"], fixed // 2)
+        self.assertLessEqual(search["trials"], 6)
+
+        loose = ImageOptimizer.search_quality(
+            image, "JPEG", mode="similarity", target_similarity=0.5
+        )
+        strict = ImageOptimizer.search_quality(
+            image, "JPEG", mode="similarity", target_similarity=0.9
+        )
+        self.assertLessEqual(loose["quality"], strict["quality"])
+        self.assertGreaterEqual(strict["similarity"], 0.9)
+        self.assertEqual(1.0, round(ImageOptimizer.get_similarity(image, image), 4))
+
+        save_path, _ = get_paths("search.jpg", upload_to=app_settings.upload_to)
+        image.save(save_path, "JPEG", quality=100)
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            save_path,
+            to_webp=False,
+            quality_mode="size",
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertEqual("size", report["quality_search"]["mode"])
+        self.assertEqual(report["quality_search"]["quality"], report["quality"])
+
+    def test_png_strategy(self):
+        """Test graphics get a palette, photos and alpha gradients do not."""
+
+        graphic = Image.new("RGB", (800, 600), "white")
+        graphic.paste((200, 30, 30), (100, 100, 700, 300))
+        size = (800, 600)
+        photo = Image.merge(
+            "RGB",
+            [
+                Image.effect_noise(size, 48),
+                Image.effect_mandelbrot(size, (-2, -1.2, 1, 1.2), 100),
+                Image.linear_gradient("L").resize(size),
+            ],
+        )
+        translucent = photo.convert("RGBA")
+        translucent.putalpha(Image.radial_gradient("L").resize(size))
+
+        decision = ImageOptimizer.get_png_strategy(graphic, "PNG")
+        self.assertEqual("palette", decision["strategy"])
+        self.assertEqual(2, decision["colors"])
+        self.assertEqual("none", decision["alpha"])
+        decision = ImageOptimizer.get_png_strategy(photo, "PNG")
+        self.assertEqual("lossless", decision["strategy"])
+        self.assertIsNone(decision["sampled_colors"])
+        decision = ImageOptimizer.get_png_strategy(translucent, "WEBP")
+        self.assertEqual("gradient", decision["alpha"])
+        self.assertEqual("lossy", decision["strategy"])
+
+        save_path, _ = get_paths("graphic.png", upload_to=app_settings.upload_to)
+        graphic.save(save_path, "PNG")
+        checksum = get_md5_checksum(save_path)
+        for cache in ("miss", "hit"):
+            report = {}
+            image, path = ImageOptimizer.optimize(
+                save_path,
+                to_webp=False,
+                skip_max_size=0,
+                min_saving=-1,
+                remove_origin=False,
+                report=report,
+                upload_to=app_settings.upload_to,
+            )
+            self.assertEqual(cache, report["cache"])
+            self.assertEqual("palette", report["png_strategy"]["strategy"])
+            self.assertEqual("P", image.mode)
+            ImageOptimizer.close(image)
+        key = optimizer_cache.get_key(
+            "png_strategy",
+            checksum,
+            "PNG",
+            app_settings.image_optimizer.png_max_colors,
+            app_settings.image_optimizer.png_sample_size,
+            app_settings.image_optimizer.quality,
+            app_settings.image_optimizer.compress_level,
+        )
+        self.assertEqual("palette", optimizer_cache.get(key)["decision"]["strategy"])
+
+    def test_animated_image(self):
+        """Test animations are resized frame by frame into an animated WebP."""
+
+        frames = []
+        for i in range(12):
+            frame = Image.new("RGB", (1600, 1000), (i * 20, 40, 90))
+            frame.paste((250, 220, 0), (i * 100, 200, i * 100 + 300, 500))
+            frames.append(frame.convert("P", palette=Image.ADAPTIVE))
+        save_path, _ = get_paths("animation.gif", upload_to=app_settings.upload_to)
+        frames[0].save(
+            save_path, save_all=True, append_images=frames[1:], duration=80, loop=0
+        )
+
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            save_path,
+            min_saving=-1,
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertEqual(12, report["frames"])
+        self.assertTrue(path.endswith(".webp"))
+        with Image.open(os.path.join(settings.MEDIA_ROOT, path)) as output:
+            self.assertTrue(output.is_animated)
+            self.assertEqual(12, output.n_frames)
+            self.assertEqual((1280, 800), output.size)
+            output.seek(5)
+            output.load()
+            self.assertEqual(80, output.info["duration"])
+
+    def test_image_limits(self):
+        """Test pixel and memory limits checked from the header."""
+
+        size = (3000, 2000)
+        image = Image.linear_gradient("L").resize(size).convert("RGB")
+        tiff_path, _ = get_paths("large.tif", upload_to=app_settings.upload_to)
+        png_path, _ = get_paths("large.png", upload_to=app_settings.upload_to)
+        image.save(tiff_path)
+        image.save(png_path)
+
+        with self.assertRaises(OptimizerError):
+            ImageOptimizer.optimize(
+                png_path, max_pixels=1000 * 1000, upload_to=app_settings.upload_to
+            )
+
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            png_path,
+            max_memory=1024 * 1024 * 4,
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertIsNone(path)
+        self.assertEqual("deferred", report["action"])
+        self.assertEqual(3000 * 2000 * 4, report["memory"])
+
+        with Image.open(tiff_path) as source:
+            reduced = ImageOptimizer.decode_reduced(
+                source, 1280, 720, max_memory=1024 * 1024
+            )
+        self.assertEqual((1280, 853), reduced.size)
+        self.assertEqual(reduced.getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(reduced.getpixel((0, 852)), (255, 255, 255))
+        self.assertAlmostEqual(128, reduced.getpixel((0, 426))[0], delta=2)
+
+        report = {}
+        image, path = ImageOptimizer.optimize(
+            tiff_path,
+            max_memory=1024 * 1024 * 4,
+            report=report,
+            upload_to=app_settings.upload_to,
+        )
+        ImageOptimizer.close(image)
+        self.assertEqual("optimized", report["action"])
+        self.assertTrue(path.endswith(".webp"))
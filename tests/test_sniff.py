@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` sniff module.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse_lazy
+
+from django_chunk_file_upload import permissions, sniff
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.constants import TypeChoices
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.typed import File
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    remove_dir,
+)
+from django_chunk_file_upload.views import ChunkedUploadView
+
+
+class TestSniff(TestCase):
+    def test_check(self):
+        """Test magic bytes against extensions."""
+
+        png = b"\x89PNG\r\n\x1a\n" + os.urandom(100)
+        mp4 = b"\x00\x00\x00\x18ftypisom" + os.urandom(100)
+        for extension, data, is_valid in (
+            (".png", png, True),
+            (".PNG", png, True),
+            (".jpg", png, False),
+            (".mp4", mp4, True),
+            (".mov", mp4, True),
+            (".avif", b"\x00\x00\x00\x1cftypavif", True),
+            (".zip", b"PK\x03\x04" + os.urandom(100), True),
+            (".docx", b"PK\x03\x04" + os.urandom(100), True),
+            (".pdf", b"MZ\x90\x00" + os.urandom(100), False),
+            (".mp3", b"\xff\xfa\x90\x00" + bytes(100), True),
+            (".mp3", b"\xff\xe3\x90\x00" + bytes(100), True),
+            (".mp3", b"\xff\xf1\x50\x80" + bytes(100), False),
+            (".csv", b"BMW,1\nAudi,2\n", True),
+            (".csv", "name\ncafé\n".encode("latin-1"), True),
+            (".json", png, False),
+            (".bin", png, True),
+            (".unknown", os.urandom(100), True),
+        ):
+            file_obj = File(_extension=extension)
+            self.assertEqual(
+                is_valid,
+                sniff.check(extension, file_obj.type, data)[0],
+                (extension, data[:16]),
+            )
+        self.assertEqual("image/png", sniff.sniff(png).mimetype)
+        self.assertIsNone(sniff.sniff(b"plain text"))
+
+    def test_extension_types(self):
+        """Test the precomputed extension lookup."""
+
+        self.assertEqual(TypeChoices.IMAGE, File(_extension=".JPG").type)
+        self.assertEqual(TypeChoices.XML, File(_extension=".xml").type)
+        self.assertEqual(TypeChoices.HYPERTEXT, File(_extension=".htm").type)
+        self.assertEqual(TypeChoices.__empty__, File(_extension=".exe").type)
+
+
+class TestSniffUploadView(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        self.path = reverse_lazy("django_chunk_file_upload:uploads")
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def _post(self, name: str, content: bytes, chunk_from: int, chunk_size: int):
+        chunk = content[chunk_from : chunk_from + chunk_size]
+        return self.client.post(
+            self.path,
+            data={"file": SimpleUploadedFile(name, chunk)},
+            headers={
+                "X-File-Name": name,
+                "X-File-Checksum": get_md5_checksum(content),
+                "X-File-Chunk-From": chunk_from,
+                "X-File-Chunk-Size": chunk_size,
+                "X-File-Chunk-To": chunk_from + len(chunk),
+                "X-File-EOF": chunk_from + chunk_size >= len(content),
+                "X-File-Size": len(content),
+                "X-File-MimeType": "image/jpeg",
+            },
+        )
+
+    def test_reject_first_chunk(self):
+        """Test a mislabeled file is rejected on its first chunk."""
+
+        content = os.urandom(1024 * 64)
+        response = self._post("fake.jpg", content, 0, 1024 * 16)
+        self.assertEqual(400, response.status_code)
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertFalse(instance.file)
+
+    def test_lock_content_type(self):
+        """Test the type detected on the first chunk is locked."""
+
+        with open(os.path.join(settings.BASE_DIR, "tests/media/test.jpg"), "rb") as f:
+            content = f.read()
+
+        response = self._post("test.jpg", content, 0, 1024 * 16)
+        self.assertEqual(201, response.status_code, response.content)
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertEqual(
+            {"type": TypeChoices.IMAGE, "mimetype": "image/jpeg"},
+            instance.metadata["content_type"],
+        )
+
+        response = self._post("test.pdf", content, 1024 * 16, 1024 * 16)
+        self.assertEqual(400, response.status_code)
+        response = self._post("test.jpg", content, 1024 * 16, 1024 * 16)
+        self.assertEqual(201, response.status_code)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+django-chunk-file-upload
+------------
+
+Tests for `django-chunk-file-upload` validators module.
+"""
+
+import json
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse_lazy
+
+from django_chunk_file_upload import permissions, processors
+from django_chunk_file_upload.app_settings import app_settings
+from django_chunk_file_upload.models import FileManager
+from django_chunk_file_upload.processors import OWNER_KEY, ProcessorError
+from django_chunk_file_upload.typed import File
+from django_chunk_file_upload.utils import (
+    create_dir,
+    get_md5_checksum,
+    remove_dir,
+)
+from django_chunk_file_upload.validators import (
+    CSVValidator,
+    JSONValidator,
+    XMLValidator,
+)
+from django_chunk_file_upload.views import (
+    ChunkedBundleUploadView,
+    ChunkedUploadView,
+)
+
+
+def validate(validator_class, extension: str, content: bytes, size: int = 7) -> dict:
+    validator = validator_class(File(_extension=extension))
+    for i in range(0, len(content), size):
+        validator.feed(content[i : i + size])
+    return validator.close()
+
+
+class TestValidators(TestCase):
+    def test_csv(self):
+        """Test column counts across chunk boundaries and quoted line breaks."""
+
+        content = b'name;note\n"Audi";"a\nb; c"\r\nBMW;x\n'
+        self.assertEqual(
+            {"rows": 3, "columns": 2, "delimiter": ";"},
+            validate(CSVValidator, ".csv", content),
+        )
+        self.assertEqual(
+            {"rows": 2, "columns": 3, "delimiter": "\t"},
+            validate(CSVValidator, ".tsv", b"a\tb\tc\n1\t2\t3"),
+        )
+        with self.assertRaisesRegex(ProcessorError, "line 3"):
+            validate(CSVValidator, ".csv", b"a,b\n1,2\n1,2,3\n" * 10)
+        with self.assertRaisesRegex(ProcessorError, "unterminated"):
+            validate(CSVValidator, ".csv", b'a,b\n1,"2\n')
+
+    def test_json(self):
+        """Test records of arrays, objects and JSON Lines split anywhere."""
+
+        records = [
+            {"id": i, "name": 'é\\"%s' % i, "tags": [1.5, None]} for i in range(50)
+        ]
+        content = json.dumps(records).encode()
+        for size in (1, 3, 64):
+            self.assertEqual(
+                {"records": 50}, validate(JSONValidator, ".json", content, size)
+            )
+
+        self.assertEqual(
+            {"records": 1}, validate(JSONValidator, ".json", b'{"a": 1, "b": {}}')
+        )
+        self.assertEqual(
+            {"records": 4},
+            validate(JSONValidator, ".json", b'1\n"x"\n{"a": []}\n{"b": 2.5e3}'),
+        )
+        self.assertEqual({"records": 1}, validate(JSONValidator, ".json", b"12345"))
+        with mock.patch.object(JSONValidator, "max_record_size", 8):
+            # Tokenize the records too large to be decoded at once.
+            for size in (1, 3, 64):
+                self.assertEqual(
+                    {"records": 50}, validate(JSONValidator, ".json", content, size)
+                )
+                with self.assertRaises(ProcessorError):
+                    validate(JSONValidator, ".json", b'[{"a": [1, 2,, 3]}]', size)
+        for content in (b"[1, 2,, 3]", b'{"a" 1}', b"[1, 2", b'{1: "a"}', b"[tru]"):
+            with self.assertRaises(ProcessorError, msg=content):
+                validate(JSONValidator, ".json", content, 2)
+
+    def test_xml(self):
+        """Test records counted and malformed markup rejected."""
+
+        content = b"<?xml version='1.0'?><items>%s</items>" % (
+            b"<item><name>a</name></item>" * 20
+        )
+        self.assertEqual(
+            {"elements": 41, "records": 20},
+            validate(XMLValidator, ".xml", content, 5),
+        )
+        with self.assertRaises(ProcessorError):
+            validate(XMLValidator, ".xml", b"<items><item></items>")
+        with self.assertRaisesRegex(ProcessorError, "entity"):
+            validate(
+                XMLValidator,
+                ".xml",
+                b'<!DOCTYPE r [<!ENTITY a "aaaa">]><r>&a;</r>',
+            )
+
+
+class TestValidateUploadView(TestCase):
+    def setUp(self):
+        create_dir(app_settings.upload_to)
+        ChunkedUploadView.permission_classes = (permissions.AllowAny,)
+        self.path = reverse_lazy("django_chunk_file_upload:uploads")
+
+    def tearDown(self):
+        remove_dir(app_settings.upload_to)
+
+    def _post(self, name: str, content: bytes, chunk_from: int, chunk_size: int):
+        chunk = content[chunk_from : chunk_from + chunk_size]
+        return self.client.post(
+            self.path,
+            data={"file": SimpleUploadedFile(name, chunk)},
+            headers={
+                "X-File-Name": name,
+                "X-File-Checksum": get_md5_checksum(content),
+                "X-File-Chunk-From": chunk_from,
+                "X-File-Chunk-Size": chunk_size,
+                "X-File-Chunk-To": chunk_from + len(chunk),
+                "X-File-EOF": chunk_from + chunk_size >= len(content),
+                "X-File-Size": len(content),
+                "X-File-MimeType": "text/csv",
+            },
+        )
+
+    def test_record_counts(self):
+        """Test the counts of a valid upload are stored in its metadata."""
+
+        content = b"id,name\n" + b"".join(b"%d,row %d\n" % (i, i) for i in range(500))
+        for chunk_from in range(0, len(content), 1024):
+            response = self._post("data.csv", content, chunk_from, 1024)
+            self.assertEqual(201, response.status_code, response.content)
+
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertTrue(instance.eof)
+        self.assertEqual(
+            {"rows": 501, "columns": 2, "delimiter": ","},
+            instance.metadata["validation"],
+        )
+
+    def test_reject_bad_chunk(self):
+        """Test a malformed row fails the upload on the chunk containing it."""
+
+        rows = [b"%d,row %d\n" % (i, i) for i in range(500)]
+        rows[150] = b"150,row,150\n"
+        content = b"id,name\n" + b"".join(rows)
+        response = self._post("data.csv", content, 0, 1024)
+        self.assertEqual(201, response.status_code, response.content)
+        response = self._post("data.csv", content, 1024, 1024)
+        self.assertEqual(400, response.status_code)
+        self.assertIn("line 152", response.json()["message"])
+
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertFalse(instance.file)
+
+    def test_deferred_to_final_chunk(self):
+        """Test chunks received by another worker are parsed on completion."""
+
+        rows = [b"%d,row %d\n" % (i, i) for i in range(500)]
+        rows[150] = b"150,row,150\n"
+        content = b"id,name\n" + b"".join(rows)
+        response = self._post("data.csv", content, 0, 1024)
+        self.assertEqual(201, response.status_code, response.content)
+        instance = FileManager.objects.get(checksum=get_md5_checksum(content))
+        self.assertEqual(processors.get_owner(), instance.metadata[OWNER_KEY])
+
+        with mock.patch.object(processors, "get_owner", return_value="other:1"):
+            response = self._post("data.csv", content, 1024, 1024)
+            self.assertEqual(201, response.status_code, response.content)
+            for chunk_from in range(2048, len(content) - 1024, 1024):
+                response = self._post("data.csv", content, chunk_from, 1024)
+                self.assertEqual(201, response.status_code, response.content)
+
+        response = self._post("data.csv", content, chunk_from + 1024, 1024)
+        self.assertEqual(400, response.status_code)
+        self.assertIn("line 152", response.json()["message"])
+
+    def test_bundle(self):
+        """Test bundled files are validated at once."""
+
+        ChunkedBundleUploadView.permission_classes = (permissions.AllowAny,)
+        contents = {"valid.json": b'[{"id": 1}, {"id": 2}]', "invalid.json": b"[1,,2]"}
+        manifest = [
+            {
+                "name": name,
+                "size": len(content),
+                "mimetype": "application/json",
+                "checksum": get_md5_checksum(content),
+            }
+            for name, content in contents.items()
+        ]
+        response = self.client.post(
+            path=reverse_lazy("django_chunk_file_upload:uploads-bundle"),
+            data={
+                "manifest": json.dumps(manifest),
+                "file": [
+                    SimpleUploadedFile(name, content)
+                    for name, content in contents.items()
+                ],
+            },
+        )
+        statuses = [result["status"] for result in response.json()["files"]]
+        self.assertEqual(["created", "invalid"], statuses)
+        instance = FileManager.objects.get(checksum=manifest[0]["checksum"])
+        self.assertEqual({"records": 2}, instance.metadata["validation"])
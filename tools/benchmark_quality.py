@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Benchmark the quality search of the image optimizer: CPU time of the search
+and of the final encode against the bytes saved, per quality mode.
+
+Usage::
+
+    python tools/benchmark_quality.py photo1.jpg photo2.jpg --format WEBP
+"""
+
+import argparse
+import os
+import sys
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+settings.configure(
+    INSTALLED_APPS=["django.contrib.contenttypes", "django.contrib.auth"],
+)
+django.setup()
+
+from PIL import Image  # noqa: E402
+
+from django_chunk_file_upload.optimize import ImageOptimizer  # noqa: E402
+
+
+def cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system
+
+
+def run(image, fm: str, mode: str) -> tuple[int, int, float, dict]:
+    started = cpu_time()
+    buf, quality, search = ImageOptimizer.encode_quality(image, fm, mode)
+    return quality, buf.tell(), cpu_time() - started, search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+", help="Image files.")
+    parser.add_argument("--format", default="JPEG", choices=("JPEG", "WEBP"))
+    args = parser.parse_args()
+
+    totals = {}
+    for fp in args.images:
+        with Image.open(fp) as image:
+            image = image.convert("RGB")
+        for mode in ("fixed", "size", "similarity"):
+            quality, size, cpu, search = run(image, args.format, mode)
+            total = totals.setdefault(mode, [0, 0.0])
+            total[0] += size
+            total[1] += cpu
+            print(
+                "%-30s %-10s q: %3s  size: %8s  cpu: %6.3fs  trials: %s"
+                % (
+                    os.path.basename(fp)[:30],
+                    mode,
+                    quality,
+                    size,
+                    cpu,
+                    search.get("trials", 1),
+                )
+            )
+
+    fixed_size, fixed_cpu = totals["fixed"]
+    for mode, (size, cpu) in totals.items():
+        print(
+            "%-10s bytes: %10s  saved: %6.1f%%  cpu: %6.3fs  cpu x%.1f"
+            % (
+                mode,
+                size,
+                100 * (1 - size / max(fixed_size, 1)),
+                cpu,
+                cpu / max(fixed_cpu, 1e-6),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark the chunk write path: buffered copy through Python against the
+kernel-side copy (copy_file_range/sendfile) used for temporary uploads.
+
+Usage::
+
+    python tools/benchmark_write.py --size 1024 --chunk-size 2
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django_chunk_file_upload.utils import copy_file_range  # noqa: E402
+
+
+def buffered_copy(src: str, dst: str, size: int, buffer_size: int) -> None:
+    with open(src, "rb") as fi, open(dst, "ab") as fo:
+        while chunk := fi.read(buffer_size):
+            fo.write(chunk)
+
+
+def kernel_copy(src: str, dst: str, size: int, buffer_size: int) -> None:
+    # O_APPEND is not supported by copy_file_range/sendfile, see BaseFile.write.
+    fd = os.open(dst, os.O_WRONLY | os.O_CREAT, 0o666)
+    with open(src, "rb") as fi, open(fd, "wb") as fo:
+        offset = os.fstat(fo.fileno()).st_size
+        copied = copy_file_range(fi.fileno(), fo.fileno(), size, offset)
+        if copied < size:
+            raise RuntimeError("Kernel copy is not available on this platform.")
+
+
+def run(func, chunks: list, dst: str, chunk_size: int) -> tuple[float, float]:
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    started, cpu = time.perf_counter(), os.times()
+    for chunk in chunks:
+        func(chunk, dst, chunk_size, 1024 * 64)
+    ended = os.times()
+    return (
+        time.perf_counter() - started,
+        (ended.user - cpu.user) + (ended.system - cpu.system),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1024, help="Total size in MB.")
+    parser.add_argument("--chunk-size", type=int, default=2, help="Chunk size in MB.")
+    args = parser.parse_args()
+
+    chunk_size = args.chunk_size * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        chunk = os.path.join(tmp, "chunk")
+        with open(chunk, "wb") as f:
+            f.write(os.urandom(chunk_size))
+
+        chunks = [chunk] * max(args.size // args.chunk_size, 1)
+        gb = len(chunks) * chunk_size / 1024**3
+        dst = os.path.join(tmp, "output")
+        print("Copy %.2f GB in %s MB chunks" % (gb, args.chunk_size))
+        for name, func in (("buffered", buffered_copy), ("kernel", kernel_copy)):
+            wall, cpu = run(func, chunks, dst, chunk_size)
+            print(
+                "%-10s wall: %6.3fs  cpu: %6.3fs  cpu/GB: %6.3fs"
+                % (name, wall, cpu, cpu / gb)
+            )
+
+
+if __name__ == "__main__":
+    main()